@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Markdown to PDF converter
+
+リポジトリのルートから python -m benchmarks.<name> で実行する。
+"""
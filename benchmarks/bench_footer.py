@@ -0,0 +1,91 @@
+"""
+Footer stamping benchmark (pages/second and peak memory)
+
+従来の実装は PyPDF2 の PdfWriter が書き出すまですべてのページを保持するため、ピークメモリが
+ページ数に比例する。現在の実装はページごとに書き出して解放するため、ページの内容の分は増えない
+（残るのは入力の相互参照表とページごとの番号・位置で、1ページあたり1KiB程度）。
+
+使い方:
+    python -m benchmarks.bench_footer --pages 100 1000 3000
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+from PyPDF2 import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from config.config import PDF_CONFIG
+from core.pdf import add_footer_to_pdf
+
+
+def make_pdf(path, pages):
+    """指定ページ数のPDFを作成"""
+    can = canvas.Canvas(str(path), pagesize=(648, 972))
+    for page_num in range(pages):
+        can.drawString(72, 900, f"Benchmark page {page_num + 1}")
+        can.showPage()
+    can.save()
+
+
+def legacy_add_footer_to_pdf(input_pdf_path, output_pdf_path, footer_text=None, start_page_number=1):
+    """比較用：ページごとにReportLabのキャンバスを作成・解析する従来の実装"""
+    reader = PdfReader(input_pdf_path)
+    writer = PdfWriter()
+    if footer_text is None:
+        footer_text = PDF_CONFIG['CREDIT_STRING']
+    total_pages = len(reader.pages)
+
+    for page_num, page in enumerate(reader.pages):
+        packet = BytesIO()
+        can = canvas.Canvas(packet, pagesize=letter)
+        page_width = float(page.mediabox.width)
+        full_footer = f"{footer_text} - Page {start_page_number + page_num} of {total_pages}"
+        can.setFont(PDF_CONFIG['FOOTER_FONT'], PDF_CONFIG['FOOTER_FONT_SIZE'])
+        text_width = can.stringWidth(full_footer, PDF_CONFIG['FOOTER_FONT'], PDF_CONFIG['FOOTER_FONT_SIZE'])
+        can.drawString((page_width - text_width) / 2, PDF_CONFIG['FOOTER_MARGIN'] - 8, full_footer)
+        can.save()
+        packet.seek(0)
+        page.merge_page(PdfReader(packet).pages[0])
+        writer.add_page(page)
+
+    with open(output_pdf_path, 'wb') as output_file:
+        writer.write(output_file)
+    return True
+
+
+def measure(func, input_path, output_path):
+    """実行時間（秒）とピークメモリ（バイト）を計測"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(input_path, output_path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark footer stamping (before/after)')
+    parser.add_argument('--pages', type=int, nargs='+', default=[100, 1000], help='Page counts to benchmark')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        print(f"{'pages':>6} {'impl':>8} {'seconds':>9} {'pages/s':>9} {'peak MiB':>9} {'KiB/page':>9}")
+        for pages in args.pages:
+            input_path = temp_dir / f'input_{pages}.pdf'
+            make_pdf(input_path, pages)
+            for name, func in (('legacy', legacy_add_footer_to_pdf), ('current', add_footer_to_pdf)):
+                elapsed, peak = measure(func, input_path, temp_dir / f'{name}_{pages}.pdf')
+                print(f"{pages:>6} {name:>8} {elapsed:>9.2f} {pages / elapsed:>9.0f} {peak / 2**20:>9.1f} "
+                      f"{peak / 2**10 / pages:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Import-time benchmark and regression guard
+
+import core と main.py --help を別プロセスで実行して時間を計測し、
+重い依存（selenium, PyPDF2 など）が読み込まれていないこと、
+カレントディレクトリにファイル（ログなど）が作られていないことを確認する。
+問題があれば終了コード 1 で終了するため、CIのチェックとして使える。
+
+使い方:
+    python -m benchmarks.bench_import --repeat 10 --max-ms 150
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# import 時に読み込まれてはならないモジュール
+HEAVY_MODULES = ('selenium', 'PyPDF2', 'reportlab', 'pygments', 'markdown_it', 'mdit_py_plugins', 'jinja2', 'PySide6', 'PIL')
+
+# 読み込まれたモジュールのうち HEAVY_MODULES に含まれるものを出力するスクリプト
+_CHECK_SCRIPT = """
+import json, sys
+sys.path.insert(0, {root!r})
+{statement}
+print(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy!r}))))
+"""
+
+# 計測するコマンド（名前, 引数）
+CASES = (
+    ('import core', ['-c', 'import core']),
+    ('import core names', ['-c', 'from core import process_directory, process_file, create_driver, get_preset_config']),
+    ('main.py --help', [str(ROOT_DIR / 'main.py'), '--help']),
+)
+
+
+def run_timed(args, cwd):
+    """Pythonを起動して終了までの時間（秒）を返す"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, check=True, stdout=subprocess.DEVNULL, env=_env())
+    return time.perf_counter() - start
+
+
+def loaded_heavy_modules(statement, cwd):
+    """statement を実行した後に読み込まれている重いモジュール"""
+    script = _CHECK_SCRIPT.format(root=str(ROOT_DIR), statement=statement, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', script], cwd=cwd, check=True,
+                            capture_output=True, text=True, env=_env()).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(ROOT_DIR), env.get('PYTHONPATH')]))
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark import time and guard against import-time regressions')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case (median is reported)')
+    parser.add_argument('--max-ms', type=float, help='Fail if a case is slower than this (median, in ms)')
+    parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    failures = []
+    results = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        baseline = statistics.median(run_timed(['-c', 'pass'], cwd) for _ in range(args.repeat))
+        print(f"{'case':>20} {'median ms':>10} {'over python':>12}")
+        print(f"{'python -c pass':>20} {baseline * 1000:>10.1f} {'':>12}")
+
+        for name, case_args in CASES:
+            median = statistics.median(run_timed(case_args, cwd) for _ in range(args.repeat))
+            results[name] = {'median_ms': median * 1000, 'over_python_ms': (median - baseline) * 1000}
+            print(f"{name:>20} {median * 1000:>10.1f} {(median - baseline) * 1000:>12.1f}")
+            if args.max_ms is not None and median * 1000 > args.max_ms:
+                failures.append(f"{name}: {median * 1000:.1f} ms > {args.max_ms:.1f} ms")
+
+        for name, statement in (('import core', 'import core'),
+                                ('main imports', 'import main')):
+            heavy = loaded_heavy_modules(statement, cwd)
+            results.setdefault(name, {})['heavy_modules'] = heavy
+            if heavy:
+                failures.append(f"{name} loads heavy modules: {', '.join(heavy)}")
+
+        created = sorted(os.listdir(cwd))
+        if created:
+            failures.append(f"files created in the working directory at import: {', '.join(created)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'baseline_ms': baseline * 1000, 'results': results, 'failures': failures}, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Stage-level benchmark of the markdown_to_html -> html_to_pdf -> merge pipeline
+
+合成コーパスを作成し、段階ごとの処理時間を計測してJSONで出力する。
+--driver stub（既定）はChromeを使わないスタブで、CPU側の段階（parse, highlight,
+template, write, stamp, merge）を計測する。load と print はスタブの処理時間になる。
+--driver chrome はローカルのChrome/Chromiumで全段階を計測する。
+
+使い方:
+    python -m benchmarks.bench_pipeline --corpus prose code --docs 10 50 -o result.json
+    python -m benchmarks.bench_pipeline --driver chrome --corpus mixed --docs 5
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from PyPDF2 import PdfReader
+
+from config.config import PDF_CONFIG
+from core.assets import asset_cache
+from core.converter import _highlight_cached, get_markdown_parser, highlight_code
+from core.pdf import PDF_PRINT_OPTIONS, PdfBookWriter, _load_html, _wait_until_ready, _write_print_result
+from benchmarks.corpus import PROFILES, make_corpus
+from benchmarks.stub_driver import StubDriver
+
+STAGES = ('parse', 'highlight', 'template', 'load', 'print', 'write', 'stamp', 'merge')
+
+# ローカルのChrome/Chromiumの実行ファイル名
+CHROME_BINARIES = ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome')
+
+
+def find_chrome():
+    """ローカルのChrome/Chromiumのパス（見つからない場合は None）"""
+    for name in CHROME_BINARIES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def create_benchmark_driver(kind):
+    """計測に使うドライバーを作成"""
+    if kind == 'stub':
+        return StubDriver()
+    if not find_chrome():
+        raise RuntimeError("Chrome/Chromium が見つかりません（--driver stub を使用してください）")
+    from core.driver import create_driver
+    return create_driver(headless=True)
+
+
+class StageTimer:
+    """段階ごとの処理時間を記録"""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def measure(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples[stage].append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[stage] = {
+                'count': len(samples),
+                'total': sum(samples),
+                'mean': sum(samples) / len(samples) if samples else 0.0,
+                'p50': percentile(ordered, 0.50),
+                'p95': percentile(ordered, 0.95),
+            }
+        return result
+
+
+def percentile(ordered, q):
+    """ソート済みのリストのパーセンタイル（最近傍法）"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def convert_document(timer, driver, md_file, pdf_path, options):
+    """1つの文書を段階ごとに計測しながら変換"""
+    md_content = md_file.read_text(encoding='utf-8')
+    md = get_markdown_parser()
+    env = {'highlight_classes': options['highlight_classes']}
+
+    # コードブロックのハイライトを先に行い、parse にはキャッシュ済みの結果を使わせる
+    tokens = md.parse(md_content, env)
+    fences = [token for token in tokens if token.type in ('fence', 'code_block')]
+
+    def highlight_all():
+        for token in fences:
+            info = token.info.strip() if token.info else ""
+            highlight_code(token.content, info.split()[0] if info else None, classes=options['highlight_classes'])
+
+    timer.measure('highlight', highlight_all)
+    body = timer.measure('parse', lambda: md.renderer.render(md.parse(md_content, env), md.options, env))
+
+    def apply_template():
+        bundle = asset_cache.get_bundle(options['css_files'], options['template_file'],
+                                        options['compact'], options['font_size'], options['highlight_classes'])
+        return bundle.render(body)
+
+    html_content = timer.measure('template', apply_template)
+
+    def load():
+        _load_html(driver, html_content, str(md_file.parent))
+        _wait_until_ready(driver, PDF_CONFIG.get('READY_TIMEOUT', 10))
+
+    timer.measure('load', load)
+    result = timer.measure('print', driver.execute_cdp_cmd, 'Page.printToPDF', dict(PDF_PRINT_OPTIONS))
+    return timer.measure('write', _write_print_result, driver, result, pdf_path)
+
+
+def run_corpus(driver, name, profile, docs, work_dir, options, repeat):
+    """1つのコーパスを repeat 回変換して計測結果を返す"""
+    corpus_dir = work_dir / f'{name}_{docs}'
+    md_files = make_corpus(corpus_dir / 'src', docs=docs, **profile)
+    out_dir = corpus_dir / 'out'
+    out_dir.mkdir(exist_ok=True)
+
+    timer = StageTimer()
+    wall_times = []
+    for _ in range(repeat):
+        # 毎回キャッシュが空の状態から計測する
+        asset_cache.clear()
+        _highlight_cached.cache_clear()
+
+        start = time.perf_counter()
+        pdf_files = []
+        pdf_bytes = 0
+        for md_file in md_files:
+            pdf_path = out_dir / (md_file.stem + '.pdf')
+            pdf_bytes += convert_document(timer, driver, md_file, pdf_path, options)
+            pdf_files.append(pdf_path)
+
+        book = PdfBookWriter(out_dir / 'merged.pdf')
+        timer.measure('merge', lambda: [book.append(pdf_file) for pdf_file in pdf_files])
+        # ページは追加した時点で書き出され、フッターは総ページ数が決まる close() で書き込まれる
+        timer.measure('stamp', book.close)
+        wall_times.append(time.perf_counter() - start)
+
+    return {
+        'corpus': name,
+        'docs': docs,
+        'profile': profile,
+        'markdown_bytes': sum(md_file.stat().st_size for md_file in md_files),
+        'pdf_bytes': pdf_bytes,
+        'merged_pages': len(PdfReader(str(out_dir / 'merged.pdf')).pages),
+        'wall_seconds': wall_times,
+        'stages': timer.summary(),
+    }
+
+
+def print_table(results):
+    """結果を表形式で表示"""
+    print(f"{'corpus':>8} {'docs':>5} " + ' '.join(f"{stage:>9}" for stage in STAGES) + f" {'wall':>8}")
+    for result in results:
+        stages = result['stages']
+        wall = min(result['wall_seconds'])
+        print(f"{result['corpus']:>8} {result['docs']:>5} "
+              + ' '.join(f"{stages[stage]['total'] / len(result['wall_seconds']) * 1000:>7.1f}ms" for stage in STAGES)
+              + f" {wall:>7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark each stage of the conversion pipeline')
+    parser.add_argument('--corpus', nargs='+', choices=sorted(PROFILES), default=sorted(PROFILES), help='Corpus profiles to benchmark')
+    parser.add_argument('--docs', type=int, nargs='+', default=[10], help='Number of documents per corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per corpus')
+    parser.add_argument('--driver', choices=['stub', 'chrome'], default='stub', help='Stub driver (no Chrome) or local Chrome')
+    parser.add_argument('--highlight-classes', action='store_true', help='Highlight code with CSS classes')
+    parser.add_argument('-o', '--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    options = {
+        'css_files': None,
+        'template_file': None,
+        'compact': False,
+        'font_size': 16,
+        'highlight_classes': args.highlight_classes,
+    }
+
+    try:
+        driver = create_benchmark_driver(args.driver)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name in args.corpus:
+                for docs in args.docs:
+                    results.append(run_corpus(driver, name, PROFILES[name], docs, Path(work_dir), options, max(1, args.repeat)))
+    finally:
+        driver.quit()
+
+    print_table(results)
+
+    if args.output:
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'driver': args.driver,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'options': options,
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Synthetic Markdown corpora for benchmarks
+"""
+
+import random
+import struct
+import zlib
+from pathlib import Path
+
+# 名前付きのコーパスの種類（1文書あたりの節数・コードブロック数・表の行数・画像数）
+PROFILES = {
+    'prose': {'sections': 12, 'code_blocks': 0, 'table_rows': 0, 'images': 0},
+    'code': {'sections': 6, 'code_blocks': 24, 'table_rows': 0, 'images': 0},
+    'tables': {'sections': 6, 'code_blocks': 0, 'table_rows': 200, 'images': 0},
+    'images': {'sections': 6, 'code_blocks': 0, 'table_rows': 0, 'images': 12},
+    'mixed': {'sections': 8, 'code_blocks': 8, 'table_rows': 40, 'images': 4},
+}
+
+_WORDS = (
+    "markdown pdf chrome render print page footer merge stream layout font table image "
+    "code highlight template style section paragraph document browser driver worker"
+).split()
+
+_CODE_SAMPLES = {
+    'python': "def fib(n):\n    a, b = 0, 1\n    for _ in range(n):\n        a, b = b, a + b\n    return a\n",
+    'javascript': "function fib(n) {\n  let [a, b] = [0, 1];\n  for (let i = 0; i < n; i++) [a, b] = [b, a + b];\n  return a;\n}\n",
+    'bash': "for f in *.md; do\n  python main.py \"$f\"\ndone\n",
+    'json': '{\n  "name": "md2pdf",\n  "pages": [1, 2, 3],\n  "compact": false\n}\n',
+}
+
+
+def make_png(width, height, seed):
+    """単色のPNG画像のバイト列を作成"""
+    color = bytes(((seed * 67) % 256, (seed * 131) % 256, (seed * 199) % 256))
+    raw = b''.join(b'\x00' + color * width for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw))
+            + chunk(b'IEND', b''))
+
+
+def make_document(rng, doc_num, sections, code_blocks, table_rows, images):
+    """1つのMarkdown文書を作成"""
+    def sentence():
+        words = rng.choices(_WORDS, k=rng.randint(8, 16))
+        return ' '.join(words).capitalize() + '.'
+
+    lines = [f"# Document {doc_num + 1}", ""]
+    languages = sorted(_CODE_SAMPLES)
+    for section in range(sections):
+        lines += [f"## Section {section + 1}", "", ' '.join(sentence() for _ in range(6)), ""]
+        lines += [f"- {sentence()}" for _ in range(3)] + [""]
+
+        for block in range(code_blocks * (section + 1) // sections - code_blocks * section // sections):
+            lang = languages[(section + block) % len(languages)]
+            # 同じコードが繰り返し出現する場合と、毎回異なる場合を混ぜる
+            suffix = f"# block {doc_num}-{section}-{block}\n" if block % 2 else ""
+            lines += [f"```{lang}", _CODE_SAMPLES[lang] + suffix.rstrip('\n'), "```", ""]
+
+        rows = table_rows * (section + 1) // sections - table_rows * section // sections
+        if rows:
+            lines += ["| ID | Name | Value | Note |", "|---:|------|------:|------|"]
+            lines += [f"| {row} | {rng.choice(_WORDS)} | {rng.randint(0, 99999)} | {sentence()} |" for row in range(rows)]
+            lines.append("")
+
+        for image in range(images * (section + 1) // sections - images * section // sections):
+            lines += [f"![figure {section}-{image}](images/img_{doc_num}_{section}_{image}.png)", ""]
+
+    return '\n'.join(lines)
+
+
+def make_corpus(directory, docs=10, sections=8, code_blocks=0, table_rows=0, images=0, image_size=256, seed=0):
+    """ディレクトリに合成コーパス（Markdownと画像）を作成し、Markdownファイルのリストを返す"""
+    directory = Path(directory)
+    image_dir = directory / 'images'
+    image_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+
+    md_files = []
+    for doc_num in range(docs):
+        md_content = make_document(rng, doc_num, sections, code_blocks, table_rows, images)
+        for section in range(sections):
+            for image in range(images * (section + 1) // sections - images * section // sections):
+                png = make_png(image_size, image_size, doc_num + section + image)
+                (image_dir / f'img_{doc_num}_{section}_{image}.png').write_bytes(png)
+
+        md_file = directory / f'doc_{doc_num:04d}.md'
+        md_file.write_text(md_content, encoding='utf-8')
+        md_files.append(md_file)
+    return md_files
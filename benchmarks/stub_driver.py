@@ -0,0 +1,79 @@
+"""
+Stub WebDriver for benchmarks without Chrome
+
+get と execute_cdp_cmd だけを実装し、Page.printToPDF では
+HTMLの長さに応じたページ数のPDFを返す。ブラウザの処理時間は含まれないため、
+CPU側の処理（Markdown変換・書き込み・フッター・マージ）の計測に使う。
+"""
+
+import base64
+import io
+from functools import lru_cache
+
+from reportlab.pdfgen import canvas
+
+# 1ページあたりのHTMLの文字数の目安
+CHARS_PER_PAGE = 6000
+
+
+@lru_cache(maxsize=64)
+def make_pdf_bytes(pages):
+    """指定ページ数の9x13.5インチのPDFを作成"""
+    buffer = io.BytesIO()
+    can = canvas.Canvas(buffer, pagesize=(648, 972))
+    for page_num in range(pages):
+        for line in range(40):
+            can.drawString(72, 900 - line * 20, f"Stub page {page_num + 1} line {line + 1}")
+        can.showPage()
+    can.save()
+    return buffer.getvalue()
+
+
+class StubDriver:
+    """Seleniumの WebDriver の代わりに使うスタブ"""
+
+    def __init__(self, chars_per_page=CHARS_PER_PAGE):
+        self.chars_per_page = chars_per_page
+        self.current_url = 'about:blank'
+        self._html = ''
+        self._streams = {}
+        self._next_handle = 0
+
+    def get(self, url):
+        self.current_url = url
+        self._html = ''
+
+    def implicitly_wait(self, seconds):
+        pass
+
+    def quit(self):
+        self._streams.clear()
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == 'Page.getFrameTree':
+            return {'frameTree': {'frame': {'id': 'stub-frame', 'url': self.current_url}}}
+        if cmd == 'Page.setDocumentContent':
+            self._html = params['html']
+            return {}
+        if cmd == 'Runtime.evaluate':
+            return {'result': {'type': 'boolean', 'value': True}}
+        if cmd == 'Page.printToPDF':
+            return self._print(params)
+        if cmd == 'IO.read':
+            data = self._streams[params['handle']].read(params.get('size', 1024 * 1024))
+            return {'data': base64.b64encode(data).decode('ascii'), 'base64Encoded': True, 'eof': not data}
+        if cmd == 'IO.close':
+            self._streams.pop(params['handle'], None)
+            return {}
+        return {}
+
+    def _print(self, params):
+        pages = max(1, -(-len(self._html) // self.chars_per_page))
+        data = make_pdf_bytes(pages)
+        if params.get('transferMode') != 'ReturnAsStream':
+            return {'data': base64.b64encode(data).decode('ascii')}
+
+        handle = str(self._next_handle)
+        self._next_handle += 1
+        self._streams[handle] = io.BytesIO(data)
+        return {'stream': handle}
@@ -0,0 +1,93 @@
+"""設定ファイルのサンプル
+このファイルを config.py にコピーして使用してください。
+"""
+
+import os
+from pathlib import Path
+
+# プロジェクトのルートディレクトリ
+ROOT_DIR = Path(__file__).parent.parent
+
+# テンプレートディレクトリ
+TEMPLATE_DIR = ROOT_DIR / 'templates'
+
+# CSSディレクトリ
+CSS_DIR = ROOT_DIR / 'css'
+
+# PDF設定
+PDF_CONFIG = {
+    'CREDIT_STRING': "Generated by Chrome PDF Extension",  # クレジット文字列
+    'FOOTER_FONT_SIZE': 8,  # フッターのフォントサイズ
+    'FOOTER_MARGIN': 30,    # フッターの下端からのマージン
+    'FOOTER_FONT': "Helvetica",  # フッターのフォント
+    'READY_TIMEOUT': 10     # 画像・フォントの読み込み完了を待つ最大秒数
+}
+
+# ログ設定
+LOG_CONFIG = {
+    'LEVEL': 'INFO',                # ログレベル（DEBUG, INFO, WARNING, ERROR）
+    'FILE': 'pdf_converter.log',    # ログファイル
+    'MAX_BYTES': 10 * 1024 * 1024,  # このサイズを超えたらローテーション
+    'BACKUP_COUNT': 3               # 残す古いログファイルの数
+}
+
+# 画像最適化の設定（--image-dpi 使用時、Pillow が必要）
+IMAGE_CONFIG = {
+    'CACHE_DIR': None,              # 最適化した画像のキャッシュ（None の場合は ~/.cache/md2pdf/images）
+    'JPEG_QUALITY': 85,             # JPEG・WebP の品質
+    'CONTENT_WIDTH_INCHES': None    # 本文の幅（None の場合は用紙幅から左右の余白を引いた値）
+}
+
+# Markdown拡張機能の設定
+MARKDOWN_EXTENSIONS = [
+    'toc',
+    'tables', 
+    'fenced_code',
+    'attr_list'
+]
+
+# シンタックスハイライトの設定
+CODEHILITE_CONFIG = {
+    'use_pygments': True,
+    'noclasses': True,
+    'pygments_style': 'default',
+    'linenums': False,
+    'guess_lang': True
+}
+
+def load_template_file(file_path):
+    """テンプレートファイルを読み込む"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Warning: Template file not found: {file_path}")
+        return ""
+
+def load_css_file(file_path):
+    """CSSファイルを読み込む"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"Warning: CSS file not found: {file_path}")
+        return ""
+
+# デフォルトのテンプレートファイルパス
+DEFAULT_TEMPLATE_PATH = TEMPLATE_DIR / 'default.html'
+
+# デフォルトのCSSファイルパス
+DEFAULT_CSS_PATH = CSS_DIR / 'default.css'
+
+# デフォルトのテンプレートとCSS（最初に参照されたときに読み込む）
+_LAZY_DEFAULTS = {
+    'DEFAULT_HTML_TEMPLATE': (load_template_file, DEFAULT_TEMPLATE_PATH),
+    'DEFAULT_CSS': (load_css_file, DEFAULT_CSS_PATH),
+}
+
+def __getattr__(name):
+    if name not in _LAZY_DEFAULTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    loader, path = _LAZY_DEFAULTS[name]
+    value = globals()[name] = loader(path)
+    return value
@@ -19,7 +19,30 @@ PDF_CONFIG = {
     'CREDIT_STRING': "Generated by Chrome PDF Extension",  # クレジット文字列
     'FOOTER_FONT_SIZE': 8,  # フッターのフォントサイズ
     'FOOTER_MARGIN': 30,    # フッターの下端からのマージン
-    'FOOTER_FONT': "Helvetica"  # フッターのフォント
+    'FOOTER_FONT': "Helvetica",  # フッターのフォント
+    'READY_TIMEOUT': 10     # 画像・フォントの読み込み完了を待つ最大秒数
+}
+
+# ログ設定
+LOG_CONFIG = {
+    'LEVEL': 'INFO',                # ログレベル（DEBUG, INFO, WARNING, ERROR）
+    'FILE': 'pdf_converter.log',    # ログファイル
+    'MAX_BYTES': 10 * 1024 * 1024,  # このサイズを超えたらローテーション
+    'BACKUP_COUNT': 3               # 残す古いログファイルの数
+}
+
+# 画像最適化の設定（--image-dpi 使用時、Pillow が必要）
+IMAGE_CONFIG = {
+    'CACHE_DIR': None,              # 最適化した画像のキャッシュ（None の場合は ~/.cache/md2pdf/images）
+    'JPEG_QUALITY': 85,             # JPEG・WebP の品質
+    'CONTENT_WIDTH_INCHES': None    # 本文の幅（None の場合は用紙幅から左右の余白を引いた値）
+}
+
+# レンダーキャッシュの設定（--render-cache 使用時、ENABLED を True にすると常に使用）
+RENDER_CACHE_CONFIG = {
+    'ENABLED': False,               # 同じHTML・アセット・印刷オプションのPDFをキャッシュから再利用する
+    'CACHE_DIR': None,              # キャッシュディレクトリ（None の場合は ~/.cache/md2pdf/pdf、CIなどと共有可能）
+    'MAX_SIZE_MB': 1024             # 合計サイズの上限（超えると最後に使われたのが古いものから削除）
 }
 
 # Markdown拡張機能の設定
@@ -63,8 +86,15 @@ DEFAULT_TEMPLATE_PATH = TEMPLATE_DIR / 'default.html'
 # デフォルトのCSSファイルパス
 DEFAULT_CSS_PATH = CSS_DIR / 'default.css'
 
-# デフォルトのテンプレート
-DEFAULT_HTML_TEMPLATE = load_template_file(DEFAULT_TEMPLATE_PATH)
+# デフォルトのテンプレートとCSS（最初に参照されたときに読み込む）
+_LAZY_DEFAULTS = {
+    'DEFAULT_HTML_TEMPLATE': (load_template_file, DEFAULT_TEMPLATE_PATH),
+    'DEFAULT_CSS': (load_css_file, DEFAULT_CSS_PATH),
+}
 
-# デフォルトのCSS
-DEFAULT_CSS = load_css_file(DEFAULT_CSS_PATH) 
\ No newline at end of file
+def __getattr__(name):
+    if name not in _LAZY_DEFAULTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    loader, path = _LAZY_DEFAULTS[name]
+    value = globals()[name] = loader(path)
+    return value
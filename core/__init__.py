@@ -1,22 +1,46 @@
 """
 Core package for Markdown to PDF converter
+
+各機能は最初に参照されたときにサブモジュールから読み込まれる
+（selenium・PyPDF2・reportlab などの重い依存は必要になるまで読み込まない）。
 """
 
-from .converter import markdown_to_html, load_template_file
-from .driver import create_driver
-from .pdf import html_to_pdf, add_footer_to_pdf, merge_pdfs
-from .presets import PRESETS, get_preset_config
-from .processor import process_file, process_directory
-
-__all__ = [
-    'markdown_to_html',
-    'load_template_file',
-    'create_driver',
-    'html_to_pdf',
-    'add_footer_to_pdf',
-    'merge_pdfs',
-    'PRESETS',
-    'get_preset_config',
-    'process_file',
-    'process_directory',
-]
\ No newline at end of file
+import importlib
+
+# 公開名と定義しているサブモジュール
+_EXPORTS = {
+    'convert_markdown': 'api',
+    'convert_many': 'api',
+    'ConversionJob': 'api',
+    'markdown_to_html': 'converter',
+    'load_template_file': 'converter',
+    'create_driver': 'driver',
+    'quit_driver': 'driver',
+    'BatchMetrics': 'metrics',
+    'ConversionResult': 'metrics',
+    'html_to_pdf': 'pdf',
+    'add_footer_to_pdf': 'pdf',
+    'merge_pdfs': 'pdf',
+    'DriverPool': 'pool',
+    'PRESETS': 'presets',
+    'get_preset_config': 'presets',
+    'prebuild_presets': 'presets',
+    'asset_cache': 'assets',
+    'process_file': 'processor',
+    'process_directory': 'processor',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,219 @@
+"""
+In-memory conversion API: Markdown text in, PDF bytes out
+
+ファイルを経由せずに、Markdownの文字列からPDFのバイト列（またはファイルのようなオブジェクト）を作る。
+Webサービスなどに組み込む場合は DriverPool を渡して、起動済みのWebDriverを使い回す。
+"""
+
+import io
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .converter import markdown_to_html
+from .logger import logger
+from .pdf import html_to_pdf
+from .pool import DriverPool
+from .presets import PRESETS, get_preset_config
+
+# convert_many で items の終わりを表す値
+_END = object()
+
+
+class ConversionJob:
+    """Markdownの文字列とオプションをまとめた変換ジョブ
+
+    run() の後は pdf_data（PDFのバイト列）または error（エラーメッセージ）が設定され、done がセットされる。
+    tag には呼び出し側で結果を対応付けるための任意の値を入れられる。
+    cancel() されたジョブは、まだ実行していなければ実行せずに破棄される。
+    """
+
+    def __init__(self, md_content, base_dir=None, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, tag=None):
+        self.md_content = md_content
+        self.base_dir = base_dir
+        self.css_files = css_files
+        self.template_file = template_file
+        self.compact = compact
+        self.font_size = font_size
+        self.highlight_classes = highlight_classes
+        self.image_dpi = image_dpi
+        self.tag = tag
+        self.pdf_data = None
+        self.error = None
+        self.canceled = False
+        self.done = threading.Event()
+
+    @classmethod
+    def from_request(cls, payload):
+        """辞書（変換サーバーへのリクエストのJSONなど）からジョブを作成"""
+        if not isinstance(payload, dict) or not isinstance(payload.get('markdown'), str):
+            raise ValueError("'markdown' is required")
+
+        css_files = payload.get('css_files')
+        template_file = payload.get('template_file')
+        if payload.get('preset'):
+            if payload['preset'] not in PRESETS:
+                raise ValueError(f"Unknown preset: {payload['preset']}")
+            preset_config = get_preset_config(payload['preset'])
+            if not css_files:
+                css_files = preset_config['css_files']
+            template_file = preset_config['template_file']
+
+        return cls(
+            payload['markdown'],
+            base_dir=payload.get('base_dir'),
+            css_files=css_files,
+            template_file=template_file,
+            compact=bool(payload.get('compact', False)),
+            font_size=int(payload.get('font_size', 16)),
+            highlight_classes=bool(payload.get('highlight_classes', False)),
+            image_dpi=int(payload['image_dpi']) if payload.get('image_dpi') else None,
+        )
+
+    def __bool__(self):
+        return self.pdf_data is not None
+
+    def cancel(self):
+        """結果が不要になったことを記録する（実行中・実行済みのジョブには影響しない）"""
+        self.canceled = True
+
+    def discard(self):
+        """実行せずに中止されたジョブとして完了にする"""
+        self.error = "中止されました"
+        self.done.set()
+
+    def write_pdf(self, driver, output):
+        """driver で印刷して output（バイナリで書き込めるファイルのようなオブジェクト）に書き込む
+
+        失敗した場合は RuntimeError を送出する。
+        """
+        html_content = markdown_to_html(self.md_content, css_files=self.css_files,
+                                         template_file=self.template_file,
+                                         compact=self.compact, font_size=self.font_size,
+                                         highlight_classes=self.highlight_classes,
+                                         image_dpi=self.image_dpi, base_dir=self.base_dir)
+        if not html_to_pdf(driver, html_content, output, source_dir=self.base_dir):
+            raise RuntimeError("PDF生成失敗: html_to_pdf が False を返しました")
+
+    def run(self, driver):
+        """ジョブを実行してPDFデータを保持（失敗した場合は例外を送出し、error にも記録する）"""
+        try:
+            buffer = io.BytesIO()
+            self.write_pdf(driver, buffer)
+            self.pdf_data = buffer.getvalue()
+        except Exception as e:
+            self.error = str(e)
+            raise
+        finally:
+            self.done.set()
+
+
+def _as_job(item):
+    if isinstance(item, ConversionJob):
+        return item
+    if isinstance(item, str):
+        return ConversionJob(item)
+    return ConversionJob.from_request(item)
+
+
+def convert_markdown(md_content, output=None, driver=None, pool=None, headless=True, **options):
+    """Markdownの文字列をPDFに変換する
+
+    output を省略した場合はPDFのバイト列を返す。ファイルのようなオブジェクトを渡した場合は
+    PDFをそこに書き込み（閉じない）、None を返す。
+    driver を渡すとそのWebDriverで、pool を渡すとプールから借りたWebDriverで印刷する。
+    どちらも省略した場合はWebDriverを起動し、変換後に終了する（繰り返し呼ぶ場合は pool を渡すこと）。
+    options は ConversionJob の引数（base_dir, css_files, template_file, compact, font_size,
+    highlight_classes, image_dpi）。失敗した場合は RuntimeError を送出する。
+    """
+    job = ConversionJob(md_content, **options)
+    owned_pool = None
+    if driver is None and pool is None:
+        pool = owned_pool = DriverPool(1, headless=headless)
+    try:
+        if driver is None:
+            driver = pool.acquire()
+            try:
+                return _run_job(job, driver, output)
+            finally:
+                pool.release(driver)
+        return _run_job(job, driver, output)
+    finally:
+        if owned_pool is not None:
+            owned_pool.close()
+
+
+def _run_job(job, driver, output):
+    if output is None:
+        job.run(driver)
+        return job.pdf_data
+    job.write_pdf(driver, output)
+    return None
+
+
+def convert_many(items, pool=None, workers=1, headless=True):
+    """複数のMarkdownを並列に変換し、終わったものから順に ConversionJob を返すジェネレーター
+
+    items の要素は Markdownの文字列、ConversionJob、または ConversionJob.from_request に渡す辞書。
+    items は必要な分だけ先読みする（変換中と待機中のジョブは workers の2倍まで）ため、
+    大きなイテレーターやジェネレーターも渡せる。
+    返されるジョブは成功した場合は pdf_data、失敗した場合は error が設定されている
+    （入力と対応付けるには ConversionJob の tag を使う）。
+    pool を渡すとそのプールの起動済みWebDriverを使い、終了後もプールは閉じない。
+    途中でジェネレーターを閉じると、未着手のジョブは実行しない。
+    """
+    owned_pool = None
+    if pool is None:
+        pool = owned_pool = DriverPool(workers, headless=headless)
+    workers = max(1, workers)
+    items = iter(items)
+    pending = set()
+    stopped = threading.Event()
+
+    def convert(job):
+        if stopped.is_set():
+            job.discard()
+            return job
+        try:
+            driver = pool.acquire()
+        except Exception as e:
+            logger.error(f"WebDriver作成エラー: {str(e)}", exc_info=True)
+            job.error = f"WebDriver作成エラー: {str(e)}"
+            job.done.set()
+            return job
+        try:
+            job.run(driver)
+        except Exception as e:
+            logger.error(f"変換エラー: {str(e)}", exc_info=True)
+        # 変換に失敗したWebDriverは作り直す
+        try:
+            driver = pool.renew(driver, failed=not job)
+        except Exception as e:
+            logger.error(f"WebDriverを作り直せませんでした: {str(e)}")
+            return job
+        pool.release(driver)
+        return job
+
+    def fill(executor):
+        while len(pending) < workers * 2:
+            item = next(items, _END)
+            if item is _END:
+                return
+            pending.add(executor.submit(convert, _as_job(item)))
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='md2pdf-api')
+    try:
+        fill(executor)
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pending.discard(future)
+            fill(executor)
+            for future in finished:
+                yield future.result()
+    finally:
+        stopped.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if owned_pool is not None:
+            owned_pool.close()
@@ -0,0 +1,259 @@
+"""
+Process-wide cache for CSS, templates and rendered style bundles
+"""
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from .logger import logger
+
+# CSSファイルが指定されていない場合に試すCSS
+FALLBACK_CSS_FILES = ('css/simple.css', 'css/prism.css')
+
+# PDF用のCSSテンプレート
+PDF_STYLES_TEMPLATE = 'css/pdf_styles.css'
+
+# テンプレートファイルが指定されていない場合のHTMLテンプレート
+DEFAULT_TEMPLATE_FILE = 'templates/default.html'
+
+# 共有スタイルシートを書き出すディレクトリの環境変数（省略時は ~/.cache/md2pdf/styles）
+STYLESHEET_DIR_ENV = 'MD2PDF_STYLESHEET_DIR'
+
+
+def _default_stylesheet_dir():
+    if os.environ.get(STYLESHEET_DIR_ENV):
+        return Path(os.environ[STYLESHEET_DIR_ENV])
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'md2pdf' / 'styles'
+
+
+def _file_mtime(path):
+    """ファイルの更新時刻（存在しない場合は None）"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class AssetBundle:
+    """プリセット・オプションの組み合わせごとに組み立て済みのCSSとHTMLテンプレート"""
+
+    def __init__(self, key, css_content, template, dependencies):
+        self.key = key
+        self.css_content = css_content
+        self.template = template
+        # (パス, 更新時刻) のリスト
+        self.dependencies = dependencies
+        self._stylesheet_url = None
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        """依存ファイルが読み込み時から変更されていないか"""
+        return all(_file_mtime(path) == mtime for path, mtime in self.dependencies)
+
+    def stylesheet_url(self):
+        """CSSを書き出した共有スタイルシートの file:// URL（バンドルごとに一度だけ書き出す）
+
+        ファイル名はCSSの内容のハッシュのため、別のプロセスが同じバンドルを書き出しても同じファイルになる。
+        """
+        with self._lock:
+            if self._stylesheet_url is None:
+                data = self.css_content.encode('utf-8')
+                path = _default_stylesheet_dir().expanduser().resolve() / f"{hashlib.sha256(data).hexdigest()}.css"
+                if not path.exists():
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                    temp_path.write_bytes(data)
+                    os.replace(temp_path, path)
+                    logger.debug("共有スタイルシートを書き出しました: %s", path)
+                self._stylesheet_url = path.as_uri()
+            return self._stylesheet_url
+
+    def render(self, html_content, external_css=False):
+        """本文HTMLをテンプレートに埋め込んで完全なHTMLを返す
+
+        external_css=True の場合はCSSを埋め込まずに共有スタイルシートを @import で読み込む
+        （テンプレートの <style> をそのまま使えるため、独自のテンプレートでも動作する）。
+        ブラウザは同じURLのスタイルシートを読み込み間で使い回すため、一括変換で解析の手間とHTMLの量が減る。
+        """
+        if external_css:
+            css_content = f'@import url("{self.stylesheet_url()}");'
+        else:
+            css_content = self.css_content
+        return self.template.render(
+            css_content=css_content,
+            html_content=html_content
+        )
+
+
+class AssetCache:
+    """CSS・テンプレートの読み込みとコンパイル結果をプロセス内で共有するキャッシュ
+
+    バンドルは (css_files, template_file, compact, font_size, highlight_classes) をキーに保持し、
+    依存ファイルの更新時刻が変わった場合は作り直す。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._files = {}
+        self._templates = {}
+        self._bundles = {}
+        self._stats = {
+            'bundle': {'hits': 0, 'misses': 0},
+            'file': {'hits': 0, 'misses': 0},
+            'template': {'hits': 0, 'misses': 0},
+        }
+        # スレッドごとの累計（変換1件ごとのヒット数の計測用）
+        self._local = threading.local()
+
+    def _count(self, kind, hit):
+        key = 'hits' if hit else 'misses'
+        self._stats[kind][key] += 1
+        counts = getattr(self._local, 'counts', None)
+        if counts is None:
+            counts = self._local.counts = {kind: {'hits': 0, 'misses': 0} for kind in self._stats}
+        counts[kind][key] += 1
+
+    def read_text(self, path):
+        """ファイルを読み込む（更新時刻が変わっていなければキャッシュを返す）
+
+        戻り値は (内容, 更新時刻)。ファイルが存在しない場合は ("", None)。
+        """
+        path = str(path)
+        mtime = _file_mtime(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached and cached[0] == mtime:
+                self._count('file', True)
+                return cached[1], mtime
+
+            self._count('file', False)
+            if mtime is None:
+                logger.warning(f"File not found: {path}")
+                text = ""
+            else:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            self._files[path] = (mtime, text)
+            return text, mtime
+
+    def get_template(self, path):
+        """テンプレートファイルを読み込んでコンパイル（空の場合は None）
+
+        戻り値は (Template, 更新時刻)。
+        """
+        path = str(path)
+        source, mtime = self.read_text(path)
+        with self._lock:
+            cached = self._templates.get(path)
+            if cached and cached[0] == mtime:
+                self._count('template', True)
+                return cached[1], mtime
+
+            self._count('template', False)
+            from jinja2 import Template
+            template = Template(source) if source else None
+            self._templates[path] = (mtime, template)
+            return template, mtime
+
+    def get_bundle(self, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False):
+        """CSSとHTMLテンプレートを組み立てたバンドルを取得"""
+        key = (tuple(str(f) for f in css_files or ()), template_file and str(template_file), compact, font_size,
+               highlight_classes)
+        with self._lock:
+            bundle = self._bundles.get(key)
+            if bundle and bundle.is_fresh():
+                self._count('bundle', True)
+                return bundle
+
+            self._count('bundle', False)
+            bundle = self._build_bundle(key)
+            self._bundles[key] = bundle
+            return bundle
+
+    def _build_bundle(self, key):
+        css_files, template_file, compact, font_size, highlight_classes = key
+        logger.debug("アセットバンドル作成: %s", key)
+        dependencies = []
+
+        def read(path):
+            text, mtime = self.read_text(path)
+            dependencies.append((str(path), mtime))
+            return text
+
+        # CSSファイルを読み込み
+        css_content = ""
+        for css_file in css_files:
+            css_content += read(css_file) + "\n"
+
+        # CSSファイルが指定されていない場合、デフォルトでsimple.cssとprism.cssを試す
+        if not css_content.strip():
+            for default_css in FALLBACK_CSS_FILES:
+                css_content += read(default_css) + "\n"
+
+        # それでもCSSが見つからない場合のfallback
+        if not css_content.strip():
+            from config.config import DEFAULT_CSS
+            css_content = DEFAULT_CSS
+
+        # クラス名モードのコードハイライト用スタイルシート
+        if highlight_classes:
+            from .converter import get_highlight_css
+            css_content += get_highlight_css() + "\n"
+
+        # PDF用のCSSテンプレートを読み込んで適用
+        pdf_css_template, mtime = self.get_template(PDF_STYLES_TEMPLATE)
+        dependencies.append((PDF_STYLES_TEMPLATE, mtime))
+        if pdf_css_template:
+            css_content += pdf_css_template.render(
+                compact=compact,
+                margin="0.3in" if compact else "0.5in",
+                base_font_size=font_size
+            )
+
+        # HTMLテンプレートを読み込んで適用
+        template_path = template_file or DEFAULT_TEMPLATE_FILE
+        html_template, mtime = self.get_template(template_path)
+        dependencies.append((template_path, mtime))
+        if html_template is None:
+            from jinja2 import Template
+            from config.config import DEFAULT_HTML_TEMPLATE
+            html_template = Template(DEFAULT_HTML_TEMPLATE)
+
+        return AssetBundle(key, css_content, html_template, dependencies)
+
+    def stats(self):
+        """種類ごとのヒット数・ミス数・ヒット率"""
+        with self._lock:
+            result = {}
+            for kind, counts in self._stats.items():
+                total = counts['hits'] + counts['misses']
+                result[kind] = dict(counts, hit_rate=counts['hits'] / total if total else 0.0)
+            return result
+
+    def thread_stats(self):
+        """現在のスレッドでの種類ごとのヒット数・ミス数の累計"""
+        counts = getattr(self._local, 'counts', None) or {}
+        return {kind: dict(counts.get(kind, {'hits': 0, 'misses': 0})) for kind in self._stats}
+
+    def format_stats(self):
+        """ログ出力用の統計文字列"""
+        return ", ".join(
+            f"{kind} {s['hits']}/{s['hits'] + s['misses']} hits ({s['hit_rate']:.0%})"
+            for kind, s in self.stats().items()
+        )
+
+    def clear(self):
+        """キャッシュと統計をすべて破棄"""
+        with self._lock:
+            self._files.clear()
+            self._templates.clear()
+            self._bundles.clear()
+            for counts in self._stats.values():
+                counts['hits'] = counts['misses'] = 0
+
+
+# プロセス共通のキャッシュ
+asset_cache = AssetCache()
@@ -0,0 +1,63 @@
+"""
+Thin client for the conversion server
+"""
+
+import json
+from pathlib import Path
+
+from .logger import logger
+
+# 変換サーバーの既定の待ち受けアドレス（core.server と共通）
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_SERVER_URL = f'http://{DEFAULT_HOST}:{DEFAULT_PORT}'
+
+
+def convert_via_server(input_path, output_path, server_url=DEFAULT_SERVER_URL, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, timeout=300):
+    """変換サーバーにMarkdownを送信してPDFを保存（process_file と同じく成否を返す）"""
+    import urllib.error
+    import urllib.request
+    
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    if not output_path.suffix:
+        output_path = output_path / (input_path.stem + '.pdf')
+    
+    try:
+        md_content = input_path.read_text(encoding='utf-8')
+    except Exception as e:
+        logger.error(f"ファイル読み込みエラー: {input_path} - {str(e)}", exc_info=True)
+        return False
+    
+    # パスはサーバー側で解決されるため絶対パスで送る
+    payload = {
+        'markdown': md_content,
+        'base_dir': str(input_path.parent.resolve()),
+        'css_files': [str(Path(f).resolve()) for f in css_files] if css_files else None,
+        'template_file': str(Path(template_file).resolve()) if template_file else None,
+        'compact': compact,
+        'font_size': font_size,
+        'highlight_classes': highlight_classes,
+        'image_dpi': image_dpi,
+    }
+    request = urllib.request.Request(
+        server_url.rstrip('/') + '/convert',
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            pdf_data = response.read()
+    except urllib.error.HTTPError as e:
+        logger.error(f"変換サーバーエラー: {e.code} - {e.read().decode('utf-8', 'replace')}")
+        return False
+    except Exception as e:
+        logger.error(f"変換サーバーへの接続エラー: {server_url} - {str(e)}", exc_info=True)
+        return False
+    
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(pdf_data)
+    logger.info(f"PDF saved: {output_path}")
+    return True
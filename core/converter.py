@@ -2,20 +2,14 @@
 Markdown to HTML conversion functionality using markdown-it-py
 """
 
-from markdown_it import MarkdownIt
-from mdit_py_plugins.front_matter import front_matter_plugin
-from mdit_py_plugins.footnote import footnote_plugin
-from jinja2 import Template
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name
-from pygments.formatters import HtmlFormatter
-from pygments.util import ClassNotFound
-
-from config.config import (
-    DEFAULT_CSS,
-    DEFAULT_HTML_TEMPLATE,
-    load_css_file,
-)
+import html
+import re
+import threading
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from .assets import asset_cache
 from .logger import logger
 
 
@@ -29,28 +23,109 @@ def load_template_file(file_path):
         return ""
 
 
-def highlight_code(code, lang=None, attrs=None):
-    """コードのシンタックスハイライト"""
-    if not lang:
-        return f'<pre><code>{code}</code></pre>'
+# <img> タグの src 属性
+_IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])(.*?)\2', re.IGNORECASE | re.DOTALL)
+
+# 分割して印刷する文書で、別の部分にあるIDへのリンクに付ける接頭辞（結合時に元の名前へ戻す）
+CHUNK_REF_PREFIX = 'md2pdf-ref-'
+
+# 文書を分割する改ページの目印（merge_markdown_to_html の区切りと同じ）
+_PAGE_BREAK_RE = re.compile(r'<div\s+class\s*=\s*["\']page-break["\']', re.IGNORECASE)
+
+# id 属性と文書内リンク（href="#..."）
+_ID_RE = re.compile(r'\bid\s*=\s*(["\'])(.*?)\1', re.IGNORECASE | re.DOTALL)
+_FRAGMENT_HREF_RE = re.compile(r'(\bhref\s*=\s*)(["\'])#(.*?)\2', re.IGNORECASE | re.DOTALL)
+
+# ハイライト結果をキャッシュするコードブロック数
+HIGHLIGHT_CACHE_SIZE = 1024
+
+# スレッドごとのハイライト呼び出し数・キャッシュミス数（変換1件ごとの計測用）
+_highlight_local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def get_lexer(lang):
+    """言語名からレキサーを取得（未対応の言語は None）"""
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
     
     try:
-        lexer = get_lexer_by_name(lang, stripall=True)
-        formatter = HtmlFormatter(
-            noclasses=True,
-            style='default',
-            cssclass='highlight'
-        )
-        highlighted = highlight(code, lexer, formatter)
-        return highlighted
+        return get_lexer_by_name(lang, stripall=True)
     except ClassNotFound:
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_formatter(noclasses=True):
+    """HTMLフォーマッターを取得（noclasses=False でクラス名による出力）"""
+    from pygments.formatters import HtmlFormatter
+    
+    return HtmlFormatter(
+        noclasses=noclasses,
+        style='default',
+        cssclass='highlight'
+    )
+
+
+def get_highlight_css():
+    """クラス名モードで使うPygmentsのスタイルシート"""
+    return get_formatter(False).get_style_defs('.highlight')
+
+
+@lru_cache(maxsize=HIGHLIGHT_CACHE_SIZE)
+def _highlight_cached(lang, code, noclasses):
+    # キャッシュミスの場合のみ実行される
+    _highlight_local.misses = getattr(_highlight_local, 'misses', 0) + 1
+    lexer = get_lexer(lang)
+    if lexer is None:
         return f'<pre><code class="language-{lang}">{code}</code></pre>'
+    from pygments import highlight
+    return highlight(code, lexer, get_formatter(noclasses))
+
 
+def highlight_cache_stats():
+    """ハイライト結果キャッシュのヒット数・ミス数・ヒット率"""
+    info = _highlight_cached.cache_info()
+    total = info.hits + info.misses
+    return {'hits': info.hits, 'misses': info.misses, 'hit_rate': info.hits / total if total else 0.0}
 
-def markdown_to_html(md_content, css_files=None, template_file=None, compact=False, font_size=16):
-    """MarkdownをHTMLに変換（markdown-it-py使用）"""
+
+def highlight_thread_stats():
+    """現在のスレッドでのハイライト結果キャッシュのヒット数・ミス数の累計"""
+    calls = getattr(_highlight_local, 'calls', 0)
+    misses = getattr(_highlight_local, 'misses', 0)
+    return {'hits': calls - misses, 'misses': misses}
+
+
+def highlight_code(code, lang=None, attrs=None, classes=False):
+    """コードのシンタックスハイライト
+    
+    classes=True の場合はインラインスタイルの代わりにクラス名を出力する
+    （スタイルシートは get_highlight_css() で取得）。
+    """
+    if not lang:
+        return f'<pre><code>{code}</code></pre>'
+    
+    _highlight_local.calls = getattr(_highlight_local, 'calls', 0) + 1
+    return _highlight_cached(lang, code, not classes)
+
+
+def render_code_block(tokens, idx, options, env):
+    """コードブロックをシンタックスハイライトして出力するレンダラー"""
+    token = tokens[idx]
+    info = token.info.strip() if token.info else ""
+    lang = info.split()[0] if info else None
+    
+    return highlight_code(token.content, lang, classes=env.get('highlight_classes', False))
+
+
+@lru_cache(maxsize=None)
+def get_markdown_parser():
+    """markdown-it-pyのパーサーを取得（プロセス内で1つを共有）"""
+    from markdown_it import MarkdownIt
+    from mdit_py_plugins.front_matter import front_matter_plugin
+    from mdit_py_plugins.footnote import footnote_plugin
     
-    # markdown-it-pyの設定
     md = (
         MarkdownIt("commonmark", {
             "breaks": True,        # 改行を<br>に変換
@@ -66,58 +141,191 @@ def markdown_to_html(md_content, css_files=None, template_file=None, compact=Fal
         ])
     )
     
-    # コードハイライト用のレンダラー設定
-    def render_code_block(tokens, idx, options, env):
-        token = tokens[idx]
-        info = token.info.strip() if token.info else ""
-        lang = info.split()[0] if info else None
-        
-        return highlight_code(token.content, lang)
-    
     # レンダラーのオーバーライド
     md.renderer.rules["code_block"] = render_code_block
     md.renderer.rules["fence"] = render_code_block
+    return md
+
+
+def render_markdown(md_content, highlight_classes=False, doc_id=None):
+    """Markdownを本文のHTMLに変換（テンプレート・CSSは適用しない）
     
+    doc_id を指定すると脚注のIDに付与され、複数の文書を1つのHTMLにまとめても衝突しない。
+    """
+    env = {'highlight_classes': highlight_classes}
+    if doc_id is not None:
+        env['docId'] = str(doc_id)
+    html_content = get_markdown_parser().render(md_content, env)
+    
+    logger.debug("markdown-it-pyでHTML変換完了")
+    return html_content
+
+
+def _is_split_point(token):
+    """トップレベルの見出し（h1）または改ページの目印"""
+    if token.level != 0:
+        return False
+    if token.type == 'heading_open':
+        return token.tag == 'h1'
+    return token.type == 'html_block' and bool(_PAGE_BREAK_RE.search(token.content))
+
+
+def render_markdown_chunks(md_content, highlight_classes=False, max_lines=500):
+    """Markdownをトップレベルの見出し・改ページで区切り、max_lines 行程度ずつの本文HTMLのリストに変換
+    
+    文書全体を一度に解析するため、脚注の番号やIDは分割しない場合と同じになる。
+    1つのセクションが max_lines 行を超える場合はそのまま1つの部分になる。
+    別の部分にあるIDへのリンクは link_chunks で結合後に有効になるように書き換える。
+    """
+    md = get_markdown_parser()
+    env = {'highlight_classes': highlight_classes}
+    tokens = md.parse(md_content, env)
+    
+    # セクションの開始位置（トークンの番号）と開始行
+    total_lines = md_content.count('\n') + 1
+    starts = [0] + [index for index, token in enumerate(tokens) if index and _is_split_point(token)]
+    lines = [tokens[index].map[0] if tokens and tokens[index].map else 0 for index in starts] + [total_lines]
+    
+    # 行数の上限までセクションをまとめる
+    chunks = []
+    chunk_start = 0
+    for section in range(1, len(starts)):
+        if lines[section + 1] - lines[chunk_start] > max_lines:
+            chunks.append((starts[chunk_start], starts[section]))
+            chunk_start = section
+    chunks.append((starts[chunk_start] if starts else 0, len(tokens)))
+    
+    bodies = [md.renderer.render(tokens[start:end], md.options, env) for start, end in chunks]
+    logger.debug("Markdownを %d 個の部分に分割しました", len(bodies))
+    return link_chunks(bodies)
+
+
+def link_chunks(bodies):
+    """別々に印刷する本文HTMLの間のリンク（href="#id"）を結合後のPDFで有効にする
+    
+    リンク元の部分では CHUNK_REF_PREFIX を付けたIDへのリンクと空の飛び先に書き換え、
+    飛び先の部分には空のリンクを追加する（Chromeはリンクされている要素の出力先だけをPDFに出力する）。
+    結合時に PdfBookWriter.redirect_destinations で元のIDへ付け替える。
+    """
+    owners = {}
+    for index, body in enumerate(bodies):
+        for match in _ID_RE.finditer(body):
+            owners.setdefault(html.unescape(match.group(2)), index)
+    
+    external = [set() for _ in bodies]
+    linked = []
+    for index, body in enumerate(bodies):
+        targets = set()
+        
+        def replace(match):
+            target = html.unescape(match.group(3))
+            owner = owners.get(target, index)
+            if owner == index:
+                return match.group(0)
+            targets.add(target)
+            external[owner].add(target)
+            return f'{match.group(1)}{match.group(2)}#{html.escape(CHUNK_REF_PREFIX + target)}{match.group(2)}'
+        
+        body = _FRAGMENT_HREF_RE.sub(replace, body)
+        linked.append(body + ''.join(f'<span id="{html.escape(CHUNK_REF_PREFIX + target)}"></span>'
+                                     for target in sorted(targets)))
+    
+    return [body + ''.join(f'<a href="#{html.escape(target)}"></a>' for target in sorted(targets))
+            for body, targets in zip(linked, external)]
+
+
+def rewrite_image_sources(html_content, replace):
+    """<img> の src 属性を replace(src) の戻り値で置き換える（None の場合はそのまま）"""
+    def substitute(match):
+        new_src = replace(html.unescape(match.group(3)))
+        if new_src is None:
+            return match.group(0)
+        return f'{match.group(1)}{match.group(2)}{html.escape(new_src)}{match.group(2)}'
+    
+    return _IMG_SRC_RE.sub(substitute, html_content)
+
+
+def resolve_local_path(src, base_dir):
+    """画像などの参照がローカルファイルを指す場合、その絶対パスを返す（それ以外は None）"""
+    parsed = urlparse(src)
+    if parsed.scheme and parsed.scheme != 'file' or parsed.netloc:
+        return None
+    if not parsed.path:
+        return None
+    path = Path(unquote(parsed.path))
+    if not path.is_absolute():
+        path = Path(base_dir) / path
+    return path.resolve()
+
+
+def absolutize_image_sources(html_content, base_dir):
+    """相対パスの画像参照を file:// の絶対URLに書き換える"""
+    def replace(src):
+        path = resolve_local_path(src, base_dir)
+        return path.as_uri() if path else None
+    
+    return rewrite_image_sources(html_content, replace)
+
+
+def optimize_image_sources(html_content, base_dir, image_dpi):
+    """ローカル画像の参照を image_dpi に合わせて縮小・再圧縮した画像の file:// URLに書き換える"""
+    from .images import get_image_cache
+    image_cache = get_image_cache()
+    
+    def replace(src):
+        path = resolve_local_path(src, base_dir)
+        if path is None:
+            return None
+        variant = image_cache.variant(path, image_dpi)
+        return variant.as_uri() if variant else None
+    
+    return rewrite_image_sources(html_content, replace)
+
+
+def markdown_to_html(md_content, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, base_dir=None, external_css=False):
+    """MarkdownをHTMLに変換（markdown-it-py使用）
+    
+    パーサー・CSS・テンプレートはプロセス内でキャッシュされ、
+    ファイルが更新された場合のみ読み込み直される。
+    highlight_classes=True の場合、コードはクラス名でハイライトされ、
+    Pygmentsのスタイルシートは1つだけCSSに追加される。
+    image_dpi を指定すると、base_dir を基準とするローカル画像を最適化した画像に置き換える。
+    external_css=True の場合、CSSは埋め込まずに共有スタイルシートとして読み込む（AssetBundle.render を参照）。
+    """
     # HTML変換実行
-    html_content = md.render(md_content)
-    
-    logger.debug(f"markdown-it-pyでHTML変換完了")
-    
-    # CSSファイルを読み込み
-    css_content = ""
-    if css_files:
-        for css_file in css_files:
-            css_content += load_css_file(css_file) + "\n"
-    
-    # CSSファイルが指定されていない場合、デフォルトでsimple.cssとprism.cssを試す
-    if not css_content.strip():
-        for default_css in ['css/simple.css', 'css/prism.css']:
-            css_content += load_css_file(default_css) + "\n"
-    
-    # それでもCSSが見つからない場合のfallback
-    if not css_content.strip():
-        css_content = DEFAULT_CSS
-    
-    # PDF用のCSSテンプレートを読み込んで適用
-    pdf_css_template = load_template_file('css/pdf_styles.css')
-    if pdf_css_template:
-        pdf_css = Template(pdf_css_template).render(
-            compact=compact,
-            margin="0.3in" if compact else "0.5in",
-            base_font_size=font_size
-        )
-        css_content += pdf_css
-    
-    # HTMLテンプレートを読み込んで適用
-    if template_file:
-        html_template = load_template_file(template_file)
-    else:
-        html_template = load_template_file('templates/default.html')
-    
-    if not html_template:
-        html_template = DEFAULT_HTML_TEMPLATE
-    
-    return Template(html_template).render(
-        css_content=css_content,
-        html_content=html_content
-    )
\ No newline at end of file
+    html_content = render_markdown(md_content, highlight_classes)
+    if image_dpi and base_dir is not None:
+        html_content = optimize_image_sources(html_content, base_dir, image_dpi)
+    
+    # CSSとHTMLテンプレートを適用
+    bundle = asset_cache.get_bundle(css_files, template_file, compact, font_size, highlight_classes)
+    return bundle.render(html_content, external_css)
+
+
+def markdown_to_html_chunks(md_content, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, base_dir=None, max_lines=500, external_css=False):
+    """Markdownを分割して、それぞれ完全なHTML文書に変換（render_markdown_chunks を参照）"""
+    bodies = render_markdown_chunks(md_content, highlight_classes, max_lines)
+    if image_dpi and base_dir is not None:
+        bodies = [optimize_image_sources(body, base_dir, image_dpi) for body in bodies]
+    bundle = asset_cache.get_bundle(css_files, template_file, compact, font_size, highlight_classes)
+    return [bundle.render(body, external_css) for body in bodies]
+
+
+def merge_markdown_to_html(md_files, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, external_css=False):
+    """複数のMarkdownファイルを改ページ区切りで1つのHTML文書にまとめる
+    
+    各ファイルの相対パスの画像参照は、そのファイルのディレクトリを基準に絶対URLへ書き換える。
+    """
+    bodies = []
+    for index, md_file in enumerate(md_files):
+        md_file = Path(md_file)
+        with open(md_file, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        body = render_markdown(md_content, highlight_classes, doc_id=index)
+        if image_dpi:
+            body = optimize_image_sources(body, md_file.parent, image_dpi)
+        bodies.append(absolutize_image_sources(body, md_file.parent))
+    
+    html_content = '\n<div class="page-break"></div>\n'.join(bodies)
+    bundle = asset_cache.get_bundle(css_files, template_file, compact, font_size, highlight_classes)
+    return bundle.render(html_content, external_css)
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Streaming discovery of Markdown files with .gitignore-style ignore rules
+"""
+
+import os
+import re
+from pathlib import Path
+
+from .logger import logger
+
+# 変換対象のデフォルトのパターン
+DEFAULT_INCLUDE = ('*.md',)
+
+# ignore ファイルがなくても探索しないディレクトリ
+DEFAULT_SKIP_DIRS = frozenset(('.git', '.hg', '.svn', 'node_modules', '__pycache__', '.venv', '.tox'))
+
+# 各ディレクトリで読み込む ignore ファイル（.gitignore と同じ書式）
+IGNORE_FILES = ('.gitignore', '.md2pdfignore')
+
+
+def _translate(pattern):
+    """.gitignore 形式のパターン（先頭・末尾の / は除いたもの）を正規表現に変換"""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            parts.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif c == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end < 0:
+                parts.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            parts.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif c == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+class IgnoreRule:
+    """.gitignore の1行分のルール
+
+    / を含むパターンは ignore ファイルのディレクトリ（base）からの相対パス全体と、
+    含まないパターンはファイル名・ディレクトリ名と比較する。
+    """
+
+    def __init__(self, pattern, base=''):
+        self.negate = pattern.startswith('!')
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        self.anchored = '/' in pattern
+        self.base = base
+        self.regex = _translate(pattern.lstrip('/'))
+
+    @classmethod
+    def parse(cls, line, base=''):
+        """ignore ファイルの1行からルールを作成（空行・コメントは None）"""
+        line = line.rstrip('\n\r')
+        if not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            return None
+        # 先頭の \# と \! はパターンのエスケープとしてそのまま渡す（! を否定として扱わない）
+        return cls(line, base)
+
+    def matches(self, rel_path, is_dir):
+        """探索の起点からの相対パス（/ 区切り）が一致するか"""
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not rel_path.startswith(self.base + '/'):
+                return False
+            rel_path = rel_path[len(self.base) + 1:]
+        if self.anchored:
+            return self.regex.fullmatch(rel_path) is not None
+        return self.regex.fullmatch(rel_path.rsplit('/', 1)[-1]) is not None
+
+
+def is_ignored(rules, rel_path, is_dir):
+    """最後に一致したルールで除外するかを決める（! のルールは除外を取り消す）"""
+    ignored = False
+    for rule in rules:
+        if rule.negate == ignored and rule.matches(rel_path, is_dir):
+            ignored = not rule.negate
+    return ignored
+
+
+def _read_ignore_rules(directory, base):
+    rules = []
+    for name in IGNORE_FILES:
+        try:
+            with open(os.path.join(directory, name), 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            rule = IgnoreRule.parse(line, base)
+            if rule is not None:
+                rules.append(rule)
+    return rules
+
+
+def walk_directories(root, exclude=None, skip_dirs=None, use_ignore_files=True, warn=True):
+    """root 以下の除外されていないディレクトリを名前順にたどるジェネレーター
+
+    (ディレクトリ, 起点からの相対パス, 適用するルール, 名前順のエントリ) を返す。
+    除外されたディレクトリ（DEFAULT_SKIP_DIRS、ignore ファイル・exclude に一致するもの、
+    skip_dirs に渡したパス）の中は読まない。warn=False の場合は読み込めないディレクトリを黙って飛ばす。
+    """
+    root_rules = [IgnoreRule(pattern) for pattern in exclude or ()]
+    skip_paths = {os.path.normcase(os.path.abspath(path)) for path in skip_dirs or ()}
+
+    # (ディレクトリ, 起点からの相対パス, 適用するルール) のスタック
+    stack = [(str(root), '', root_rules)]
+    while stack:
+        directory, rel_dir, rules = stack.pop()
+        if use_ignore_files:
+            rules = rules + _read_ignore_rules(directory, rel_dir)
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            if warn:
+                logger.warning(f"ディレクトリを読み込めませんでした: {directory} - {str(e)}")
+            continue
+
+        yield directory, rel_dir, rules, entries
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                # シンボリックリンクのディレクトリはループを避けるためたどらない
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+            except OSError:
+                continue
+            if (entry.name in DEFAULT_SKIP_DIRS or is_ignored(rules, rel_path, True)
+                    or os.path.normcase(os.path.abspath(entry.path)) in skip_paths):
+                continue
+            subdirs.append((entry.path, rel_path, rules))
+        # 名前順に処理するため逆順に積む
+        stack.extend(reversed(subdirs))
+
+
+def walk_markdown(root, include=None, exclude=None, skip_dirs=None, use_ignore_files=True):
+    """root 以下の変換対象のファイルを見つけた順に返すジェネレーター
+
+    os.scandir で1ディレクトリずつ読み、名前順（ファイル、サブディレクトリの順）に返すため
+    順番は常に同じになり、探索が終わる前に変換を始められる。
+    除外されたディレクトリ（DEFAULT_SKIP_DIRS、ignore ファイル・exclude に一致するもの、
+    skip_dirs に渡したパス）の中は読まない（walk_directories を参照）。
+    include・exclude は .gitignore と同じ書式のパターンのリストで、include はファイルだけに適用する
+    （省略時は *.md）。ignore ファイル（.gitignore, .md2pdfignore）は各ディレクトリで読み込む。
+    """
+    include_rules = [IgnoreRule(pattern) for pattern in (include or DEFAULT_INCLUDE)]
+    for directory, rel_dir, rules, entries in walk_directories(root, exclude, skip_dirs, use_ignore_files):
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_file = not entry.is_dir(follow_symlinks=False) and entry.is_file()
+            except OSError:
+                continue
+            # include のパターンに一致したものが対象（is_ignored の判定をそのまま使う）
+            if is_file and is_ignored(include_rules, rel_path, False) and not is_ignored(rules, rel_path, False):
+                yield Path(entry.path)
@@ -2,15 +2,23 @@
 WebDriver management for PDF conversion
 """
 
+import os
 import platform
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+import signal
+import weakref
 
 from .logger import logger
 
+# kill_driver で強制終了したWebDriver（quit_driver で終了し直さない）
+_killed_drivers = weakref.WeakSet()
+
 
 def create_driver(headless=True):
     """WebDriverを作成"""
+    # seleniumの読み込みには時間がかかるため、WebDriverを作成するときに読み込む
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    
     options = Options()
     if headless:
         options.add_argument('--headless=new')
@@ -59,4 +67,103 @@ def create_driver(headless=True):
     except:
         pass
     
-    return webdriver.Chrome(service=service, options=options)
\ No newline at end of file
+    return webdriver.Chrome(service=service, options=options)
+
+def _child_pids(pid):
+    """pid の子孫プロセスのPID（psutil がない場合は /proc から調べる。調べられない場合は空）"""
+    try:
+        import psutil
+        return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+    except ImportError:
+        pass
+    except Exception:
+        return []
+    
+    children = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                # comm に空白や括弧が含まれる場合があるため、最後の ')' の後ろから読む
+                fields = f.read().rsplit(b')', 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    
+    pids = []
+    stack = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            pids.append(child)
+            stack.append(child)
+    return pids
+
+
+def driver_pids(driver):
+    """chromedriver とそこから起動されたChromeのプロセスのPID"""
+    process = getattr(getattr(driver, 'service', None), 'process', None)
+    pid = getattr(process, 'pid', None)
+    if pid is None:
+        return []
+    return [pid] + _child_pids(pid)
+
+
+def driver_memory_mb(driver):
+    """WebDriverのプロセス全体の使用メモリ（RSS、MB）。調べられない場合は None"""
+    pids = driver_pids(driver)
+    if not pids:
+        return None
+    try:
+        import psutil
+        total = 0
+        for pid in pids:
+            try:
+                total += psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+    except ImportError:
+        pass
+    
+    page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+    total = 0
+    found = False
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm', 'r') as f:
+                total += int(f.read().split()[1]) * page_size
+            found = True
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / (1024 * 1024) if found else None
+
+
+def kill_driver(driver):
+    """応答しなくなったWebDriverのプロセス（chromedriver とChrome）を強制終了する"""
+    pids = driver_pids(driver)
+    # 子プロセスから終了する
+    for pid in reversed(pids):
+        try:
+            os.kill(pid, signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+        except OSError:
+            continue
+    if not pids:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    _killed_drivers.add(driver)
+    logger.warning(f"WebDriverを強制終了しました（{len(pids)} プロセス）")
+
+
+def quit_driver(driver):
+    """WebDriverを終了する（kill_driver で強制終了済みの場合は何もしない）"""
+    if driver in _killed_drivers:
+        logger.debug("WebDriverは強制終了済みです")
+        return
+    driver.quit()
@@ -0,0 +1,202 @@
+"""
+Image optimization for printing: resized and recompressed variants with an on-disk cache
+
+画像は印刷されるページ幅と解像度（DPI）に合わせて縮小・再圧縮し、
+元画像のハッシュとパラメーターをキーにキャッシュディレクトリへ保存する。
+同じ画像を参照する文書がいくつあっても、最適化は一度だけ行われる。
+Pillow がインストールされていない場合は元の画像をそのまま使う。
+"""
+
+import hashlib
+import math
+import os
+import threading
+from pathlib import Path
+
+from .logger import logger
+
+# 画像最適化の設定のデフォルト（config.py の IMAGE_CONFIG で上書きできる）
+DEFAULT_IMAGE_CONFIG = {
+    'CACHE_DIR': None,               # キャッシュディレクトリ（None の場合は ~/.cache/md2pdf/images）
+    'JPEG_QUALITY': 85,              # JPEG・WebP の品質
+    'CONTENT_WIDTH_INCHES': None,    # 本文の幅（None の場合は PDF_PRINT_OPTIONS の用紙幅から余白を引いた値）
+}
+
+# 最適化する画像の拡張子と保存形式（GIFはアニメーション、SVGはベクターのため対象外）
+_FORMATS = {
+    '.png': ('PNG', '.png'),
+    '.jpg': ('JPEG', '.jpg'),
+    '.jpeg': ('JPEG', '.jpg'),
+    '.webp': ('WEBP', '.webp'),
+    '.bmp': ('PNG', '.png'),
+}
+
+# CSSの1インチあたりのピクセル数（これより低いDPIでは、最適化前より小さい画像で印刷されてしまう）
+CSS_PIXELS_PER_INCH = 96
+
+# 最適化の方法を変えた場合に上げる（古いキャッシュを使わないようにする）
+_CACHE_VERSION = 1
+
+
+def _load_image_config():
+    image_config = dict(DEFAULT_IMAGE_CONFIG)
+    try:
+        from config import config
+        image_config.update(getattr(config, 'IMAGE_CONFIG', {}))
+    except ImportError:
+        pass
+    return image_config
+
+
+def _default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'md2pdf' / 'images'
+
+
+def _content_width_inches():
+    from .pdf import PDF_PRINT_OPTIONS
+    return PDF_PRINT_OPTIONS['paperWidth'] - PDF_PRINT_OPTIONS['marginLeft'] - PDF_PRINT_OPTIONS['marginRight']
+
+
+class ImageCache:
+    """最適化した画像のディスクキャッシュ
+
+    キャッシュのファイル名は元画像の内容のハッシュ・幅・品質から決まるため、
+    複数のスレッドやプロセスから同時に使っても同じファイルになる（書き込みは一時ファイルから置き換える）。
+    最適化しても小さくならない画像は、元の画像を使うことを示す空の .orig ファイルを記録する。
+    """
+
+    def __init__(self, cache_dir=None, quality=None, content_width=None):
+        image_config = _load_image_config()
+        self.cache_dir = Path(cache_dir or image_config['CACHE_DIR'] or _default_cache_dir()).expanduser().resolve()
+        self.quality = quality or image_config['JPEG_QUALITY']
+        self.content_width = content_width or image_config['CONTENT_WIDTH_INCHES']
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._unavailable = False
+
+    def target_width(self, dpi):
+        """dpi で本文の幅いっぱいに印刷する場合のピクセル数
+
+        dpi が CSS_PIXELS_PER_INCH（96）より低い場合は 96 として扱い、CSSピクセルの幅より小さくしない。
+        """
+        width = self.content_width or _content_width_inches()
+        return max(1, math.ceil(width * max(dpi, CSS_PIXELS_PER_INCH)))
+
+    def thread_stats(self):
+        """現在のスレッドでのキャッシュのヒット数・ミス数の累計"""
+        return {'hits': getattr(self._local, 'hits', 0), 'misses': getattr(self._local, 'misses', 0)}
+
+    def _count(self, key):
+        setattr(self._local, key, getattr(self._local, key, 0) + 1)
+
+    def _digest(self, path, stat):
+        """画像の内容のハッシュ（更新時刻とサイズが同じ間はプロセス内で再計算しない）"""
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def variant(self, path, dpi):
+        """path の画像を dpi に合わせて最適化したファイルのパス（元の画像を使う場合は None）"""
+        if self._unavailable:
+            return None
+        path = Path(path)
+        fmt = _FORMATS.get(path.suffix.lower())
+        if fmt is None:
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        width = self.target_width(dpi)
+        name = f"{self._digest(path, stat)}-{width}w-q{self.quality}-v{_CACHE_VERSION}"
+        target = self.cache_dir / name[:2] / (name + fmt[1])
+        marker = target.with_suffix('.orig')
+        if target.exists():
+            self._count('hits')
+            return target
+        if marker.exists():
+            self._count('hits')
+            return None
+
+        self._count('misses')
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            logger.warning("Pillow がインストールされていないため、画像の最適化を行いません")
+            self._unavailable = True
+            return None
+
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if self._optimize(path, target, width, fmt[0], stat.st_size):
+                logger.debug("画像を最適化しました: %s -> %s", path, target)
+                return target
+            marker.touch()
+        except Exception as e:
+            logger.warning(f"画像の最適化に失敗しました: {path} - {str(e)}")
+        return None
+
+    def _optimize(self, source, target, width, fmt, source_size):
+        """縮小・再圧縮して target に保存（元の画像より小さくならない場合は False）"""
+        from PIL import Image, ImageOps
+
+        with Image.open(source) as image:
+            if getattr(image, 'is_animated', False):
+                return False
+            # EXIFの回転情報は画素に反映する（保存時にEXIFは引き継がない）
+            image = ImageOps.exif_transpose(image)
+            resized = image.width > width
+            if resized:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+            temp_path = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                if fmt == 'JPEG':
+                    if image.mode not in ('RGB', 'L'):
+                        image = image.convert('RGB')
+                    image.save(temp_path, 'JPEG', quality=self.quality, optimize=True, progressive=True)
+                elif fmt == 'WEBP':
+                    image.save(temp_path, 'WEBP', quality=self.quality)
+                else:
+                    image.save(temp_path, 'PNG', optimize=True)
+                if not resized and temp_path.stat().st_size >= source_size:
+                    return False
+                os.replace(temp_path, target)
+                return True
+            finally:
+                if temp_path.exists():
+                    temp_path.unlink()
+
+
+# プロセス全体で共有するキャッシュ（import 時に設定を読み込まないように、最初に使うときに作成する）
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """プロセス全体で共有する ImageCache"""
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCache()
+    return _image_cache
+
+
+def __getattr__(name):
+    # image_cache としても参照できる（最初に参照したときに作成する）
+    if name == 'image_cache':
+        return get_image_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,23 +1,167 @@
 """
 Logger configuration for the core package
+
+ログはキュー経由でバックグラウンドのスレッドがファイルに書き込むため、
+変換中のワーカースレッドがディスクへの書き込みで待たされることはない。
+ファイルは一定のサイズでローテーションされる。
 """
 
+import atexit
 import logging
-from pathlib import Path
+import logging.handlers
+import os
+import queue
+import threading
+
+# ログ設定のデフォルト（config.py の LOG_CONFIG、環境変数 MD2PDF_LOG_LEVEL で上書きできる）
+DEFAULT_LOG_CONFIG = {
+    'LEVEL': 'INFO',                 # ログレベル（DEBUG にすると変換の詳細を出力）
+    'FILE': 'pdf_converter.log',     # ログファイル（gui.py も file_handler() で同じファイルに書き込む）
+    'MAX_BYTES': 10 * 1024 * 1024,   # ローテーションするサイズ
+    'BACKUP_COUNT': 3,               # 残す古いログファイルの数
+}
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
-# ファイルハンドラの設定（gui.pyと同じファイルに出力）
-log_file = Path('pdf_converter.log')
-file_handler = logging.FileHandler(log_file, encoding='utf-8')
-file_handler.setLevel(logging.DEBUG)
 
-# フォーマッタの設定
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
+def _load_log_config():
+    """デフォルト・config.py・環境変数の順に設定を重ねる"""
+    log_config = dict(DEFAULT_LOG_CONFIG)
+    try:
+        from config import config
+        log_config.update(getattr(config, 'LOG_CONFIG', {}))
+    except ImportError:
+        pass
+    if os.environ.get('MD2PDF_LOG_LEVEL'):
+        log_config['LEVEL'] = os.environ['MD2PDF_LOG_LEVEL']
+    return log_config
+
+
+def _parse_level(level):
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+class _BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """最初のログが出力されたときに書き込みスレッド（QueueListener）を開始する QueueHandler"""
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self.listener = None
+        self._start_lock = threading.Lock()
+
+    def emit(self, record):
+        if self.listener is None:
+            with self._start_lock:
+                if self.listener is None:
+                    listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+                    listener.start()
+                    self.listener = listener
+        super().emit(record)
+
+    def stop(self):
+        """キューに残ったログを書き込んでスレッドを終了"""
+        with self._start_lock:
+            listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        self.target.close()
+
+
+_queue_handler = None
+
+
+def configure_logging(level=None, log_file=None, max_bytes=None, backup_count=None):
+    """ログレベル・ファイル・ローテーションを設定（省略した項目は設定ファイルの値）
+
+    ファイルは最初のログが出力されるまで作成しない。
+    """
+    global _queue_handler
+    log_config = _load_log_config()
+    level = _parse_level(level if level is not None else log_config['LEVEL'])
+
+    if _queue_handler is not None:
+        logger.removeHandler(_queue_handler)
+        _queue_handler.stop()
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file or log_config['FILE'],
+        maxBytes=max_bytes if max_bytes is not None else log_config['MAX_BYTES'],
+        backupCount=backup_count if backup_count is not None else log_config['BACKUP_COUNT'],
+        encoding='utf-8',
+        delay=True,
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    _queue_handler = _BackgroundQueueHandler(file_handler)
+    logger.addHandler(_queue_handler)
+    logger.setLevel(level)
+
+
+def file_handler():
+    """ログファイルに書き込むハンドラ（gui.py などのロガーからも同じファイルに書き込むために使う）
+
+    ローテーションするファイルを複数のハンドラで開くと置き換えに失敗するため、
+    このハンドラを共有する。configure_logging を呼ぶと新しいハンドラに置き換わる。
+    """
+    return _queue_handler
+
+
+def forward_to_queue(log_queue, level):
+    """子プロセスのログを親プロセスのキューに送る（ProcessPoolExecutor の initializer 用）
+
+    ログファイルへの書き込みとローテーションは親プロセスだけが行う。
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        logger.removeHandler(_queue_handler)
+        _queue_handler.stop()
+        _queue_handler = None
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+
+
+class ChildProcessLogs:
+    """子プロセスから送られたログを受け取り、このプロセスのログに書き込む
+
+    with ChildProcessLogs(mp_context) as logs:
+        ProcessPoolExecutor(..., initializer=forward_to_queue, initargs=(logs.queue, logger.level))
+    """
+
+    def __init__(self, mp_context):
+        self.queue = mp_context.Queue()
+        self.listener = logging.handlers.QueueListener(self.queue, *logger.handlers, respect_handler_level=True)
+
+    def start(self):
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """受け取り済みのログを書き込んで終了"""
+        self.listener.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def shutdown_logging():
+    """未書き込みのログをファイルに書き込む（プロセス終了時に自動で呼ばれる）"""
+    if _queue_handler is not None:
+        _queue_handler.stop()
+
 
 # ハンドラの追加（重複を避けるために既存のハンドラを確認）
 if not logger.handlers:
-    logger.addHandler(file_handler)
\ No newline at end of file
+    configure_logging()
+    atexit.register(shutdown_logging)
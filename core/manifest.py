@@ -0,0 +1,179 @@
+"""
+Build manifest for incremental directory conversion
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+from .assets import asset_cache
+from .converter import resolve_local_path
+from .logger import logger
+
+# 出力ディレクトリに置くマニフェストのファイル名
+MANIFEST_NAME = '.md2pdf-manifest.json'
+MANIFEST_VERSION = 1
+
+# 変換中の記録を追記するジャーナル（中断された場合は次回の読み込み時に反映する）
+JOURNAL_NAME = '.md2pdf-manifest.journal'
+
+# Markdown内の画像参照（![alt](path) と <img src="path">）
+_MD_IMAGE_RE = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)')
+_HTML_IMAGE_RE = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def _hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def find_local_images(md_content, base_dir):
+    """Markdownから参照されているローカル画像のパスを重複なしで返す"""
+    images = []
+    seen = set()
+    for match in list(_MD_IMAGE_RE.finditer(md_content)) + list(_HTML_IMAGE_RE.finditer(md_content)):
+        path = resolve_local_path(match.group(1), base_dir)
+        if path and path not in seen and path.is_file():
+            seen.add(path)
+            images.append(path)
+    return images
+
+
+def compute_fingerprint(md_file, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, external_css=False):
+    """Markdownと依存ファイル・オプションをまとめたハッシュを計算
+
+    依存ファイルはCSS、HTMLテンプレート、pdf_styles.css、参照しているローカル画像。
+    external_css は出力のPDFに影響しないため含めない。
+    """
+    md_file = Path(md_file)
+    md_bytes = md_file.read_bytes()
+
+    digest = hashlib.sha256()
+    digest.update(md_bytes)
+
+    bundle = asset_cache.get_bundle(css_files, template_file, compact, font_size, highlight_classes)
+    digest.update(json.dumps(bundle.key, ensure_ascii=False).encode('utf-8'))
+    if image_dpi:
+        digest.update(f"\0image_dpi={image_dpi}".encode('utf-8'))
+    for path, _ in bundle.dependencies:
+        text, _ = asset_cache.read_text(path)
+        digest.update(f"\0{path}\0{_hash_bytes(text.encode('utf-8'))}".encode('utf-8'))
+
+    md_content = md_bytes.decode('utf-8', errors='replace')
+    for image in find_local_images(md_content, md_file.parent):
+        digest.update(f"\0{image}\0{_hash_bytes(image.read_bytes())}".encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def compute_merge_fingerprint(entries, output_dir, merge_mode='pdf', optimize=False):
+    """マージ対象の (PDFパス, ハッシュ) の並びとマージ方式からマージ結果のハッシュを計算"""
+    digest = hashlib.sha256(f"{merge_mode}\n".encode('utf-8'))
+    if optimize:
+        digest.update(b"optimize\n")
+    for pdf_path, fingerprint in entries:
+        digest.update(f"{Path(pdf_path).relative_to(output_dir).as_posix()}\0{fingerprint}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """出力PDFごとの入力ハッシュを記録するマニフェスト
+
+    record・discard の内容はその都度ジャーナルに追記するため、変換が途中で中断されても
+    次回の差分ビルドでは変換済みのファイルを省略して続きから変換できる。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_NAME
+        self.journal_path = self.output_dir / JOURNAL_NAME
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._journal = None
+        self.load()
+
+    def _key(self, pdf_path):
+        return Path(pdf_path).relative_to(self.output_dir).as_posix()
+
+    def load(self):
+        """マニフェストを読み込む（存在しない・壊れている場合は空）と、残っているジャーナルを反映"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = None
+        except (OSError, ValueError) as e:
+            logger.warning(f"マニフェストの読み込みに失敗しました: {self.path} - {str(e)}")
+            data = None
+
+        if data and data.get('version') == MANIFEST_VERSION:
+            self.entries = data.get('files', {})
+        self._replay_journal()
+
+    def _replay_journal(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"ジャーナルの読み込みに失敗しました: {self.journal_path} - {str(e)}")
+            return
+
+        replayed = 0
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 中断時に書きかけだった行
+                continue
+            if record.get('fingerprint'):
+                self.entries[record['file']] = {'fingerprint': record['fingerprint']}
+            else:
+                self.entries.pop(record['file'], None)
+            replayed += 1
+        if replayed:
+            logger.info(f"Resuming interrupted build: {replayed} journal entries from {self.journal_path}")
+
+    def _append_journal(self, key, fingerprint):
+        if self._journal is None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(json.dumps({'file': key, 'fingerprint': fingerprint}, ensure_ascii=False) + '\n')
+        self._journal.flush()
+
+    def is_up_to_date(self, pdf_path, fingerprint):
+        """PDFが存在し、記録されたハッシュと一致するか"""
+        entry = self.entries.get(self._key(pdf_path))
+        return bool(entry) and entry.get('fingerprint') == fingerprint and Path(pdf_path).exists()
+
+    def record(self, pdf_path, fingerprint):
+        """PDFのハッシュを記録"""
+        key = self._key(pdf_path)
+        with self._lock:
+            self.entries[key] = {'fingerprint': fingerprint}
+            self._append_journal(key, fingerprint)
+
+    def discard(self, pdf_path):
+        """PDFの記録を削除（変換に失敗した場合など）"""
+        key = self._key(pdf_path)
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                self._append_journal(key, None)
+
+    def save(self):
+        """マニフェストを書き込み、反映済みのジャーナルを削除"""
+        with self._lock:
+            temp_path = self.path.with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'files': self.entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            try:
+                self.journal_path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,211 @@
+"""
+Per-conversion results and batch metrics export
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from .logger import logger
+
+# 変換の段階（process_file の read, render と html_to_pdf の load, wait, print, write、
+# レンダーキャッシュから復元した場合は load から write の代わりに cache）
+STAGES = ('read', 'render', 'load', 'wait', 'print', 'write', 'cache')
+
+# Prometheus のメトリクス名の接頭辞
+PROMETHEUS_PREFIX = 'md2pdf'
+
+
+def percentile(values, q):
+    """値のリストのパーセンタイル（最近傍法、空の場合は 0.0）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ConversionResult:
+    """1件の変換結果
+
+    真偽値としては変換の成否を表すため、従来どおり if process_file(...) で判定できる。
+    ページ数は page_count を参照したときに初めてPDFから読み込む。
+    retryable はブラウザの段階で失敗した（別のブラウザでやり直せば成功する可能性がある）ことを表す。
+    """
+
+    def __init__(self, input_path, output_path, ok=False, error=None):
+        self.input_path = Path(input_path)
+        self.output_path = Path(output_path)
+        self.ok = ok
+        self.error = error
+        self.stages = {}
+        self.html_bytes = 0
+        self.pdf_bytes = 0
+        self.cache = {}
+        self.retryable = False
+        self.attempts = 1
+        self._page_count = None
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"ConversionResult({str(self.input_path)!r}, ok={self.ok})"
+
+    @property
+    def duration(self):
+        """全段階の合計時間（秒）"""
+        return sum(self.stages.values())
+
+    @property
+    def page_count(self):
+        """出力PDFのページ数（失敗した場合は 0）"""
+        if self._page_count is None:
+            self._page_count = 0
+            if self.ok:
+                try:
+                    from PyPDF2 import PdfReader
+                    self._page_count = len(PdfReader(str(self.output_path)).pages)
+                except Exception as e:
+                    logger.warning(f"ページ数の取得に失敗しました: {self.output_path} - {str(e)}")
+        return self._page_count
+
+    def to_dict(self):
+        return {
+            'input': str(self.input_path),
+            'output': str(self.output_path),
+            'ok': self.ok,
+            'error': self.error,
+            'duration': self.duration,
+            'stages': self.stages,
+            'html_bytes': self.html_bytes,
+            'pdf_bytes': self.pdf_bytes,
+            'pages': self.page_count,
+            'cache': self.cache,
+            'attempts': self.attempts,
+        }
+
+
+class BatchMetrics:
+    """一括変換の結果を集計し、JSON lines または Prometheus のテキスト形式で出力する"""
+
+    def __init__(self):
+        self.results = []
+        self.skipped = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, result):
+        """変換結果を追加（ワーカースレッドから呼び出してよい）"""
+        with self._lock:
+            self.results.append(result)
+
+    def skip(self, count=1):
+        """変換を省略したファイル数を追加（差分ビルド）"""
+        with self._lock:
+            self.skipped += count
+
+    def finish(self):
+        """計測を終了"""
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self):
+        """段階ごとの p50/p95 と処理件数・スループット"""
+        with self._lock:
+            results = list(self.results)
+        succeeded = [result for result in results if result.ok]
+        elapsed = self.elapsed
+
+        stages = {}
+        for stage in STAGES:
+            values = [result.stages[stage] for result in succeeded if stage in result.stages]
+            stages[stage] = {
+                'count': len(values),
+                'sum': sum(values),
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+            }
+        durations = [result.duration for result in succeeded]
+
+        return {
+            'files': len(results),
+            'succeeded': len(succeeded),
+            'failed': len(results) - len(succeeded),
+            'skipped': self.skipped,
+            'elapsed': elapsed,
+            'files_per_sec': len(succeeded) / elapsed if elapsed > 0 else 0.0,
+            'duration': {'p50': percentile(durations, 0.50), 'p95': percentile(durations, 0.95)},
+            'stages': stages,
+            'html_bytes': sum(result.html_bytes for result in succeeded),
+            'pdf_bytes': sum(result.pdf_bytes for result in succeeded),
+            'pages': sum(result.page_count for result in succeeded),
+        }
+
+    def format_summary(self):
+        """ログ出力用の集計文字列"""
+        summary = self.summary()
+        stages = ", ".join(
+            f"{stage} p50 {s['p50'] * 1000:.0f}ms/p95 {s['p95'] * 1000:.0f}ms"
+            for stage, s in summary['stages'].items() if s['count']
+        )
+        return (f"{summary['succeeded']}/{summary['files']} files in {summary['elapsed']:.2f}s "
+                f"({summary['files_per_sec']:.2f} files/s); {stages}")
+
+    def write_json_lines(self, path):
+        """変換結果を1行1件、最後の行に集計を書き込む"""
+        with self._lock:
+            results = list(self.results)
+        lines = [json.dumps(dict(result.to_dict(), type='conversion'), ensure_ascii=False) for result in results]
+        lines.append(json.dumps(dict(self.summary(), type='summary'), ensure_ascii=False))
+        _write_atomic(path, '\n'.join(lines) + '\n')
+        logger.info(f"Metrics written: {path}")
+
+    def write_prometheus(self, path):
+        """node_exporter の textfile collector 用のテキスト形式で書き込む"""
+        summary = self.summary()
+        name = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {name}_files Number of files in the last batch by status.",
+            f"# TYPE {name}_files gauge",
+        ]
+        for status in ('succeeded', 'failed', 'skipped'):
+            lines.append(f'{name}_files{{status="{status}"}} {summary[status]}')
+        lines += [
+            f"# HELP {name}_batch_duration_seconds Wall-clock time of the last batch.",
+            f"# TYPE {name}_batch_duration_seconds gauge",
+            f"{name}_batch_duration_seconds {summary['elapsed']:.6f}",
+            f"# HELP {name}_files_per_second Converted files per second in the last batch.",
+            f"# TYPE {name}_files_per_second gauge",
+            f"{name}_files_per_second {summary['files_per_sec']:.6f}",
+            f"# HELP {name}_stage_seconds Time spent per conversion stage in the last batch.",
+            f"# TYPE {name}_stage_seconds summary",
+        ]
+        for stage, s in summary['stages'].items():
+            for quantile in ('p50', 'p95'):
+                lines.append(f'{name}_stage_seconds{{stage="{stage}",quantile="0.{quantile[1:]}"}} {s[quantile]:.6f}')
+            lines.append(f'{name}_stage_seconds_sum{{stage="{stage}"}} {s["sum"]:.6f}')
+            lines.append(f'{name}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        for key, help_text in (('html_bytes', 'HTML bytes rendered'), ('pdf_bytes', 'PDF bytes written'),
+                               ('pages', 'PDF pages written')):
+            lines += [
+                f"# HELP {name}_{key} {help_text} in the last batch.",
+                f"# TYPE {name}_{key} gauge",
+                f"{name}_{key} {summary[key]}",
+            ]
+        _write_atomic(path, '\n'.join(lines) + '\n')
+        logger.info(f"Metrics written: {path}")
+
+
+def _write_atomic(path, text):
+    """一時ファイルに書き込んでから置き換える（読み込み途中のファイルを見せない）"""
+    path = Path(path)
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
@@ -3,193 +3,1006 @@ PDF generation and manipulation functions
 """
 
 import base64
+import contextlib
+import hashlib
+import html
+import io
 import os
-import tempfile
-from io import BytesIO
+import threading
+import time
+import zlib
+from array import array
 from pathlib import Path
 
-from PyPDF2 import PdfMerger, PdfReader, PdfWriter
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-
 from config.config import PDF_CONFIG
 from core.logger import logger
+from core.render_cache import get_render_cache
+
+
+# PDF生成オプション（フッターなし）
+PDF_PRINT_OPTIONS = {
+    'landscape': False,
+    'displayHeaderFooter': False,
+    'printBackground': True,
+    'preferCSSPageSize': True,
+    'paperWidth': 9.00,
+    'paperHeight': 13.5,
+    'marginTop': 0.4,
+    'marginBottom': 0.4,
+    'marginLeft': 0.2,
+    'marginRight': 0.2,
+    'transferMode': 'ReturnAsStream',  # PDFを分割して受け取る
+}
+
+# 重複を除く辞書オブジェクトの /Type（ページやカタログは同じ内容でも別のオブジェクトである必要がある）
+_SHARABLE_TYPES = frozenset(('/Font', '/FontDescriptor', '/Encoding', '/ExtGState', '/XObject', '/Pattern', '/Shading'))
+
+# これより小さいストリームは圧縮しない
+_MIN_COMPRESS_SIZE = 64
+
+# ページツリーの親から引き継ぐページの属性
+_INHERITABLE_PAGE_KEYS = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+# メディアボックスのないページの大きさ（US Letter）
+_DEFAULT_MEDIABOX = (0, 0, 612, 792)
+
+# フッター用フォントのリソース名
+_FOOTER_FONT_RESOURCE = '/FMd2pdfFooter'
+
+# printToPDFのストリームから一度に読み出すサイズ
+PDF_STREAM_CHUNK_SIZE = 1024 * 1024
+
+# ページの読み込み完了を待つ秒数のデフォルト
+DEFAULT_READY_TIMEOUT = 10
+
+# load イベント・Webフォント・画像の読み込み完了を待つスクリプト（%d はミリ秒の期限）
+_READY_SCRIPT = """
+new Promise((resolve) => {
+    const timer = setTimeout(() => resolve(false), %d);
+    const loaded = document.readyState === 'complete'
+        ? Promise.resolve()
+        : new Promise((r) => window.addEventListener('load', r, {once: true}));
+    loaded
+        .then(() => document.fonts.ready)
+        .then(() => Promise.all(Array.from(document.images, (img) => img.complete
+            ? Promise.resolve()
+            : new Promise((r) => {
+                img.addEventListener('load', r, {once: true});
+                img.addEventListener('error', r, {once: true});
+            }))))
+        .then(() => { clearTimeout(timer); resolve(true); });
+})
+"""
 
+# 読み込みに失敗した（読み込み完了後も幅が0の）画像の数を返すスクリプト
+_BROKEN_IMAGES_SCRIPT = "Array.from(document.images).filter((img) => img.complete && !img.naturalWidth).length"
 
-def html_to_pdf(driver, html_content, pdf_path, source_dir=None):
-    """HTMLをPDFに変換"""
-    logger.debug(f"html_to_pdf開始: pdf_path={pdf_path}")
+
+def _open_output(pdf_path):
+    """書き込み先を開く（ファイルのようなオブジェクトはそのまま使い、閉じない）"""
+    if hasattr(pdf_path, 'write'):
+        return contextlib.nullcontext(pdf_path)
+    return open(pdf_path, 'wb')
+
+
+class _TeeOutput:
+    """書き込んだデータを複数のファイルに書き込む"""
     
+    def __init__(self, *files):
+        self.files = files
+    
+    def write(self, data):
+        for f in self.files:
+            f.write(data)
+        return len(data)
+
+
+def _output_name(pdf_path):
+    """ログ用の書き込み先の名前"""
+    if hasattr(pdf_path, 'write'):
+        return getattr(pdf_path, 'name', None) or f'<{type(pdf_path).__name__}>'
+    return pdf_path
+
+
+def _write_print_result(driver, result, pdf_path):
+    """Page.printToPDF の結果をファイル（またはファイルのようなオブジェクト）に書き込み、書き込んだバイト数を返す
+    
+    ストリーム（IO ハンドル）で返された場合は分割して読み出すため、
+    PDF全体をメモリに保持しない。
+    """
+    handle = result.get('stream')
+    if not handle:
+        # ストリーム転送に対応していない場合は一括で受け取ったデータを書き込む
+        pdf_data = base64.b64decode(result['data'])
+        with _open_output(pdf_path) as f:
+            f.write(pdf_data)
+        return len(pdf_data)
+    
+    size = 0
     try:
-        # 一時HTMLファイルを作成（source_dirが指定されている場合はそこに作成）
-        logger.debug("一時HTMLファイル作成開始")
-        if source_dir and Path(source_dir).exists():
-            # 元のMarkdownファイルと同じディレクトリに一時ファイルを作成
-            # これにより相対パスの画像参照が正しく解決される
-            temp_html_path = Path(source_dir) / f"temp_{os.getpid()}_{id(html_content)}.html"
-            with open(temp_html_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            logger.debug(f"一時HTMLファイル作成完了（元ディレクトリ内）: {temp_html_path}")
-        else:
-            # フォールバック：システムの一時ディレクトリを使用
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
-                f.write(html_content)
-                temp_html_path = f.name
-            logger.debug(f"一時HTMLファイル作成完了（システムtemp）: {temp_html_path}")
+        with _open_output(pdf_path) as f:
+            while True:
+                chunk = driver.execute_cdp_cmd('IO.read', {'handle': handle, 'size': PDF_STREAM_CHUNK_SIZE})
+                data = chunk.get('data', '')
+                if data:
+                    data = base64.b64decode(data) if chunk.get('base64Encoded') else data.encode('utf-8')
+                    f.write(data)
+                    size += len(data)
+                if chunk.get('eof', True):
+                    break
+    finally:
+        try:
+            driver.execute_cdp_cmd('IO.close', {'handle': handle})
+        except Exception as e:
+            logger.warning(f"PDFストリームのクローズに失敗しました: {str(e)}")
+    return size
+
+
+def _load_html(driver, html_content, source_dir=None):
+    """HTMLを一時ファイルを使わずにブラウザへ読み込む
+    
+    source_dir のディレクトリURLを開いてから文書の内容を差し替えるため、
+    相対パスの画像参照は source_dir を基準に解決される。
+    """
+    if source_dir and Path(source_dir).exists():
+        base_url = Path(source_dir).resolve().as_uri().rstrip('/') + '/'
+    else:
+        base_url = 'about:blank'
+    
+    logger.debug("ベースURL読み込み開始: %s", base_url)
+    driver.get(base_url)
+    frame_tree = driver.execute_cdp_cmd('Page.getFrameTree', {})
+    frame_id = frame_tree['frameTree']['frame']['id']
+    driver.execute_cdp_cmd('Page.setDocumentContent', {'frameId': frame_id, 'html': html_content})
+    logger.debug("HTML読み込み完了")
+
+
+def _wait_until_ready(driver, timeout):
+    """load イベント・Webフォント・画像の読み込み完了を待つ（期限切れの場合は False）"""
+    result = driver.execute_cdp_cmd('Runtime.evaluate', {
+        'expression': _READY_SCRIPT % int(timeout * 1000),
+        'awaitPromise': True,
+        'returnByValue': True,
+    })
+    return bool(result.get('result', {}).get('value'))
+
+
+def _count_broken_images(driver):
+    """読み込みに失敗した画像の数"""
+    result = driver.execute_cdp_cmd('Runtime.evaluate', {
+        'expression': _BROKEN_IMAGES_SCRIPT,
+        'returnByValue': True,
+    })
+    return int(result.get('result', {}).get('value') or 0)
+
+
+def footer_print_options(footer_text=None):
+    """Chromeのヘッダー・フッター機能でフッターとページ番号を印刷するオプション
+    
+    add_footer_to_pdf と同じ「クレジット - Page N of M」の形式で出力する。
+    """
+    if footer_text is None:
+        footer_text = PDF_CONFIG['CREDIT_STRING']
+    
+    footer_style = (
+        f"width: 100%; text-align: center; "
+        f"font-family: '{PDF_CONFIG['FOOTER_FONT']}', sans-serif; "
+        f"font-size: {PDF_CONFIG['FOOTER_FONT_SIZE']}pt;"
+    )
+    return {
+        'displayHeaderFooter': True,
+        'headerTemplate': '<span></span>',
+        'footerTemplate': (
+            f'<div style="{footer_style}">{html.escape(footer_text)} - '
+            f'Page <span class="pageNumber"></span> of <span class="totalPages"></span></div>'
+        ),
+    }
+
+
+def html_to_pdf(driver, html_content, pdf_path, source_dir=None, ready_timeout=None, pdf_options=None, timings=None):
+    """HTMLをPDFに変換
+    
+    pdf_path にはファイルのパスのほか、バイナリで書き込めるファイルのようなオブジェクト
+    （io.BytesIO やHTTPレスポンスなど）を渡せる。オブジェクトは閉じずにそのまま返す。
+    ページの load イベント、document.fonts.ready、すべての画像の読み込み完了を待ってから印刷する。
+    ready_timeout 秒（省略時は PDF_CONFIG['READY_TIMEOUT']）を過ぎた場合はその時点の状態で印刷する。
+    pdf_options は PDF_PRINT_OPTIONS に上書きする Page.printToPDF のオプション。
+    timings に辞書を渡すと、段階（load, wait, print, write）ごとの処理時間（秒）が記録される。
+    レンダーキャッシュ（core.render_cache）が有効な場合、同じHTML・アセット・印刷オプションのPDFが
+    キャッシュにあればブラウザを使わずにコピーし（段階は cache）、なければ印刷結果をキャッシュに保存する
+    （読み込みが期限内に終わらなかった場合や、読み込めなかった画像がある場合は保存しない）。
+    """
+    pdf_name = _output_name(pdf_path)
+    logger.debug("html_to_pdf開始: pdf_path=%s", pdf_name)
+    
+    if ready_timeout is None:
+        ready_timeout = PDF_CONFIG.get('READY_TIMEOUT', DEFAULT_READY_TIMEOUT)
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
+    
+    def lap(stage):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = now - started
+        started = now
+    
+    print_options = dict(PDF_PRINT_OPTIONS, **(pdf_options or {}))
+    render_cache = get_render_cache()
+    
+    try:
+        cache_key = None
+        # 読み込みが完了しないまま印刷した場合は True（キャッシュに保存しない）
+        degraded = False
+        if render_cache.enabled:
+            try:
+                capabilities = getattr(driver, 'capabilities', None) or {}
+                cache_key = render_cache.key(html_content, source_dir, print_options,
+                                             capabilities.get('browserVersion'))
+                if render_cache.fetch(cache_key, pdf_path):
+                    lap('cache')
+                    logger.info("PDF restored from render cache: %s", pdf_name)
+                    return True
+            except OSError as e:
+                logger.warning(f"レンダーキャッシュを使用できません: {str(e)}")
+                cache_key = None
         
         # HTMLを読み込み
-        file_url = f"file://{os.path.abspath(temp_html_path)}"
-        logger.debug(f"HTMLファイル読み込み開始: {file_url}")
-        
         try:
-            driver.get(file_url)
-            logger.debug("HTMLファイル読み込み完了")
+            _load_html(driver, html_content, source_dir)
+            lap('load')
         except Exception as e:
-            logger.error(f"HTMLファイル読み込みエラー: {str(e)}", exc_info=True)
+            logger.error(f"HTML読み込みエラー: {str(e)}", exc_info=True)
             return False
         
         # ページの読み込み完了を待つ
         try:
             logger.debug("ページ読み込み待機開始")
-            driver.implicitly_wait(3)
-            logger.debug("ページ読み込み待機完了")
+            if _wait_until_ready(driver, ready_timeout):
+                logger.debug("ページ読み込み待機完了")
+            else:
+                logger.warning(f"ページの読み込みが{ready_timeout}秒以内に完了しませんでした。現在の状態で印刷します: {pdf_name}")
+                degraded = True
+            # 読み込めなかった画像がある場合も、不完全な印刷結果をキャッシュに残さない
+            if cache_key and not degraded and _count_broken_images(driver):
+                logger.debug("読み込めなかった画像があるため、レンダーキャッシュに保存しません: %s", pdf_name)
+                degraded = True
+            lap('wait')
         except Exception as e:
             logger.error(f"ページ読み込み待機エラー: {str(e)}", exc_info=True)
             return False
         
-        # PDF生成オプション（フッターなし）
-        pdf_options = {
-            'landscape': False,
-            'displayHeaderFooter': False,
-            'printBackground': True,
-            'preferCSSPageSize': True,
-            'paperWidth': 9.00,
-            'paperHeight': 13.5,
-            'marginTop': 0.4,
-            'marginBottom': 0.4,
-            'marginLeft': 0.2,
-            'marginRight': 0.2,
-        }
-        logger.debug(f"PDF生成オプション: {pdf_options}")
+        logger.debug("PDF生成オプション: %s", print_options)
         
         try:
             logger.debug("PDF生成開始（execute_cdp_cmd）")
-            result = driver.execute_cdp_cmd('Page.printToPDF', pdf_options)
-            logger.debug(f"PDF生成完了: データサイズ={len(result.get('data', ''))} bytes")
-            pdf_data = base64.b64decode(result['data'])
-            logger.debug(f"base64デコード完了: {len(pdf_data)} bytes")
+            result = driver.execute_cdp_cmd('Page.printToPDF', print_options)
+            lap('print')
+            logger.debug("PDF生成完了")
         except Exception as e:
             logger.error(f"PDF生成エラー: {str(e)}", exc_info=True)
             return False
         
         try:
-            logger.debug(f"PDFファイル書き込み開始: {pdf_path}")
-            with open(pdf_path, 'wb') as f:
-                f.write(pdf_data)
-            logger.debug("PDFファイル書き込み完了")
+            logger.debug("PDFファイル書き込み開始: %s", pdf_name)
+            with contextlib.ExitStack() as stack:
+                output = stack.enter_context(_open_output(pdf_path))
+                if cache_key and not degraded:
+                    # 出力とキャッシュに同時に書き込む
+                    try:
+                        output = _TeeOutput(output, stack.enter_context(render_cache.writer(cache_key)))
+                    except OSError as e:
+                        logger.warning(f"レンダーキャッシュに保存できません: {str(e)}")
+                size = _write_print_result(driver, result, output)
+            lap('write')
+            logger.debug("PDFファイル書き込み完了: %d bytes", size)
         except Exception as e:
             logger.error(f"PDFファイル書き込みエラー: {str(e)}", exc_info=True)
             return False
             
-        logger.info(f"PDF saved: {pdf_path}")
+        logger.info("PDF saved: %s", pdf_name)
         return True
         
     except Exception as e:
         logger.error(f"html_to_pdf で予期せぬエラー: {str(e)}", exc_info=True)
         return False
-    finally:
-        # 一時ファイルを削除
-        if 'temp_html_path' in locals():
-            try:
-                logger.debug(f"一時ファイル削除: {temp_html_path}")
-                if isinstance(temp_html_path, Path):
-                    temp_html_path.unlink(missing_ok=True)
-                else:
-                    os.unlink(temp_html_path)
-                logger.debug("一時ファイル削除完了")
-            except Exception as e:
-                logger.warning(f"一時ファイル削除エラー: {str(e)}", exc_info=True)
+
+
+def _pdf_string(text):
+    """フッター用のPDF文字列リテラル（標準フォントの WinAnsiEncoding）"""
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _content_stream(data):
+    """コンテンツストリームを作成"""
+    from PyPDF2.generic import DecodedStreamObject
+    
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return stream
+
+
+def _footer_font():
+    """フッター用の標準14フォントの辞書"""
+    from PyPDF2.generic import DictionaryObject, NameObject
+    
+    font_name = PDF_CONFIG['FOOTER_FONT']
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/' + font_name),
+    })
+    if font_name not in ('Symbol', 'ZapfDingbats'):
+        font[NameObject('/Encoding')] = NameObject('/WinAnsiEncoding')
+    return font
+
+
+def _footer_content(footer_text, page_number, total_pages, box):
+    """「クレジット - Page N of M」をページ下部の中央に描画するコンテンツ（box はメディアボックスの左・下・幅）"""
+    from reportlab.pdfbase import pdfmetrics
+    
+    font_name = PDF_CONFIG['FOOTER_FONT']
+    font_size = PDF_CONFIG['FOOTER_FONT_SIZE']
+    full_footer = f"{footer_text} - Page {page_number} of {total_pages}"
+    left, bottom, width = box
+    
+    # フッターテキストを中央に配置
+    text_width = pdfmetrics.stringWidth(full_footer, font_name, font_size)
+    x_position = left + (width - text_width) / 2
+    y_position = bottom + PDF_CONFIG['FOOTER_MARGIN'] - 8
+    return b'BT /%s %g Tf %.2f %.2f Td %s Tj ET\n' % (
+        _FOOTER_FONT_RESOURCE[1:].encode('ascii'), font_size, x_position, y_position, _pdf_string(full_footer))
+
+
+def _footer_box(mediabox):
+    """フッターの位置の計算に使うメディアボックスの左・下・幅"""
+    left, bottom, right, top = (float(value) for value in mediabox)
+    return min(left, right), min(bottom, top), abs(right - left)
 
 
 def add_footer_to_pdf(input_pdf_path, output_pdf_path, footer_text=None, start_page_number=1):
-    """PDFにフッターとページ番号を追加"""
+    """PDFにフッターとページ番号を追加
+    
+    ページは1枚ずつ読み込み、フッターを付けて書き出した後に解放する（PdfBookWriter を参照）。
+    残るのは入力の相互参照表とページごとの番号・位置だけで、1ページあたり1KiB程度しか増えない。
+    """
+    book = PdfBookWriter(output_pdf_path, footer_text, isolate_destinations=False,
+                         start_page_number=start_page_number)
+    try:
+        book.append(input_pdf_path)
+        book.close()
+        
+        logger.debug("Footer added to PDF: %s", output_pdf_path)
+        return True
+        
+    except Exception as e:
+        book.discard()
+        logger.error(f"Error adding footer to PDF: {e}")
+        return False
+
+
+def _is_sharable(obj):
+    from PyPDF2.generic import ArrayObject, DictionaryObject, StreamObject
+    
+    if isinstance(obj, StreamObject):
+        return obj.get('/Type') != '/Metadata'
+    if isinstance(obj, DictionaryObject):
+        return obj.get('/Type') in _SHARABLE_TYPES
+    return isinstance(obj, ArrayObject)
+
+
+def deduplicate_objects(writer):
+    """内容が同じ間接オブジェクト（フォント・画像・ストリームなど）を1つにまとめ、まとめた数を返す
+    
+    参照先までまとめて比較するため、フォントファイルが同じになればフォント記述子・フォント辞書も
+    順にまとめられる。不要になったオブジェクトは null に置き換える（オブジェクト番号は変えない）。
+    書き込み直前のライター（外部のPDFへの参照を取り込み済み）に対して呼び出す。
+    """
+    from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NullObject, StreamObject
+    
+    canonical = {}
+    stream_digests = {}
+    
+    def resolve(idnum):
+        while idnum in canonical:
+            idnum = canonical[idnum]
+        return idnum
+    
+    def key_of(obj):
+        if isinstance(obj, IndirectObject):
+            return ('ref', resolve(obj.idnum))
+        if isinstance(obj, StreamObject):
+            digest = stream_digests.get(id(obj))
+            if digest is None:
+                digest = stream_digests[id(obj)] = hashlib.sha256(obj._data or b'').digest()
+            return ('stream', digest, tuple(sorted((k, key_of(v)) for k, v in obj.items() if k != '/Length')))
+        if isinstance(obj, DictionaryObject):
+            return ('dict', tuple(sorted((k, key_of(v)) for k, v in obj.items())))
+        if isinstance(obj, ArrayObject):
+            return ('array', tuple(key_of(v) for v in obj))
+        return (type(obj).__name__, repr(obj))
+    
+    # 参照先がまとめられると参照元も同じ内容になるため、変化がなくなるまで繰り返す
+    changed = True
+    while changed:
+        changed = False
+        seen = {}
+        for index, obj in enumerate(writer._objects):
+            idnum = index + 1
+            if idnum in canonical or not _is_sharable(obj):
+                continue
+            first = seen.setdefault(key_of(obj), idnum)
+            if first != idnum:
+                canonical[idnum] = first
+                changed = True
+    
+    if not canonical:
+        return 0
+    
+    def replace_refs(obj):
+        items = obj.items() if isinstance(obj, DictionaryObject) else enumerate(obj)
+        for key, value in list(items):
+            if isinstance(value, IndirectObject):
+                if value.idnum in canonical:
+                    obj[key] = IndirectObject(resolve(value.idnum), 0, writer)
+            elif isinstance(value, (DictionaryObject, ArrayObject)):
+                replace_refs(value)
+    
+    for obj in writer._objects:
+        if isinstance(obj, (DictionaryObject, ArrayObject)):
+            replace_refs(obj)
+    for idnum in canonical:
+        writer._objects[idnum - 1] = NullObject()
+    return len(canonical)
+
+
+def compress_streams(writer):
+    """圧縮されていないストリーム（フッターなど）を Flate で圧縮し、圧縮した数を返す"""
+    from PyPDF2.generic import NameObject, StreamObject
+    
+    count = 0
+    for index, obj in enumerate(writer._objects):
+        if (not isinstance(obj, StreamObject) or '/Filter' in obj or obj.get('/Type') == '/Metadata'
+                or len(obj._data or b'') < _MIN_COMPRESS_SIZE):
+            continue
+        encoded = obj.flate_encode()
+        for key, value in obj.items():
+            if key not in ('/Filter', '/Length'):
+                encoded[NameObject(key)] = value
+        writer._objects[index] = encoded
+        count += 1
+    return count
+
+
+def optimize_writer(writer):
+    """書き込み前のライターから重複したオブジェクトを除き、ストリームを圧縮する"""
+    if not writer._root:
+        writer._root = writer._add_object(writer._root_object)
+    # 読み込んだPDFのオブジェクトをライターに取り込んでから比較する
+    writer._sweep_indirect_references(writer._root)
+    removed = deduplicate_objects(writer)
+    compressed = compress_streams(writer)
+    logger.info(f"PDF optimized: {removed} duplicate objects removed, {compressed} streams compressed")
+
+
+def optimize_pdf_file(pdf_path):
+    """PDFファイルを読み込み、重複したオブジェクトをまとめて圧縮・線形化して保存し直す"""
+    from PyPDF2 import PdfReader, PdfWriter
+    
+    pdf_path = Path(pdf_path)
     try:
-        reader = PdfReader(input_pdf_path)
         writer = PdfWriter()
+        writer.clone_document_from_reader(PdfReader(str(pdf_path)))
+        optimize_writer(writer)
+        temp_path = pdf_path.with_suffix('.part')
+        with open(temp_path, 'wb') as output_file:
+            writer.write(output_file)
+        os.replace(temp_path, pdf_path)
+    except Exception as e:
+        logger.warning(f"PDFの最適化に失敗しました: {pdf_path} - {str(e)}")
+        return False
+    linearize_pdf(pdf_path)
+    return True
+
+
+def linearize_pdf(pdf_path):
+    """pikepdf（qpdf）がある場合はオブジェクトストリームを使ってWeb表示用に最適化（線形化）して保存し直す
+    
+    pikepdf がない場合は何もせずに False を返す。
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        logger.debug("pikepdf がインストールされていないため、線形化を省略します")
+        return False
+    
+    pdf_path = Path(pdf_path)
+    temp_path = pdf_path.with_suffix('.linearized')
+    try:
+        with pikepdf.open(pdf_path) as pdf:
+            pdf.remove_unreferenced_resources()
+            pdf.save(temp_path, linearize=True, compress_streams=True,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        os.replace(temp_path, pdf_path)
+        return True
+    except Exception as e:
+        logger.warning(f"PDFの線形化に失敗しました: {pdf_path} - {str(e)}")
+        if temp_path.exists():
+            temp_path.unlink()
+        return False
+
+
+def _ref_key(ref):
+    return ref.idnum, ref.generation
+
+
+def _indirect_refs(value):
+    """値に含まれる間接参照を列挙（ストリームの /Length は書き出し時に付け直すため除く）"""
+    from PyPDF2.generic import IndirectObject, StreamObject
+    
+    # PyPDF2 の型に対する isinstance は遅いため、辞書・配列は組み込みの型で判定する
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if isinstance(value, StreamObject):
+                stack.extend(item for key, item in value.items() if key != '/Length')
+            else:
+                stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif type(value) is IndirectObject:
+            yield value
+
+
+def _iter_pages(reader):
+    """ページツリーを順にたどり、ページへの参照と親から引き継ぐ属性を返す
+    
+    PdfReader.pages はすべてのページの辞書を読み込んで保持するため使わない。
+    """
+    stack = [(reader.trailer['/Root'].raw_get('/Pages'), {})]
+    while stack:
+        ref, inherited = stack.pop()
+        node = ref.get_object()
+        if '/Kids' in node:
+            inherited = dict(inherited)
+            inherited.update((key, node[key]) for key in _INHERITABLE_PAGE_KEYS if key in node)
+            stack.extend((kid, inherited) for kid in reversed(node['/Kids']))
+        else:
+            yield ref, inherited
+        _release_objects(reader)
+
+
+def _release_objects(reader):
+    """読み込んだオブジェクトのキャッシュを解放（オブジェクトストリームはページごとに展開し直さないよう残す）"""
+    from PyPDF2.generic import StreamObject
+    
+    reader.resolved_objects = {key: obj for key, obj in reader.resolved_objects.items()
+                               if isinstance(obj, StreamObject) and obj.get('/Type') == '/ObjStm'}
+
+
+def _serialize(obj):
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer, None)
+    return buffer.getvalue()
+
+
+class _PdfStreamWriter:
+    """オブジェクトを1つずつ出力ファイルに書き出すPDFライター
+    
+    読み込んだPDFの値は copy() で参照先ごと書き出し、書き出したオブジェクトは保持しない。
+    保持するのは相互参照表（オブジェクトごとの位置）と、読み込み中の文書のオブジェクト番号の対応だけ。
+    optimize=True の場合は共有できるオブジェクトを内容のハッシュでまとめ、ストリームを圧縮する。
+    """
+    
+    def __init__(self, output, optimize=False):
+        self.output = output
+        self.optimize = optimize
+        self.removed = 0
+        self.compressed = 0
+        # オブジェクト番号ごとの位置（0 は未使用・未書き出し）
+        self._offsets = array('q', [0])
+        self._position = 0
+        self._digests = {}
+        self._refs = {}
+        self._reserved = {}
+        self._emit(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+    
+    def _emit(self, data):
+        self.output.write(data)
+        self._position += len(data)
+    
+    def reserve(self):
+        """後で書き出すオブジェクトの番号を確保"""
+        self._offsets.append(0)
+        return len(self._offsets) - 1
+    
+    def write(self, idnum, obj, data=None):
+        """確保した番号でオブジェクトを書き出す"""
+        self._offsets[idnum] = self._position
+        self._emit(b'%d 0 obj\n%s\nendobj\n' % (idnum, _serialize(obj) if data is None else data))
+    
+    def add(self, obj, sharable=False):
+        """オブジェクトを書き出して参照を返す（sharable=True の場合は同じ内容の書き出し済みオブジェクトを使う）"""
+        from PyPDF2.generic import IndirectObject
         
-        if footer_text is None:
-            footer_text = PDF_CONFIG['CREDIT_STRING']
+        data = _serialize(obj)
+        digest = None
+        if self.optimize and sharable:
+            digest = hashlib.sha256(data).digest()
+            if digest in self._digests:
+                self.removed += 1
+                return IndirectObject(self._digests[digest], 0, None)
+        idnum = self.reserve()
+        self.write(idnum, obj, data)
+        if digest is not None:
+            self._digests[digest] = idnum
+        return IndirectObject(idnum, 0, None)
+    
+    def begin(self, page_refs):
+        """読み込んだ文書の書き出しを始め、ページに割り当てたオブジェクト番号を返す
         
-        total_pages = len(reader.pages)
+        ページは write() で呼び出し側が書き出す（ページへの参照は割り当てた番号に付け替える）。
+        """
+        self._refs = {}
+        self._reserved = {}
+        for ref in page_refs:
+            if _ref_key(ref) not in self._reserved:
+                self._reserved[_ref_key(ref)] = self.reserve()
+        return [self._reserved[_ref_key(ref)] for ref in page_refs]
+    
+    def end(self):
+        """読み込んだ文書のオブジェクト番号の対応を捨てる"""
+        self._refs = {}
+        self._reserved = {}
+    
+    def copy(self, value):
+        """読み込んだPDFの値を、参照先を書き出したうえで書き出し先の番号に付け替えて返す"""
+        self._copy_refs(value)
+        return self._remap(value)
+    
+    def _is_new(self, key, visiting):
+        return key not in self._refs and key not in self._reserved and key not in visiting
+    
+    def _copy_refs(self, value):
+        """値から参照されているオブジェクトを、参照先から順に書き出す"""
+        from PyPDF2.generic import NullObject
         
-        for page_num, page in enumerate(reader.pages):
-            # 新しいPDFキャンバスを作成してフッターを描画
-            packet = BytesIO()
-            can = canvas.Canvas(packet, pagesize=letter)
+        visiting = {}
+        stack = [ref for ref in _indirect_refs(value) if self._is_new(_ref_key(ref), visiting)]
+        while stack:
+            ref = stack[-1]
+            key = _ref_key(ref)
+            if key in self._refs:
+                stack.pop()
+                continue
+            if key not in visiting:
+                obj = ref.get_object()
+                if obj is None:
+                    obj = NullObject()
+                children = list(_indirect_refs(obj))
+                visiting[key] = obj, children
+                stack.extend(child for child in children if self._is_new(_ref_key(child), visiting))
+                continue
             
-            # ページサイズを取得
-            page_width = float(page.mediabox.width)
-            page_height = float(page.mediabox.height)
-            
-            # フッター全体のテキストを作成
-            page_text = f"Page {start_page_number + page_num} of {total_pages}"
-            full_footer = f"{footer_text} - {page_text}"
-            
-            # フッターテキストを中央に配置
-            can.setFont(PDF_CONFIG['FOOTER_FONT'], PDF_CONFIG['FOOTER_FONT_SIZE'])
-            text_width = can.stringWidth(full_footer, PDF_CONFIG['FOOTER_FONT'], PDF_CONFIG['FOOTER_FONT_SIZE'])
-            x_position = (page_width - text_width) / 2
-            can.drawString(x_position, PDF_CONFIG['FOOTER_MARGIN'] - 8, full_footer)
-            
-            can.save()
-            packet.seek(0)
-            
-            # フッター付きのページを作成
-            footer_pdf = PdfReader(packet)
-            page.merge_page(footer_pdf.pages[0])
-            writer.add_page(page)
+            obj, children = visiting.pop(key)
+            for child in children:
+                child_key = _ref_key(child)
+                if child_key not in self._refs and child_key not in self._reserved:
+                    # 書き出し中のオブジェクトへの循環参照には番号だけ先に割り当てる
+                    self._reserved[child_key] = self.reserve()
+            stack.pop()
+            if key in self._reserved:
+                self.write(self._reserved[key], self._remap(obj))
+                self._refs[key] = self._reserved[key]
+            else:
+                self._refs[key] = self.add(self._remap(obj), sharable=_is_sharable(obj)).idnum
+    
+    def _remap(self, value):
+        """書き出し済みのオブジェクトの番号に付け替えた値を作成"""
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
         
-        # 結果を保存
-        with open(output_pdf_path, 'wb') as output_file:
-            writer.write(output_file)
+        def remap(value):
+            if isinstance(value, dict):
+                if isinstance(value, StreamObject):
+                    return remap_stream(value)
+                return DictionaryObject((key, remap(item)) for key, item in value.items())
+            if isinstance(value, list):
+                return ArrayObject(remap(item) for item in value)
+            if type(value) is IndirectObject:
+                key = _ref_key(value)
+                return IndirectObject(self._refs[key] if key in self._refs else self._reserved[key], 0, None)
+            return value
         
-        logger.debug(f"Footer added to PDF: {output_pdf_path}")
-        return True
+        def remap_stream(value):
+            stream = StreamObject()
+            for key, item in value.items():
+                if key != '/Length':
+                    stream[key] = remap(item)
+            data = value._data or b''
+            if (self.optimize and '/Filter' not in value and value.get('/Type') != '/Metadata'
+                    and len(data) >= _MIN_COMPRESS_SIZE):
+                stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+                data = zlib.compress(data)
+                self.compressed += 1
+            stream._data = data
+            return stream
         
-    except Exception as e:
-        logger.error(f"Error adding footer to PDF: {e}")
-        return False
+        return remap(value)
+    
+    def finish(self, root):
+        """相互参照表とトレーラーを書き出す"""
+        from PyPDF2.generic import NullObject
+        
+        # 確保したまま書き出さなかった番号（途中で失敗した文書など）は null にする
+        for idnum in range(1, len(self._offsets)):
+            if not self._offsets[idnum]:
+                self.write(idnum, NullObject())
+        xref = self._position
+        self._emit(b'xref\n0 %d\n0000000000 65535 f \n' % len(self._offsets))
+        for offset in self._offsets[1:]:
+            self._emit(b'%010d 00000 n \n' % offset)
+        self._emit(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                   % (len(self._offsets), root.idnum, xref))
 
 
-def merge_pdfs(pdf_files, output_path):
-    """複数のPDFファイルを1つにマージし、連続したページ番号を付ける"""
-    try:
-        # 一時的なマージファイルを作成
-        temp_merged_path = output_path.with_suffix('.temp.pdf')
+class PdfBookWriter:
+    """PDFを順に結合し、連続したページ番号を付けて1回の書き込みで出力するライター
+    
+    put(index, pdf_path) は変換が終わった順に呼び出してよく、ページは index の順に追加される。
+    変換に失敗したファイルは put(index, None) で飛ばす。
+    追加したページはその場で出力ファイル（.part）に書き出し、読み込んだPDFのオブジェクトはページごとに解放する。
+    結合が終わるまで保持するのはページ・オブジェクトごとの番号や位置と出力先の表
+    （optimize=True の場合は共有できるオブジェクトのハッシュも）だけで、メモリ使用量は結合するページの内容の量によらない。フッターは総ページ数が決まる close() で書き出す。
+    各PDFの名前付き出力先（文書内リンクの飛び先）は文書ごとに別名を付けて引き継ぐ。
+    optimize=True の場合は文書間で重複するフォント・画像などをまとめ、ストリームを圧縮して書き込む
+    （pikepdf がある場合はさらに線形化する）。close() しない場合は discard() で書きかけのファイルを削除する。
+    ページ番号は start_page_number から数え、総ページ数は結合したページの数とする。
+    """
+    
+    def __init__(self, output_path, footer_text=None, isolate_destinations=True, optimize=False,
+                 start_page_number=1):
+        from PyPDF2.generic import DictionaryObject
         
-        merger = PdfMerger()
+        self.output_path = Path(output_path)
+        self.footer_text = footer_text
+        self.isolate_destinations = isolate_destinations
+        self.optimize = optimize
+        self.start_page_number = start_page_number
+        self.page_count = 0
+        self._temp_path = self.output_path.with_suffix('.part')
+        self._file = None
+        self._writer = None
+        self._kids = []
+        self._footers = []
+        self._dests = DictionaryObject()
+        self._pending = {}
+        self._next_index = 0
+        self._document_count = 0
+        self._lock = threading.Lock()
+    
+    def put(self, index, pdf_path):
+        """index 番目のPDFを渡す（前のPDFがそろった時点で結合される）"""
+        with self._lock:
+            self._pending[index] = pdf_path
+            while self._next_index in self._pending:
+                pdf_path = self._pending.pop(self._next_index)
+                if pdf_path is not None:
+                    self.append(pdf_path)
+                self._next_index += 1
+    
+    @property
+    def received(self):
+        """先頭から順番がそろって結合された（失敗して飛ばしたものも含む）PDFの数"""
+        with self._lock:
+            return self._next_index
+    
+    def _open(self):
+        """出力ファイルを開き、全ページで共有するオブジェクトを書き出す"""
+        from PyPDF2.generic import IndirectObject
         
-        for pdf_file in pdf_files:
-            logger.debug(f"Adding PDF to merge: {pdf_file}")
-            merger.append(str(pdf_file))
-        
-        # 一時的にマージしたPDFを保存
-        merger.write(str(temp_merged_path))
-        merger.close()
-        
-        # マージしたPDFに連続したページ番号でフッターを追加
-        logger.info(f"Adding continuous page numbers to merged PDF...")
-        if add_footer_to_pdf(temp_merged_path, output_path, start_page_number=1):
-            # 一時ファイルを削除
-            temp_merged_path.unlink()
-            logger.info(f"✓ Merged PDF with page numbers saved: {output_path}")
-            return True
-        else:
-            # フッター追加に失敗した場合は、一時ファイルを最終ファイルとして使用
-            temp_merged_path.rename(output_path)
-            logger.warning(f"✓ Merged PDF saved (without page numbers): {output_path}")
-            return True
+        self._file = open(self._temp_path, 'wb')
+        self._writer = _PdfStreamWriter(self._file, optimize=self.optimize)
+        self._pages_ref = IndirectObject(self._writer.reserve(), 0, None)
+        self._font_ref = self._writer.add(_footer_font())
+        # 元の描画のグラフィックス状態がフッターに影響しないように囲む
+        self._push_ref = self._writer.add(_content_stream(b'q\n'))
+        self._pop_ref = self._writer.add(_content_stream(b'\nQ\n'))
+    
+    def append(self, pdf_path):
+        """PDFのページを末尾に追加して書き出す"""
+        from PyPDF2 import PdfReader
+        
+        logger.debug("Adding PDF to merge: %s", pdf_path)
+        if self._writer is None:
+            self._open()
+        # ファイル全体をメモリに読み込まず、必要なオブジェクトだけをファイルから読む
+        with open(pdf_path, 'rb') as input_file:
+            reader = PdfReader(input_file)
+            # 他のページへの参照（リンクなど）を付け替えられるように、先にすべてのページに番号を割り当てる
+            pages = list(_iter_pages(reader))
+            page_ids = self._writer.begin([ref for ref, inherited in pages])
+            try:
+                dests, renamed = self._copy_destinations(reader, pages, page_ids)
+                footers = []
+                for (ref, inherited), page_id in zip(pages, page_ids):
+                    page = ref.get_object()
+                    if renamed:
+                        _rename_link_destinations(page, renamed)
+                    footers.append(self._write_page(page, inherited, page_id))
+                    # 書き出したページのオブジェクトを解放してから次のページを読み込む
+                    _release_objects(reader)
+            finally:
+                self._writer.end()
+        
+        # 文書の途中で失敗した場合は、書き出したページをページツリーに加えない
+        self._kids.extend(page_ids)
+        self._footers.extend(footers)
+        self._dests.update(dests)
+        self.page_count += len(page_ids)
+        self._document_count += 1
+    
+    def _write_page(self, page, inherited, page_id):
+        """ページを書き出し、フッターのオブジェクト番号と位置を返す（inherited は親から引き継ぐ属性）"""
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+        
+        writer = self._writer
+        new_page = DictionaryObject()
+        for key, value in list(inherited.items()) + list(page.items()):
+            if key not in ('/Parent', '/Contents', '/Resources'):
+                new_page[key] = writer.copy(value)
+        new_page[NameObject('/Parent')] = self._pages_ref
+        
+        # 元のコンテンツストリームを q/Q で囲み、後ろにフッターのストリームを追加する
+        contents = page.raw_get('/Contents') if '/Contents' in page else ArrayObject()
+        if isinstance(contents, IndirectObject) and isinstance(contents.get_object(), ArrayObject):
+            contents = contents.get_object()
+        if not isinstance(contents, ArrayObject):
+            contents = ArrayObject([contents])
+        contents = [writer.copy(ref) if isinstance(ref, IndirectObject) else writer.add(writer.copy(ref))
+                    for ref in contents]
+        footer_id = writer.reserve()
+        new_page[NameObject('/Contents')] = ArrayObject(
+            [self._push_ref] + contents + [self._pop_ref, IndirectObject(footer_id, 0, None)])
+        
+        # フォントをリソースに追加（元のリソースは他のページと共有していることがあるため写しに追加する）
+        resources = page.get('/Resources', inherited.get('/Resources'))
+        resources = resources.get_object() if resources is not None else DictionaryObject()
+        fonts = resources.get('/Font')
+        fonts = writer.copy(fonts.get_object()) if fonts is not None else DictionaryObject()
+        fonts[NameObject(_FOOTER_FONT_RESOURCE)] = self._font_ref
+        resources = writer.copy(DictionaryObject((key, value) for key, value in resources.items() if key != '/Font'))
+        resources[NameObject('/Font')] = fonts
+        new_page[NameObject('/Resources')] = resources
+        
+        writer.write(page_id, new_page)
+        mediabox = page.get('/MediaBox', inherited.get('/MediaBox'))
+        return footer_id, _footer_box(mediabox.get_object() if mediabox is not None else _DEFAULT_MEDIABOX)
+    
+    def _copy_destinations(self, reader, pages, page_ids):
+        """カタログの /Dests を結合後のページに付け替えた出力先と、付け替えた名前の対応を返す"""
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+        
+        dests = DictionaryObject()
+        renamed = {}
+        source = reader.trailer['/Root'].get('/Dests')
+        if not source:
+            return dests, renamed
+        
+        page_numbers = {ref.idnum: page_id for (ref, inherited), page_id in zip(pages, page_ids)}
+        for name, dest in source.get_object().items():
+            dest = dest.get_object()
+            if isinstance(dest, DictionaryObject):
+                dest = dest.get('/D')
+            if not isinstance(dest, ArrayObject) or not dest:
+                continue
+            page_id = page_numbers.get(getattr(dest[0], 'idnum', None))
+            if page_id is None:
+                continue
+            
+            new_name = f'/{self._document_count}-{name[1:]}' if self.isolate_destinations else name
+            if new_name in self._dests or new_name in dests:
+                continue
+            renamed[name] = new_name
+            dests[NameObject(new_name)] = ArrayObject(
+                [IndirectObject(page_id, 0, None)] + [self._writer.copy(value) for value in dest[1:]])
+        
+        return dests, renamed if self.isolate_destinations else {}
+    
+    def redirect_destinations(self, prefix):
+        """prefix を付けた名前の出力先を、prefix を除いた名前の出力先と同じ位置に向ける
+        
+        分割して印刷した文書で、別の部分にある要素へのリンクを有効にするために使う
+        （isolate_destinations=False の場合）。ページは書き出し済みのため、リンクではなく出力先を付け替える。
+        """
+        redirected = 0
+        for name in list(self._dests):
+            target = '/' + name[len(prefix) + 1:]
+            if name.startswith('/' + prefix) and target in self._dests:
+                self._dests[name] = self._dests[target]
+                redirected += 1
+        return redirected
+    
+    def close(self):
+        """フッター・ページツリー・出力先を書き出して出力ファイルを完成させる"""
+        from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+        
+        try:
+            if self._writer is None:
+                self._open()
+            writer = self._writer
+            if self._footers:
+                logger.info(f"Adding continuous page numbers to merged PDF...")
+            footer_text = self.footer_text if self.footer_text is not None else PDF_CONFIG['CREDIT_STRING']
+            for page_number, (footer_id, box) in enumerate(self._footers, start=self.start_page_number):
+                writer.write(footer_id, _content_stream(_footer_content(footer_text, page_number, self.page_count, box)))
             
+            writer.write(self._pages_ref.idnum, DictionaryObject({
+                NameObject('/Type'): NameObject('/Pages'),
+                NameObject('/Kids'): ArrayObject(IndirectObject(page_id, 0, None) for page_id in self._kids),
+                NameObject('/Count'): NumberObject(self.page_count),
+            }))
+            catalog = DictionaryObject({
+                NameObject('/Type'): NameObject('/Catalog'),
+                NameObject('/Pages'): self._pages_ref,
+            })
+            if self._dests:
+                catalog[NameObject('/Dests')] = writer.add(self._dests)
+            writer.finish(writer.add(catalog))
+            self._file.close()
+            self._file = None
+            os.replace(self._temp_path, self.output_path)
+        except BaseException:
+            self.discard()
+            raise
+        
+        if self.optimize:
+            logger.info(f"PDF optimized: {writer.removed} duplicate objects removed, "
+                        f"{writer.compressed} streams compressed")
+            linearize_pdf(self.output_path)
+        return self.page_count
+    
+    def discard(self):
+        """書きかけの出力ファイルを削除する（close() しない場合に呼び出す。close() 後は何もしない）"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._temp_path.unlink(missing_ok=True)
+
+
+def _rename_link_destinations(page, renamed):
+    """ページ内のリンク注釈が参照する出力先の名前を付け替える"""
+    from PyPDF2.generic import NameObject
+    
+    for annot in page.get('/Annots') or []:
+        annot = annot.get_object()
+        if annot.get('/Subtype') != '/Link':
+            continue
+        dest = annot.get('/Dest')
+        if isinstance(dest, NameObject) and dest in renamed:
+            annot[NameObject('/Dest')] = NameObject(renamed[dest])
+        action = annot.get('/A')
+        if action is not None:
+            action = action.get_object()
+            if action.get('/S') == '/GoTo' and isinstance(action.get('/D'), NameObject) and action['/D'] in renamed:
+                action[NameObject('/D')] = NameObject(renamed[action['/D']])
+
+
+def merge_pdfs(pdf_files, output_path, optimize=False):
+    """複数のPDFファイルを1つにマージし、連続したページ番号を付ける
+    
+    一時ファイルを作らず、結合とページ番号の追加を1回の書き込みで行う。
+    optimize=True の場合は重複したオブジェクトをまとめて書き込む（PdfBookWriter を参照）。
+    """
+    book = PdfBookWriter(output_path, optimize=optimize)
+    try:
+        for pdf_file in pdf_files:
+            book.append(pdf_file)
+        book.close()
+        logger.info(f"✓ Merged PDF with page numbers saved: {output_path}")
+        return True
     except Exception as e:
+        book.discard()
         logger.error(f"Error merging PDFs: {e}")
-        return False
\ No newline at end of file
+        return False
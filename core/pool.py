@@ -0,0 +1,134 @@
+"""
+WebDriver pool for parallel PDF conversion
+"""
+
+import queue
+import threading
+
+from .driver import create_driver, driver_memory_mb, kill_driver, quit_driver
+from .logger import logger
+
+
+class DriverPool:
+    """WebDriverのプール
+
+    最大 size 個のWebDriverを必要に応じて作成し、スレッド間で貸し出す。
+    外部から渡されたWebDriverはプールに含めるが、close() では終了しない。
+
+    renew() を使うと、recycle_after 件の変換ごと、またはプロセス全体のメモリ使用量が
+    max_memory_mb を超えた場合、変換に失敗した場合にWebDriverを作り直す
+    （長時間の一括変換でChromeのメモリ使用量が増え続けるのを防ぐ）。
+    外部から渡されたWebDriverは作り直す対象になってもプールから外すだけで終了しない
+    （終了は渡した側で行う）。
+    """
+
+    def __init__(self, size=1, headless=True, drivers=None, recycle_after=None, max_memory_mb=None):
+        self.size = max(1, size)
+        self.headless = headless
+        self.recycle_after = recycle_after
+        self.max_memory_mb = max_memory_mb
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._external = set()
+        self._owned = []
+        self._count = 0
+        self._uses = {}
+        self.recycled = 0
+
+        for driver in drivers or []:
+            self._external.add(id(driver))
+            self._idle.put(driver)
+            self._count += 1
+
+    def acquire(self):
+        """WebDriverを借りる（空きがなければ作成、上限に達していれば待機）"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._count < self.size
+            if create:
+                self._count += 1
+
+        if not create:
+            return self._idle.get()
+
+        try:
+            logger.debug("WebDriver作成開始（プール）")
+            driver = create_driver(self.headless)
+        except Exception:
+            with self._lock:
+                self._count -= 1
+            raise
+
+        with self._lock:
+            self._owned.append(driver)
+        logger.debug("WebDriver作成完了（プール）: %d/%d", self._count, self.size)
+        return driver
+
+    def release(self, driver):
+        """借りたWebDriverをプールに返す"""
+        self._idle.put(driver)
+
+    def _recycle_reason(self, driver, failed):
+        if failed:
+            return "変換に失敗したため"
+        uses = self._uses.get(id(driver), 0)
+        if self.recycle_after and uses >= self.recycle_after:
+            return f"{uses} 件変換したため"
+        if self.max_memory_mb:
+            memory = driver_memory_mb(driver)
+            if memory is not None and memory > self.max_memory_mb:
+                return f"メモリ使用量が {memory:.0f}MB になったため"
+        return None
+
+    def renew(self, driver, failed=False):
+        """変換を1件終えたWebDriverを確認し、必要なら作り直して次に使うWebDriverを返す
+
+        failed=True の場合（ブラウザの異常終了・期限切れなど）は必ず作り直す。
+        作り直したWebDriverの作成に失敗した場合は例外を送出する（古いWebDriverは終了済み）。
+        """
+        with self._lock:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        reason = self._recycle_reason(driver, failed)
+        if reason is None:
+            return driver
+
+        logger.info(f"WebDriverを作り直します（{reason}）")
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            external = id(driver) in self._external
+            self._external.discard(id(driver))
+            if driver in self._owned:
+                self._owned.remove(driver)
+            self._count -= 1
+            self.recycled += 1
+        if external:
+            logger.debug("外部から渡されたWebDriverをプールから外しました")
+            return self.acquire()
+        if failed:
+            kill_driver(driver)
+        try:
+            quit_driver(driver)
+        except Exception as e:
+            logger.debug("WebDriverの終了中にエラーが発生しました: %s", e)
+        return self.acquire()
+
+    def close(self):
+        """プールが作成したWebDriverをすべて終了"""
+        with self._lock:
+            owned, self._owned = self._owned, []
+
+        for driver in owned:
+            try:
+                quit_driver(driver)
+            except Exception as e:
+                logger.warning(f"WebDriverの終了中にエラーが発生しました: {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
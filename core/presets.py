@@ -2,6 +2,8 @@
 Preset configurations for PDF conversion
 """
 
+from .assets import asset_cache
+
 # プリセット定義
 PRESETS = {
     'default': {
@@ -20,4 +22,11 @@ PRESETS = {
 
 def get_preset_config(preset_name):
     """プリセット名から設定を取得"""
-    return PRESETS.get(preset_name, PRESETS['default'])
\ No newline at end of file
+    return PRESETS.get(preset_name, PRESETS['default'])
+
+def prebuild_presets(compact=False, font_size=16):
+    """すべてのプリセットのCSS・テンプレートを組み立ててキャッシュしておく"""
+    return {
+        name: asset_cache.get_bundle(preset['css_files'], preset['template_file'], compact, font_size)
+        for name, preset in PRESETS.items()
+    }
@@ -2,22 +2,50 @@
 File and directory processing functionality
 """
 
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from .converter import markdown_to_html
-from .logger import logger
-from .pdf import html_to_pdf, merge_pdfs
+from .assets import asset_cache
+from .converter import (CHUNK_REF_PREFIX, highlight_cache_stats, highlight_thread_stats, markdown_to_html,
+                        markdown_to_html_chunks, merge_markdown_to_html)
+from .discovery import walk_markdown
+from .driver import kill_driver
+from .images import get_image_cache
+from .logger import ChildProcessLogs, forward_to_queue, logger
+from .manifest import BuildManifest, compute_fingerprint, compute_merge_fingerprint
+from .metrics import ConversionResult
+from .pdf import PdfBookWriter, footer_print_options, html_to_pdf, optimize_pdf_file
+from .pool import DriverPool
+from .render_cache import get_render_cache
 
+# 先行してHTMLに変換しておく文書数（ブラウザのワーカー1つあたり）
+RENDER_QUEUE_SIZE_PER_WORKER = 2
 
-def process_file(input_path, output_path, driver, css_files=None, template_file=None, compact=False, font_size=16):
-    """個別のファイルを処理する関数"""
-    logger.info(f"Converting: {input_path} -> {output_path}")
+
+def _cache_counters():
+    """現在のスレッドでのキャッシュのヒット数・ミス数"""
+    counters = asset_cache.thread_stats()
+    counters['highlight'] = highlight_thread_stats()
+    counters['images'] = get_image_cache().thread_stats()
+    return counters
+
+
+def render_file(input_path, output_path, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, external_css=False):
+    """Markdownファイルを読み込んでHTMLに変換する（ブラウザを使わない段階）
+    
+    戻り値は (ConversionResult, HTML)。失敗した場合の HTML は None。
+    プロセスプールからも呼び出せるように、引数と戻り値はすべてpickle可能。
+    """
+    logger.info("Converting: %s -> %s", input_path, output_path)
     
     # ファイル存在確認
     if not input_path.exists():
         error_msg = f"入力ファイルが存在しません: {input_path}"
         logger.error(error_msg)
-        return False
+        return ConversionResult(input_path, output_path, error=error_msg), None
     
     # 出力パスの処理
     output_path = Path(output_path)
@@ -27,99 +55,796 @@ def process_file(input_path, output_path, driver, css_files=None, template_file=
         pdf_filename = input_path.stem + '.pdf'
         output_path = output_path / pdf_filename
     
-    logger.debug(f"最終的な出力パス: {output_path}")
+    logger.debug("最終的な出力パス: %s", output_path)
+    result = ConversionResult(input_path, output_path)
     
     # ファイル読み込み
-    logger.debug(f"ファイル読み込み開始: {input_path}")
+    logger.debug("ファイル読み込み開始: %s", input_path)
+    started = time.perf_counter()
     try:
         with open(input_path, 'r', encoding='utf-8') as f:
             md_content = f.read()
-        logger.debug(f"ファイル読み込み完了: {len(md_content)} 文字")
+        result.stages['read'] = time.perf_counter() - started
+        logger.debug("ファイル読み込み完了: %d 文字", len(md_content))
     except Exception as e:
         error_msg = f"ファイル読み込みエラー: {input_path} - {str(e)}"
         logger.error(error_msg, exc_info=True)
-        return False
+        result.error = error_msg
+        return result, None
     
     # Markdown -> HTML 変換
     logger.debug("Markdown -> HTML 変換開始")
+    counters = _cache_counters()
+    started = time.perf_counter()
     try:
         html_content = markdown_to_html(md_content, css_files=css_files,
                                       template_file=template_file,
-                                      compact=compact, font_size=font_size)
-        logger.debug(f"HTML変換完了: {len(html_content)} 文字")
+                                      compact=compact, font_size=font_size,
+                                      highlight_classes=highlight_classes,
+                                      image_dpi=image_dpi, base_dir=input_path.parent,
+                                      external_css=external_css)
+        result.stages['render'] = time.perf_counter() - started
+        result.html_bytes = len(html_content.encode('utf-8'))
+        result.cache = {
+            kind: {key: count - counters[kind][key] for key, count in counts.items()}
+            for kind, counts in _cache_counters().items()
+        }
+        logger.debug("HTML変換完了: %d 文字", len(html_content))
     except Exception as e:
         error_msg = f"Markdown -> HTML 変換エラー: {str(e)}"
         logger.error(error_msg, exc_info=True)
-        return False
+        result.error = error_msg
+        return result, None
+    
+    return result, html_content
+
+
+def print_file(result, html_content, driver):
+    """render_file で変換したHTMLをブラウザで印刷してPDFを保存する"""
+    output_path = result.output_path
     
     # 出力ディレクトリ作成
     if not output_path.parent.exists():
-        logger.debug(f"出力ディレクトリ作成: {output_path.parent}")
+        logger.debug("出力ディレクトリ作成: %s", output_path.parent)
         try:
             output_path.parent.mkdir(parents=True, exist_ok=True)
         except Exception as e:
             error_msg = f"出力ディレクトリ作成エラー: {output_path.parent} - {str(e)}"
             logger.error(error_msg, exc_info=True)
-            return False
+            result.error = error_msg
+            return result
     
     # PDF生成
-    logger.debug(f"PDF生成開始: {output_path}")
+    logger.debug("PDF生成開始: %s", output_path)
     try:
         # 元のMarkdownファイルのディレクトリを source_dir として渡す
-        source_dir = input_path.parent
-        result = html_to_pdf(driver, html_content, str(output_path), source_dir=str(source_dir))
-        if result:
-            logger.info(f"PDF生成成功: {output_path}")
-            return True
+        source_dir = result.input_path.parent
+        ok = html_to_pdf(driver, html_content, str(output_path), source_dir=str(source_dir), timings=result.stages)
+        if ok:
+            logger.info("PDF生成成功: %s", output_path)
+            result.pdf_bytes = output_path.stat().st_size
+            result.ok = True
         else:
             error_msg = f"PDF生成失敗: html_to_pdf が False を返しました"
             logger.error(error_msg)
-            return False
+            result.error = error_msg
+            result.retryable = True
     except Exception as e:
         error_msg = f"PDF生成中に予期せぬエラー: {str(e)}"
         logger.error(error_msg, exc_info=True)
+        result.error = error_msg
+        result.retryable = True
+    return result
+
+
+def _print_with_deadline(result, html_content, driver, deadline=None):
+    """print_file を期限付きで実行する
+    
+    deadline 秒を過ぎてもブラウザが応答しない場合はブラウザのプロセスを強制終了し、
+    待っている呼び出しを失敗させる（WebDriverは作り直す必要がある）。
+    """
+    if not deadline:
+        return print_file(result, html_content, driver)
+    
+    expired = threading.Event()
+    
+    def expire():
+        expired.set()
+        logger.error(f"変換が{deadline}秒以内に終わらないため、ブラウザを強制終了します: {result.input_path}")
+        kill_driver(driver)
+    
+    timer = threading.Timer(deadline, expire)
+    timer.daemon = True
+    timer.start()
+    try:
+        result = print_file(result, html_content, driver)
+    finally:
+        timer.cancel()
+    if expired.is_set():
+        result.ok = False
+        result.error = f"期限切れ: {deadline}秒以内に変換が終わりませんでした"
+        result.retryable = True
+    return result
+
+
+def _browser_failed(result):
+    """ブラウザの段階で失敗した（WebDriverを作り直すべき）か"""
+    return not result and result.retryable
+
+
+def _process_chunked(input_path, output_path, driver, convert_options, chunk_lines, workers, headless):
+    """文書を分割して並列に印刷し、連続したページ番号を付けて1つのPDFに結合する"""
+    import tempfile
+    
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    if not output_path.suffix:
+        output_path = output_path / (input_path.stem + '.pdf')
+    logger.info("Converting in chunks of about %d lines: %s -> %s", chunk_lines, input_path, output_path)
+    result = ConversionResult(input_path, output_path)
+    
+    started = time.perf_counter()
+    try:
+        with open(input_path, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        result.stages['read'] = time.perf_counter() - started
+        started = time.perf_counter()
+        documents = markdown_to_html_chunks(md_content, base_dir=input_path.parent, max_lines=chunk_lines,
+                                            **convert_options)
+        result.stages['render'] = time.perf_counter() - started
+        result.html_bytes = sum(len(document.encode('utf-8')) for document in documents)
+    except Exception as e:
+        error_msg = f"Markdown -> HTML 変換エラー: {input_path} - {str(e)}"
+        logger.error(error_msg, exc_info=True)
+        result.error = error_msg
+        return result
+    
+    if len(documents) == 1:
+        return print_file(result, documents[0], driver)
+    
+    logger.info(f"Printing {len(documents)} chunks with {min(workers, len(documents))} workers")
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        result.error = f"出力ディレクトリ作成エラー: {output_path.parent} - {str(e)}"
+        logger.error(result.error, exc_info=True)
+        return result
+    
+    # 各部分の出力先（文書内リンクの飛び先）は名前を変えずに結合する
+    book = PdfBookWriter(output_path, isolate_destinations=False)
+    pool = DriverPool(workers, headless=headless, drivers=[driver] if driver else None)
+    stages_lock = threading.Lock()
+    
+    with tempfile.TemporaryDirectory(prefix='md2pdf-chunks-') as temp_dir:
+        def print_chunk(index):
+            chunk_path = Path(temp_dir) / f'{index:05d}.pdf'
+            timings = {}
+            chunk_driver = pool.acquire()
+            try:
+                ok = html_to_pdf(chunk_driver, documents[index], str(chunk_path),
+                                 source_dir=str(input_path.parent), timings=timings)
+            finally:
+                pool.release(chunk_driver)
+            with stages_lock:
+                for stage, elapsed in timings.items():
+                    result.stages[stage] = result.stages.get(stage, 0.0) + elapsed
+            book.put(index, chunk_path if ok else None)
+            return ok
+        
+        try:
+            with ThreadPoolExecutor(max_workers=min(workers, len(documents)),
+                                    thread_name_prefix='md2pdf-chunk') as executor:
+                printed = list(executor.map(print_chunk, range(len(documents))))
+            if not all(printed):
+                result.error = f"PDF生成失敗: {printed.count(False)}/{len(documents)} 個の部分を印刷できませんでした"
+                logger.error(result.error)
+                return result
+            
+            started = time.perf_counter()
+            book.redirect_destinations(CHUNK_REF_PREFIX)
+            book.close()
+            result.stages['stitch'] = time.perf_counter() - started
+        except Exception as e:
+            result.error = f"PDF結合エラー: {output_path} - {str(e)}"
+            logger.error(result.error, exc_info=True)
+            return result
+        finally:
+            pool.close()
+            book.discard()
+    
+    logger.info("PDF生成成功: %s", output_path)
+    result.pdf_bytes = output_path.stat().st_size
+    result.ok = True
+    return result
+
+
+def process_file(input_path, output_path, driver, css_files=None, template_file=None, compact=False, font_size=16, highlight_classes=False, image_dpi=None, chunk_lines=None, workers=1, headless=True, external_css=False):
+    """個別のファイルを処理する関数
+    
+    戻り値の ConversionResult は成否を真偽値で表し、段階ごとの処理時間、HTML・PDFのサイズ、
+    ページ数、キャッシュのヒット数を保持する。
+    chunk_lines を指定すると、文書をトップレベルの見出し（h1）と改ページの目印で区切って
+    この行数程度の部分に分け、workers 個のブラウザで並列に印刷してから連続したページ番号を付けて
+    結合する（巨大な文書でブラウザのメモリ使用量を部分の大きさに抑える）。部分どうしのリンクも有効になる。
+    external_css=True の場合、CSSはHTMLに埋め込まずに共有スタイルシートとして読み込む。
+    """
+    if chunk_lines:
+        convert_options = dict(css_files=css_files, template_file=template_file, compact=compact,
+                               font_size=font_size, highlight_classes=highlight_classes, image_dpi=image_dpi,
+                               external_css=external_css)
+        return _process_chunked(input_path, output_path, driver, convert_options, chunk_lines, workers, headless)
+    
+    result, html_content = render_file(input_path, output_path, css_files=css_files,
+                                       template_file=template_file, compact=compact,
+                                       font_size=font_size, highlight_classes=highlight_classes,
+                                       image_dpi=image_dpi, external_css=external_css)
+    if html_content is None:
+        return result
+    return print_file(result, html_content, driver)
+
+
+def process_file_from_pool(input_path, output_path, pool, deadline=None, retries=0, **convert_options):
+    """プールから借りたWebDriverで1ファイルを変換する
+    
+    process_directory と同じく、deadline 秒を過ぎた印刷はブラウザを強制終了して失敗とし、
+    変換のたびに pool.renew() でWebDriverを確認する（失敗した場合や上限に達した場合は作り直す）。
+    ブラウザの段階で失敗した場合は新しいWebDriverで最大 retries 回変換し直す。
+    convert_options は render_file のオプション。
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        pool_driver = pool.acquire()
+        try:
+            result, html_content = render_file(input_path, output_path, **convert_options)
+            if html_content is not None:
+                result = _print_with_deadline(result, html_content, pool_driver, deadline)
+        except Exception:
+            pool.release(pool_driver)
+            raise
+        result.attempts = attempts
+        # 作り直しに失敗した場合は例外を送出する（古いWebDriverは終了済みのため返さない）
+        pool.release(pool.renew(pool_driver, failed=_browser_failed(result)))
+        if result or not result.retryable or attempts > retries:
+            return result
+        logger.warning(f"Retrying {input_path} on a fresh browser")
+
+
+def _put_until_stopped(job_queue, item, stopped):
+    """上限付きのキューに積む（空きを待つ間に stopped がセットされた場合は False）"""
+    while True:
+        try:
+            job_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            if stopped.is_set():
+                return False
+
+
+def _get_until_stopped(job_queue, stopped):
+    """キューから取り出す（キューが空の間に stopped がセットされた場合は None）"""
+    while True:
+        try:
+            return job_queue.get(timeout=0.5)
+        except queue.Empty:
+            if stopped.is_set():
+                return None
+
+
+def _feed_jobs(jobs, job_queue, results, workers, stopped, render_pool=None, convert_options=None):
+    """ジョブを入力順にキューへ積み、最後にワーカーの数だけ終了の目印を積む
+    
+    jobs はリストのほか、ファイルの探索中のジェネレーターでもよい（見つかった順に積む）。
+    render_pool を渡した場合はHTMLへの変換をプロセスプールに投入し、結果（Future）を積む。
+    キューが一杯の間は投入を待つため、変換済みで印刷待ちのHTMLは一定数に抑えられる。
+    """
+    try:
+        for index, (md_file, pdf_path) in enumerate(jobs):
+            if stopped.is_set():
+                return
+            results.append(False)
+            future = None
+            if render_pool is not None:
+                future = render_pool.submit(render_file, md_file, pdf_path, **convert_options)
+            if not _put_until_stopped(job_queue, (index, (md_file, pdf_path), future), stopped):
+                if future is not None:
+                    future.cancel()
+                return
+    except Exception as e:
+        # 探索中のエラーなど。積んだ分だけ処理して終了する
+        logger.error(f"ジョブの投入中にエラーが発生しました: {str(e)}", exc_info=True)
+    for _ in range(workers):
+        if not _put_until_stopped(job_queue, None, stopped):
+            return
+
+
+def _process_parallel(jobs, driver, workers, headless, convert_options, on_result=None, render_processes=0, pool=None, cancel_event=None, deadline=None):
+    """ワーカーごとに専用のWebDriverを使ってファイルを並列処理し、入力順の結果を返す
+    
+    on_result(index, result) は各ファイルの処理が終わるたびにワーカースレッドから呼ばれる
+    （result は ConversionResult）。
+    cancel_event がセットされると、各ワーカーは処理中のファイルを終えた時点で停止する。
+    deadline（秒）を指定すると、1件の印刷がその時間を超えた場合にブラウザを強制終了する。
+    ワーカーは1件ごとに pool.renew() でWebDriverを確認し、失敗した場合や使用回数・メモリの上限を
+    超えた場合は作り直したWebDriverで次のファイルを処理する。
+    render_processes が1以上の場合は、MarkdownからHTMLへの変換をプロセスプールで先行して行い、
+    上限付きのキューを通してブラウザのワーカーに渡す（CPU処理とブラウザの印刷を並行させる）。
+    pool を渡した場合はそのプールからWebDriverを借り、終了後もプールは閉じない。
+    """
+    results = []
+    stats = [{'success': 0, 'failed': 0} for _ in range(workers)]
+    stopped = threading.Event()
+    alive = [workers]
+    alive_lock = threading.Lock()
+    
+    render_pool = None
+    child_logs = None
+    if render_processes > 0:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        
+        job_queue = queue.Queue(maxsize=workers * RENDER_QUEUE_SIZE_PER_WORKER)
+        # Qtなどのスレッドを持つプロセスからも安全に起動できるよう spawn を使う
+        mp_context = multiprocessing.get_context('spawn')
+        # 子プロセスのログはこのプロセスでまとめてファイルに書き込む
+        child_logs = ChildProcessLogs(mp_context).start()
+        render_pool = ProcessPoolExecutor(render_processes, mp_context=mp_context, initializer=forward_to_queue,
+                                          initargs=(child_logs.queue, logger.level))
+        logger.info(f"Rendering HTML in {render_processes} processes ahead of {workers} browser workers")
+    else:
+        job_queue = queue.Queue()
+    feeder = threading.Thread(target=_feed_jobs, name='md2pdf-feeder',
+                              args=(jobs, job_queue, results, workers, stopped, render_pool, convert_options),
+                              daemon=True)
+    feeder.start()
+    
+    owns_pool = pool is None
+    if owns_pool:
+        pool = DriverPool(workers, headless=headless, drivers=[driver] if driver else None)
+    
+    def worker_failed(worker_id, e):
+        logger.error(f"ワーカー{worker_id}: WebDriver作成エラー: {str(e)}", exc_info=True)
+        with alive_lock:
+            alive[0] -= 1
+            if alive[0] == 0:
+                stopped.set()
+    
+    def worker(worker_id):
+        try:
+            worker_driver = pool.acquire()
+        except Exception as e:
+            worker_failed(worker_id, e)
+            return
+        
+        try:
+            while True:
+                item = _get_until_stopped(job_queue, stopped)
+                if item is None:
+                    return
+                index, (md_file, pdf_path), rendered = item
+                if cancel_event is not None and cancel_event.is_set():
+                    # 先行して積まれたHTML変換も待たずに終了する
+                    stopped.set()
+                    return
+                
+                try:
+                    if rendered is None:
+                        result, html_content = render_file(md_file, pdf_path, **convert_options)
+                    else:
+                        result, html_content = rendered.result()
+                    if html_content is not None:
+                        result = _print_with_deadline(result, html_content, worker_driver, deadline)
+                except Exception as e:
+                    logger.error(f"ワーカー{worker_id}: 予期せぬエラー: {md_file} - {str(e)}", exc_info=True)
+                    result = ConversionResult(md_file, pdf_path, error=str(e))
+                
+                results[index] = result
+                stats[worker_id]['success' if result else 'failed'] += 1
+                if on_result:
+                    on_result(index, result)
+                
+                try:
+                    worker_driver = pool.renew(worker_driver, failed=_browser_failed(result))
+                except Exception as e:
+                    worker_driver = None
+                    worker_failed(worker_id, e)
+                    return
+        finally:
+            if worker_driver is not None:
+                pool.release(worker_driver)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='md2pdf-worker') as executor:
+            for worker_id in range(workers):
+                executor.submit(worker, worker_id)
+    finally:
+        if owns_pool:
+            pool.close()
+        stopped.set()
+        feeder.join()
+        if render_pool is not None:
+            # 処理されずに残ったHTML変換を取り消す
+            while True:
+                try:
+                    item = job_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[2].cancel()
+            render_pool.shutdown()
+            child_logs.stop()
+    
+    for worker_id, worker_stats in enumerate(stats):
+        logger.info(f"Worker {worker_id}: {worker_stats['success']} succeeded, {worker_stats['failed']} failed")
+    
+    return results
+
+
+def _merged_pdf_path(output_dir, merge_name):
+    """マージ後のPDFのパス"""
+    merged_pdf_path = output_dir / merge_name
+    if not merged_pdf_path.suffix == '.pdf':
+        merged_pdf_path = merged_pdf_path.with_suffix('.pdf')
+    return merged_pdf_path
+
+
+def _merge_as_html(jobs, input_dir, merged_pdf_path, driver, headless, convert_options, incremental, metrics=None, pool=None, optimize_pdf=False):
+    """すべてのMarkdownを1つのHTMLにまとめ、ブラウザで一度だけ印刷する
+    
+    ページ番号はChromeのフッター機能で印刷するため、PDFの結合とフッターの追加は行わない。
+    """
+    manifest = None
+    merged_fingerprint = None
+    if incremental:
+        manifest = BuildManifest(merged_pdf_path.parent)
+        try:
+            merged_fingerprint = compute_merge_fingerprint(
+                [(pdf_path, compute_fingerprint(md_file, **convert_options)) for md_file, pdf_path in jobs],
+                merged_pdf_path.parent, merge_mode='html', optimize=optimize_pdf)
+        except Exception as e:
+            logger.warning(f"ハッシュ計算エラー: {str(e)}")
+        if merged_fingerprint and manifest.is_up_to_date(merged_pdf_path, merged_fingerprint):
+            logger.info(f"Merged PDF is up to date: {merged_pdf_path}")
+            if metrics is not None:
+                metrics.skip(len(jobs))
+            return True
+    
+    logger.info(f"Rendering {len(jobs)} files into one document: {merged_pdf_path}")
+    result = ConversionResult(input_dir, merged_pdf_path)
+    if metrics is not None:
+        metrics.add(result)
+    started = time.perf_counter()
+    try:
+        html_content = merge_markdown_to_html([md_file for md_file, _ in jobs], **convert_options)
+        result.stages['render'] = time.perf_counter() - started
+        result.html_bytes = len(html_content.encode('utf-8'))
+    except Exception as e:
+        logger.error(f"Markdown -> HTML 変換エラー: {str(e)}", exc_info=True)
+        result.error = str(e)
         return False
+    
+    owns_pool = pool is None
+    if owns_pool:
+        pool = DriverPool(1, headless=headless, drivers=[driver] if driver else None)
+    try:
+        merge_driver = pool.acquire()
+        try:
+            ok = html_to_pdf(merge_driver, html_content, str(merged_pdf_path), source_dir=str(input_dir),
+                             pdf_options=footer_print_options(), timings=result.stages)
+        finally:
+            pool.release(merge_driver)
+    finally:
+        if owns_pool:
+            pool.close()
+    
+    if not ok:
+        logger.error("✗ PDF merge failed!")
+        result.error = "PDF生成失敗: html_to_pdf が False を返しました"
+        return False
+    
+    if optimize_pdf:
+        optimize_pdf_file(merged_pdf_path)
+    result.pdf_bytes = merged_pdf_path.stat().st_size
+    result.ok = True
+    logger.info(f"✓ All files printed into: {merged_pdf_path}")
+    if manifest is not None and merged_fingerprint:
+        manifest.record(merged_pdf_path, merged_fingerprint)
+        manifest.save()
+    return True
 
 
-def process_directory(input_dir, output_dir, driver, css_files=None, template_file=None, compact=False, font_size=16, merge=False, merge_name=None, selected_files=None):
-    """ディレクトリ内のすべてのMarkdownファイルを処理"""
+def process_directory(input_dir, output_dir, driver, css_files=None, template_file=None, compact=False, font_size=16, merge=False, merge_name=None, selected_files=None, workers=1, headless=True, highlight_classes=False, incremental=False, merge_mode='pdf', metrics=None, render_processes=0, pool=None, progress=None, cancel_event=None, image_dpi=None, optimize_pdf=False, recycle_after=None, max_memory_mb=None, deadline=None, retries=0, external_css=False, include=None, exclude=None):
+    """ディレクトリ内のすべてのMarkdownファイルを処理
+    
+    selected_files を省略した場合は walk_markdown でディレクトリを探索し（include・exclude はその
+    パターン、出力ディレクトリは探索しない）、マージしない場合は見つかったファイルから変換を始める。
+    selected_files にはリストのほか、ファイルを順に返すイテレーターも渡せる。
+    workers が2以上の場合は、ワーカーごとにWebDriverを作成して並列に変換する。
+    渡された driver は最初のワーカーが使用する。
+    incremental=True の場合は出力ディレクトリのマニフェストと入力のハッシュを比較し、
+    変更のないファイルの変換を省略する。
+    merge_mode='html' の場合は個別のPDFを作らず、すべてのファイルを1つのHTMLにまとめて
+    一度だけ印刷する（merge=True の場合のみ）。
+    metrics に BatchMetrics を渡すと、変換ごとの ConversionResult と処理時間が記録される。
+    render_processes が1以上の場合は、HTMLへの変換を別プロセスで先行して行い、ブラウザの印刷と並行させる。
+    pool に DriverPool を渡すと、WebDriverをそのプールから借りて呼び出し後も起動したままにする
+    （監視モードなどで繰り返し呼び出す場合。driver は None でよく、渡しても使わない）。
+    progress(done, total, result) は変換するファイルが1つ終わるたびに呼ばれる
+    （total は差分ビルドで省略したファイルを除いた数で、探索しながら変換する場合はそれまでに見つかった数。
+    開始時には result=None で一度呼ばれる）。
+    cancel_event（threading.Event）がセットされると、次のファイルに進まずに終了して False を返す
+    （変換済みのファイルはマニフェストに記録され、マージは行わない）。
+    image_dpi を指定すると、ローカル画像をその解像度に合わせて縮小・再圧縮してから印刷する。
+    optimize_pdf=True の場合は、マージ結果から重複したフォント・画像などを除いて圧縮する。
+    recycle_after・max_memory_mb を指定すると、その件数の変換ごと・メモリ使用量を超えたときに
+    WebDriverを作り直す（DriverPool.renew を参照）。deadline 秒以内に印刷が終わらない場合は
+    ブラウザを強制終了して失敗とし、ブラウザの段階で失敗したファイルは新しいWebDriverで
+    最大 retries 回変換し直す。
+    external_css=True の場合、CSSは文書ごとに埋め込まずにバンドルごとに一度だけ書き出した
+    共有スタイルシートを読み込む（ブラウザが解析済みのスタイルシートを使い回せる）。
+    """
     if not output_dir.exists():
         output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 選択されたファイルがある場合はそれを使用、ない場合はディレクトリ内のすべてのMarkdownファイルを処理
+    # 選択されたファイルがある場合はそれを使用、ない場合はディレクトリを探索する
     if selected_files:
         md_files = selected_files
     else:
-        md_files = list(input_dir.glob('**/*.md'))
+        md_files = walk_markdown(input_dir, include=include, exclude=exclude, skip_dirs=[output_dir])
+    # マージはすべてのファイルの順番とハッシュがそろってから行うため、探索を先に終える
+    # （それ以外は探索しながら見つかったファイルから変換を始める）
+    streaming = not merge and not isinstance(md_files, (list, tuple))
+    if not streaming:
+        md_files = list(md_files)
+        if not md_files:
+            logger.warning(f"No Markdown files found in {input_dir}")
+            return False
+    
+    def job_for(md_file):
+        # 出力パスを相対パスで計算
+        rel_path = md_file.relative_to(input_dir)
+        return md_file, output_dir / rel_path.with_suffix('.pdf')
+    
+    convert_options = dict(
+        css_files=css_files,
+        template_file=template_file,
+        compact=compact,
+        font_size=font_size,
+        highlight_classes=highlight_classes,
+        image_dpi=image_dpi,
+        external_css=external_css,
+    )
     
-    if not md_files:
+    # HTMLレベルでのマージ：1つの文書として一度だけ印刷する
+    if merge and merge_mode == 'html':
+        ok = _merge_as_html([job_for(md_file) for md_file in md_files], input_dir,
+                            _merged_pdf_path(output_dir, merge_name), driver, headless,
+                            convert_options, incremental, metrics, pool, optimize_pdf)
+        if metrics is not None:
+            metrics.finish()
+            logger.info(f"Metrics: {metrics.format_summary()}")
+        return ok
+    
+    jobs = []
+    results = []
+    attempts = []
+    pending = []
+    manifest = BuildManifest(output_dir) if incremental else None
+    fingerprints = {}
+    
+    def discover():
+        """ファイルをジョブに追加し、変換が必要なものの番号を見つけた順に返す"""
+        for md_file in md_files:
+            index = len(jobs)
+            jobs.append(job_for(md_file))
+            results.append(False)
+            attempts.append(0)
+            # 差分ビルド：ハッシュが変わっていないファイルは変換しない
+            if manifest is not None:
+                try:
+                    fingerprints[index] = compute_fingerprint(md_file, **convert_options)
+                except Exception as e:
+                    logger.warning(f"ハッシュ計算エラー: {md_file} - {str(e)}")
+                if index in fingerprints and manifest.is_up_to_date(jobs[index][1], fingerprints[index]):
+                    results[index] = True
+                    if metrics is not None:
+                        metrics.skip()
+                    continue
+            pending.append(index)
+            yield index
+        logger.info(f"Found {len(jobs)} Markdown files in {input_dir}")
+        if manifest is not None:
+            logger.info(f"Incremental build: {len(jobs) - len(pending)} up-to-date, {len(pending)} to convert")
+    
+    indices = discover() if streaming else list(discover())
+    
+    # マージ：変換が終わったPDFから順に結合していく
+    merged_pdf_path = _merged_pdf_path(output_dir, merge_name) if merge else None
+    book = None
+    if merge:
+        merged_fingerprint = None
+        if manifest is not None and not pending and len(fingerprints) == len(jobs):
+            merged_fingerprint = compute_merge_fingerprint(
+                [(pdf_path, fingerprints[index]) for index, (md_file, pdf_path) in enumerate(jobs)], output_dir,
+                optimize=optimize_pdf)
+        if merged_fingerprint and manifest.is_up_to_date(merged_pdf_path, merged_fingerprint):
+            logger.info(f"Merged PDF is up to date: {merged_pdf_path}")
+        else:
+            book = PdfBookWriter(merged_pdf_path, optimize=optimize_pdf)
+    
+    merge_errors = []
+    
+    def add_to_book(index, pdf_path):
+        try:
+            book.put(index, pdf_path)
+        except Exception as e:
+            logger.error(f"Error merging PDFs: {pdf_path} - {e}")
+            merge_errors.append(index)
+    
+    done = [0]
+    progress_lock = threading.Lock()
+    retry_later = []
+    
+    def on_result(index, result):
+        results[index] = result
+        with progress_lock:
+            attempts[index] += 1
+            result.attempts = attempts[index]
+            # ブラウザの異常・期限切れで失敗したファイルは、最後に新しいWebDriverで変換し直す
+            if not result and result.retryable and attempts[index] <= retries and not canceled():
+                retry_later.append(index)
+                return
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], len(pending), result)
+        finalize(index, result)
+    
+    def finalize(index, result):
+        if metrics is not None:
+            metrics.add(result)
+        if manifest is not None:
+            if result and index in fingerprints:
+                manifest.record(jobs[index][1], fingerprints[index])
+            else:
+                manifest.discard(jobs[index][1])
+        if book is not None:
+            add_to_book(index, jobs[index][1] if result else None)
+    
+    # 変換済みのファイルは先にマージ対象として渡す
+    if book is not None:
+        pending_set = set(pending)
+        for index, (md_file, pdf_path) in enumerate(jobs):
+            if index not in pending_set:
+                add_to_book(index, pdf_path)
+    
+    def canceled():
+        return cancel_event is not None and cancel_event.is_set()
+    
+    if progress is not None:
+        progress(0, len(pending), None)
+    
+    # 作り直し・期限・再試行を行う場合はプールから借りたWebDriverで変換する
+    owned_pool = None
+    if pool is None and (recycle_after or max_memory_mb or deadline or retries):
+        pool = owned_pool = DriverPool(max(1, workers if streaming else min(workers, len(pending))), headless=headless,
+                                       drivers=[driver] if driver else None,
+                                       recycle_after=recycle_after, max_memory_mb=max_memory_mb)
+        driver = None
+    
+    def run_jobs(indices):
+        if isinstance(indices, list):
+            run_workers = max(1, min(workers, len(indices)))
+            run_processes = max(0, min(render_processes, len(indices)))
+        else:
+            run_workers = max(1, workers)
+            run_processes = max(0, render_processes)
+        if run_workers > 1 or run_processes > 0:
+            positions = []
+            
+            def run_list():
+                for index in indices:
+                    positions.append(index)
+                    yield jobs[index]
+            
+            logger.info(f"Converting with {run_workers} workers")
+            _process_parallel(run_list(), driver, run_workers, headless, convert_options,
+                              on_result=lambda position, result: on_result(positions[position], result),
+                              render_processes=run_processes, pool=pool, cancel_event=cancel_event,
+                              deadline=deadline)
+        elif pool is not None:
+            pool_driver = None
+            try:
+                for index in indices:
+                    if canceled():
+                        break
+                    if pool_driver is None:
+                        pool_driver = pool.acquire()
+                    md_file, pdf_path = jobs[index]
+                    result, html_content = render_file(md_file, pdf_path, **convert_options)
+                    if html_content is not None:
+                        result = _print_with_deadline(result, html_content, pool_driver, deadline)
+                    on_result(index, result)
+                    try:
+                        pool_driver = pool.renew(pool_driver, failed=_browser_failed(result))
+                    except Exception as e:
+                        logger.error(f"WebDriverを作り直せませんでした: {str(e)}")
+                        pool_driver = None
+                        break
+            finally:
+                if pool_driver is not None:
+                    pool.release(pool_driver)
+        else:
+            for index in indices:
+                if canceled():
+                    break
+                md_file, pdf_path = jobs[index]
+                on_result(index, process_file(md_file, pdf_path, driver, **convert_options))
+    
+    try:
+        run_jobs(indices)
+        while retry_later and not canceled():
+            indices, retry_later[:] = sorted(retry_later), []
+            logger.warning(f"Retrying {len(indices)} file(s) on fresh browsers")
+            run_jobs(indices)
+    finally:
+        if owned_pool is not None:
+            owned_pool.close()
+    # 再試行しないまま残ったファイル（中止された場合など）は失敗として記録する
+    for index in retry_later:
+        done[0] += 1
+        finalize(index, results[index])
+    
+    if not jobs:
         logger.warning(f"No Markdown files found in {input_dir}")
         return False
     
-    success_count = 0
-    generated_pdfs = []
-    for md_file in md_files:
-        # 出力パスを相対パスで計算
-        rel_path = md_file.relative_to(input_dir)
-        pdf_path = output_dir / rel_path.with_suffix('.pdf')
-        pdf_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        if process_file(md_file, pdf_path, driver, css_files, template_file, compact, font_size):
-            success_count += 1
-            generated_pdfs.append(pdf_path)
+    success_count = sum(1 for ok in results if ok)
+    if canceled():
+        logger.warning(f"Conversion canceled: {done[0]}/{len(pending)} files processed")
+        if book is not None:
+            book.discard()
+        book = None
     
-    logger.info(f"\nConversion completed: {success_count}/{len(md_files)} files converted successfully")
+    logger.info(f"\nConversion completed: {success_count}/{len(jobs)} files converted successfully")
+    highlight_stats = highlight_cache_stats()
+    logger.info(f"Asset cache: {asset_cache.format_stats()}, "
+                f"highlight {highlight_stats['hits']}/{highlight_stats['hits'] + highlight_stats['misses']} hits "
+                f"({highlight_stats['hit_rate']:.0%})")
+    render_cache = get_render_cache()
+    if render_cache.enabled:
+        logger.info(f"Render cache: {render_cache.format_stats()}")
     
-    # PDFのマージ処理
-    if merge and success_count > 0:
-        merged_pdf_path = output_dir / merge_name
-        if not merged_pdf_path.suffix == '.pdf':
-            merged_pdf_path = merged_pdf_path.with_suffix('.pdf')
-        
-        if merge_pdfs(generated_pdfs, merged_pdf_path):
+    # マージ結果の書き込み
+    merge_failed = bool(merge_errors)
+    # 結果が届かなかったファイル（ワーカーの異常終了など）がある場合は、途中までのPDFを書き込まない
+    if book is not None and not merge_failed and book.received < len(jobs):
+        logger.error(f"Merge incomplete: only {book.received}/{len(jobs)} files reached the merge, "
+                     f"not writing {merged_pdf_path}")
+        merge_failed = True
+    if book is not None and success_count > 0 and not merge_failed:
+        try:
+            book.close()
             logger.info(f"✓ All PDFs merged into: {merged_pdf_path}")
-        else:
-            logger.error("✗ PDF merge failed!")
-            return False
+            if manifest is not None and len(fingerprints) == len(jobs):
+                manifest.record(merged_pdf_path, compute_merge_fingerprint(
+                    [(jobs[index][1], fingerprints[index]) for index, ok in enumerate(results) if ok], output_dir,
+                    optimize=optimize_pdf))
+        except Exception as e:
+            logger.error(f"Error merging PDFs: {e}")
+            merge_failed = True
+    if book is not None:
+        # 書き込まなかった場合は書きかけのファイルを残さない
+        book.discard()
+    
+    if manifest is not None:
+        manifest.save()
+    
+    if metrics is not None:
+        metrics.finish()
+        logger.info(f"Metrics: {metrics.format_summary()}")
+    
+    if merge_failed:
+        logger.error("✗ PDF merge failed!")
+        return False
     
-    return success_count == len(md_files)
\ No newline at end of file
+    return success_count == len(jobs)
\ No newline at end of file
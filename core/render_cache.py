@@ -0,0 +1,264 @@
+"""
+Content-addressed cache of printed PDFs keyed by the final HTML, local assets and print options
+
+同じHTML・同じローカルのアセット・同じ印刷オプション（とChromeのバージョン）から作られるPDFは
+同じとみなし、キャッシュにあればブラウザで印刷せずにコピーする。
+キャッシュのディレクトリは複数のプロセスやCIのジョブで共有でき、合計サイズが上限を超えると
+最後に使われた時刻（ファイルの更新時刻）が古いものから削除する。
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+
+from .converter import resolve_local_path
+from .logger import logger
+
+# レンダーキャッシュの設定のデフォルト（config.py の RENDER_CACHE_CONFIG で上書きできる）
+DEFAULT_RENDER_CACHE_CONFIG = {
+    'ENABLED': False,                # --render-cache を指定しなくても使う
+    'CACHE_DIR': None,               # キャッシュディレクトリ（None の場合は ~/.cache/md2pdf/pdf）
+    'MAX_SIZE_MB': 1024,             # キャッシュの合計サイズの上限
+}
+
+# キーの計算方法や保存形式を変えた場合に上げる（古いキャッシュを使わないようにする）
+_CACHE_VERSION = 1
+
+# 上限を超えた場合に、この割合まで減らす（削除のたびにディレクトリを走査しないようにする）
+_EVICT_TARGET_RATIO = 0.9
+
+# 印刷結果に影響するローカルの参照（src 属性、<link> の href、CSS の url()）
+_ASSET_RE = re.compile(
+    r'''\bsrc\s*=\s*["']([^"']+)["']'''
+    r'''|<link\b[^>]*?\bhref\s*=\s*["']([^"']+)["']'''
+    r'''|url\(\s*["']?([^"')\s]+)["']?\s*\)''',
+    re.IGNORECASE,
+)
+
+# 印刷結果に影響しない印刷オプション
+_IGNORED_OPTIONS = ('transferMode',)
+
+
+def _load_render_cache_config():
+    render_cache_config = dict(DEFAULT_RENDER_CACHE_CONFIG)
+    try:
+        from config import config
+        render_cache_config.update(getattr(config, 'RENDER_CACHE_CONFIG', {}))
+    except ImportError:
+        pass
+    return render_cache_config
+
+
+def _default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'md2pdf' / 'pdf'
+
+
+class RenderCache:
+    """印刷したPDFのディスクキャッシュ
+
+    キーはHTML・参照しているローカルファイルの内容・印刷オプション・Chromeのバージョンのハッシュで、
+    ファイルは一時ファイルから置き換えて書き込むため、複数のプロセスから同時に使ってもよい。
+    リモートのURL（http など）は内容を確認できないため、URLだけをキーに含める。
+    """
+
+    def __init__(self, cache_dir=None, max_size_mb=None, enabled=None):
+        render_cache_config = _load_render_cache_config()
+        self.enabled = render_cache_config['ENABLED'] if enabled is None else enabled
+        self.cache_dir = Path(cache_dir or render_cache_config['CACHE_DIR'] or _default_cache_dir()).expanduser().resolve()
+        self.max_bytes = int((max_size_mb or render_cache_config['MAX_SIZE_MB']) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._digests = {}
+        self._lock = threading.Lock()
+        # このプロセスで把握しているキャッシュの合計サイズ（最初に保存するときに走査する）
+        self._total_bytes = None
+
+    def configure(self, cache_dir=None, max_size_mb=None, enabled=True):
+        """キャッシュディレクトリ・上限を設定して有効にする（省略した項目は現在の値）"""
+        with self._lock:
+            if cache_dir:
+                self.cache_dir = Path(cache_dir).expanduser().resolve()
+                self._total_bytes = None
+            if max_size_mb:
+                self.max_bytes = int(max_size_mb * 1024 * 1024)
+            self.enabled = enabled
+
+    def format_stats(self):
+        """ログ出力用の統計文字列"""
+        total = self.hits + self.misses
+        return f"{self.hits}/{total} hits ({self.hits / total if total else 0.0:.0%})"
+
+    def _digest(self, path):
+        """ファイルの内容のハッシュ（更新時刻とサイズが同じ間はプロセス内で再計算しない）"""
+        stat = path.stat()
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def key(self, html_content, source_dir=None, print_options=None, browser_version=None):
+        """キャッシュのキーを計算
+
+        ローカルのアセットは参照の文字列とファイルの内容でキーに含めるため、
+        同じ文書を別のディレクトリにコピーしても同じキーになる。
+        source_dir がない場合は文書を about:blank に読み込む（相対参照は解決されない）ため、
+        相対参照は参照の文字列だけをキーに含める。
+        """
+        if source_dir and not Path(source_dir).exists():
+            source_dir = None
+        digest = hashlib.sha256(f"md2pdf-render-v{_CACHE_VERSION}\0{browser_version or ''}\0".encode('utf-8'))
+        options = {name: value for name, value in (print_options or {}).items() if name not in _IGNORED_OPTIONS}
+        digest.update(json.dumps(options, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(html_content.encode('utf-8'))
+
+        seen = set()
+        for match in _ASSET_RE.finditer(html_content):
+            ref = next(group for group in match.groups() if group)
+            if ref in seen or ref.startswith(('#', 'data:', 'about:', 'javascript:', 'mailto:')):
+                continue
+            seen.add(ref)
+            if source_dir is None and not (ref.lower().startswith('file:') or Path(ref).is_absolute()):
+                continue
+            path = resolve_local_path(ref, source_dir or '.')
+            if path is None:
+                continue
+            try:
+                content = self._digest(path) if path.is_file() else 'missing'
+            except OSError:
+                content = 'missing'
+            digest.update(f"\0{ref}\0{content}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.pdf"
+
+    def fetch(self, key, output):
+        """キャッシュにあれば output（パスまたはファイルのようなオブジェクト）にコピーして True を返す"""
+        entry = self._entry_path(key)
+        try:
+            with open(entry, 'rb') as source:
+                if hasattr(output, 'write'):
+                    shutil.copyfileobj(source, output)
+                else:
+                    with open(output, 'wb') as target:
+                        shutil.copyfileobj(source, target)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        # 最後に使われた時刻として更新時刻を記録する（削除の順番に使う）
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return True
+
+    @contextlib.contextmanager
+    def writer(self, key):
+        """キャッシュに書き込むファイルを開く（with を抜けた時点で保存、例外の場合は破棄）"""
+        entry = self._entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = entry.with_name(f"{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(temp_path, 'wb') as f:
+                yield f
+            size = temp_path.stat().st_size
+            os.replace(temp_path, entry)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        logger.debug("レンダーキャッシュに保存しました: %s", entry)
+        self._added(size)
+
+    def _added(self, size):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += size
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _scan(self):
+        """キャッシュのファイルの (パス, サイズ, 更新時刻) のリスト"""
+        entries = []
+        try:
+            subdirs = list(os.scandir(self.cache_dir))
+        except OSError:
+            return entries
+        for subdir in subdirs:
+            try:
+                if not subdir.is_dir():
+                    continue
+                for entry in os.scandir(subdir.path):
+                    if entry.name.endswith('.pdf'):
+                        stat = entry.stat()
+                        entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """合計サイズが上限を超えている場合、最後に使われた時刻が古いものから削除する"""
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _EVICT_TARGET_RATIO if total > self.max_bytes else total
+        removed = 0
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # 別のプロセスが先に削除した
+                pass
+            except OSError as e:
+                logger.warning(f"レンダーキャッシュの削除に失敗しました: {path} - {str(e)}")
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._total_bytes = total
+        if removed:
+            logger.info(f"Render cache: evicted {removed} entries ({total / (1024 * 1024):.1f} MB left)")
+
+
+# プロセス全体で共有するキャッシュ（configure() または config.py で有効にする）。
+# import 時に設定を読み込まないように、最初に使うときに作成する
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """プロセス全体で共有する RenderCache"""
+    global _render_cache
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache()
+    return _render_cache
+
+
+def __getattr__(name):
+    # render_cache としても参照できる（最初に参照したときに作成する）
+    if name == 'render_cache':
+        return get_render_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,171 @@
+"""
+Long-running conversion server with warm WebDrivers
+"""
+
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .api import ConversionJob
+from .client import DEFAULT_HOST, DEFAULT_PORT
+from .logger import logger
+from .pool import DriverPool
+from .presets import prebuild_presets
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """初期化済みのWebDriverを保持し、HTTPで変換ジョブを受け付けるサーバー
+
+    ジョブは上限付きのキューに積まれ、ワーカーごとのWebDriverで順に処理される。
+    キューが一杯の場合は 503 を返す。変換に失敗したWebDriverは作り直し、
+    job_timeout 秒以内に終わらず 504 を返したジョブは、まだ実行していなければ破棄する。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=1, headless=True, queue_size=16, job_timeout=300):
+        super().__init__((host, port), ConversionRequestHandler)
+        self.workers = max(1, workers)
+        self.job_timeout = job_timeout
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.pool = DriverPool(self.workers, headless=headless)
+        self._worker_threads = []
+
+    def start_workers(self):
+        """WebDriverを起動してワーカースレッドを開始"""
+        self._warm_presets()
+        for worker_id in range(self.workers):
+            thread = threading.Thread(target=self._worker, args=(worker_id,),
+                                      name=f'md2pdf-server-{worker_id}', daemon=True)
+            thread.start()
+            self._worker_threads.append(thread)
+
+    def _warm_presets(self):
+        """プリセットのCSS・テンプレートを事前に組み立てておく"""
+        try:
+            prebuild_presets()
+        except Exception as e:
+            logger.warning(f"プリセットの事前読み込みに失敗しました: {str(e)}")
+
+    def _worker(self, worker_id):
+        try:
+            driver = self.pool.acquire()
+            logger.info(f"Server worker {worker_id} ready")
+        except Exception as e:
+            logger.error(f"サーバーワーカー{worker_id}: WebDriver作成エラー: {str(e)}", exc_info=True)
+            driver = None
+
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                # 応答の期限（504）を過ぎたジョブは印刷しない
+                if job.canceled:
+                    logger.info(f"Server worker {worker_id}: dropping a job whose client timed out")
+                    job.discard()
+                    continue
+                if driver is None:
+                    try:
+                        driver = self.pool.acquire()
+                    except Exception as e:
+                        logger.error(f"サーバーワーカー{worker_id}: WebDriver作成エラー: {str(e)}", exc_info=True)
+                        job.error = f"WebDriver作成エラー: {str(e)}"
+                        job.done.set()
+                        continue
+                try:
+                    job.run(driver)
+                except Exception as e:
+                    logger.error(f"サーバーワーカー{worker_id}: 変換エラー: {str(e)}", exc_info=True)
+                # 変換に失敗したWebDriverは作り直す（異常終了したChromeで後のジョブを失敗させない）
+                try:
+                    driver = self.pool.renew(driver, failed=not job)
+                except Exception as e:
+                    logger.error(f"サーバーワーカー{worker_id}: WebDriverを作り直せませんでした: {str(e)}")
+                    driver = None
+        finally:
+            if driver is not None:
+                self.pool.release(driver)
+
+    def submit(self, job):
+        """ジョブをキューに追加（一杯の場合は queue.Full）"""
+        self.jobs.put_nowait(job)
+
+    def server_close(self):
+        for _ in self._worker_threads:
+            self.jobs.put(None)
+        for thread in self._worker_threads:
+            thread.join(timeout=5)
+        self.pool.close()
+        super().server_close()
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """POST /convert と GET /health を処理するハンドラ"""
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {'error': 'not found'})
+            return
+        self._send_json(200, {
+            'status': 'ok',
+            'workers': self.server.workers,
+            'queued': self.server.jobs.qsize(),
+        })
+
+    def do_POST(self):
+        if self.path != '/convert':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = ConversionJob.from_request(json.loads(self.rfile.read(length)))
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        try:
+            self.server.submit(job)
+        except queue.Full:
+            self._send_json(503, {'error': 'queue is full'})
+            return
+
+        if not job.done.wait(self.server.job_timeout):
+            job.cancel()
+            self._send_json(504, {'error': 'conversion timed out'})
+            return
+        if job.error:
+            self._send_json(500, {'error': job.error})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(job.pdf_data)))
+        self.end_headers()
+        self.wfile.write(job.pdf_data)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"server: {self.address_string()} - {format % args}")
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=1, headless=True, queue_size=16):
+    """変換サーバーを起動して終了まで待機"""
+    server = ConversionServer(host, port, workers=workers, headless=headless, queue_size=queue_size)
+    server.start_workers()
+    logger.info(f"Conversion server listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Conversion server stopping")
+    finally:
+        server.server_close()
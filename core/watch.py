@@ -0,0 +1,336 @@
+"""
+Watch mode: rebuild PDFs when Markdown, styles, templates or images change
+"""
+
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .assets import asset_cache
+from .discovery import walk_directories, walk_markdown
+from .logger import logger
+from .manifest import compute_fingerprint, find_local_images
+from .processor import process_directory, process_file, process_file_from_pool
+
+# 変更を監視するファイルの拡張子（出力のPDFやマニフェストは含めない）
+WATCHED_SUFFIXES = frozenset(('.md', '.css', '.html', '.htm', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.bmp'))
+
+# 最後の変更からこの秒数だけ変更がなければ再変換する
+DEFAULT_DEBOUNCE = 0.3
+
+# ポーリングで監視する場合の間隔（秒）
+DEFAULT_POLL_INTERVAL = 1.0
+
+# process_file に渡すオプション
+_FILE_OPTIONS = ('css_files', 'template_file', 'compact', 'font_size', 'highlight_classes', 'image_dpi', 'external_css')
+
+
+def _is_watched(path):
+    return path.suffix.lower() in WATCHED_SUFFIXES
+
+
+def _watched_directories(root, exclude=None, skip_dirs=None):
+    """root 以下で監視するディレクトリと名前順のエントリを返す（walk_markdown と同じ規則で除外する）"""
+    for directory, _, _, entries in walk_directories(root, exclude=exclude, skip_dirs=skip_dirs, warn=False):
+        yield Path(directory), entries
+
+
+class PollingWatcher:
+    """更新時刻とサイズを定期的に比較して変更を検出する（どのOSでも動作する）
+
+    サブディレクトリも含めて監視するディレクトリでは、.git・node_modules などや
+    ignore ファイル・exclude に一致するディレクトリ、skip_dirs に渡したパスの中は調べない。
+    """
+
+    def __init__(self, roots, interval=DEFAULT_POLL_INTERVAL, exclude=None, skip_dirs=None):
+        self.interval = interval
+        self.exclude = exclude
+        self.skip_dirs = skip_dirs
+        self.roots = []
+        self._snapshot = {}
+        self.set_roots(roots)
+
+    def set_roots(self, roots):
+        """監視するディレクトリ（(パス, サブディレクトリも含めるか) のリスト）を設定
+
+        監視中のファイルは前回の状態を保持するため、変換中の変更も次の wait で検出される。
+        """
+        self.roots = list(roots)
+        self._snapshot = dict(self._scan(), **self._snapshot)
+
+    def _directories(self, root, recursive):
+        if recursive:
+            yield from _watched_directories(root, self.exclude, self.skip_dirs)
+            return
+        try:
+            with os.scandir(root) as it:
+                yield Path(root), list(it)
+        except OSError:
+            return
+
+    def _scan(self):
+        snapshot = {}
+        for root, recursive in self.roots:
+            for directory, entries in self._directories(root, recursive):
+                for entry in entries:
+                    try:
+                        if not entry.is_dir(follow_symlinks=False) and _is_watched(Path(entry.name)):
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                    except OSError:
+                        continue
+        return snapshot
+
+    def wait(self, timeout):
+        """最大 timeout 秒待って、変更されたファイルのパスの集合を返す"""
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {Path(path) for path in set(snapshot) | set(self._snapshot)
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux の inotify で変更を検出する（ctypes でlibcを直接呼び出す）
+
+    除外するディレクトリは PollingWatcher と同じで、監視を追加しない。
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                  | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self, roots, exclude=None, skip_dirs=None):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._ctypes = ctypes
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.exclude = exclude
+        self.skip_dirs = skip_dirs
+        self.roots = set()
+        # ウォッチ記述子 -> (ディレクトリ, サブディレクトリも含めるか)
+        self._watches = {}
+        self._watched_dirs = set()
+        self.set_roots(roots)
+
+    @classmethod
+    def available(cls):
+        return sys.platform.startswith('linux')
+
+    def set_roots(self, roots):
+        """監視するディレクトリを追加（すでに監視しているディレクトリはそのまま）"""
+        for root, recursive in roots:
+            self.roots.add((Path(root), recursive))
+            self._add_tree(Path(root), recursive)
+
+    def _add_tree(self, root, recursive):
+        if not recursive:
+            self._add_watch(root, False)
+            return
+        for directory, _ in _watched_directories(root, self.exclude, self.skip_dirs):
+            self._add_watch(directory, True)
+
+    def _add_watch(self, directory, recursive):
+        if (directory, recursive) in self._watched_dirs or (directory, True) in self._watched_dirs:
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            logger.warning(f"監視を追加できませんでした: {directory} (errno {self._ctypes.get_errno()})")
+            return
+        self._watches[wd] = (directory, recursive)
+        self._watched_dirs.add((directory, recursive))
+
+    def wait(self, timeout):
+        """最大 timeout 秒待って、変更されたファイルのパスの集合を返す"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        created_dirs = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+                name = data[offset + self._EVENT.size:offset + self._EVENT.size + length].rstrip(b'\0')
+                offset += self._EVENT.size + length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    # イベントが溢れた場合はすべてのディレクトリが変更されたとみなす
+                    changed.update(directory for directory, _ in self._watches.values())
+                    continue
+                watch = self._watches.get(wd)
+                if watch is None or not name:
+                    continue
+                directory, recursive = watch
+                path = directory / os.fsdecode(name)
+                if mask & self.IN_ISDIR:
+                    if recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        created_dirs.add(path)
+                elif _is_watched(path):
+                    changed.add(path)
+
+        if created_dirs:
+            # 除外するかは ignore ファイルの規則で決まるため、監視の起点からたどり直して監視を追加する
+            for root, recursive in self.roots:
+                if recursive:
+                    self._add_tree(root, True)
+            changed.update(path for path in created_dirs if (path, True) in self._watched_dirs)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(roots, poll_interval=DEFAULT_POLL_INTERVAL, exclude=None, skip_dirs=None):
+    """inotify が使える場合は InotifyWatcher、使えない場合は PollingWatcher を作成
+
+    exclude・skip_dirs は walk_markdown と同じで、サブディレクトリも含めて監視するディレクトリに適用する。
+    """
+    if InotifyWatcher.available():
+        try:
+            return InotifyWatcher(roots, exclude=exclude, skip_dirs=skip_dirs)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotifyを使用できないためポーリングで監視します: {str(e)}")
+    return PollingWatcher(roots, poll_interval, exclude=exclude, skip_dirs=skip_dirs)
+
+
+def wait_for_changes(watcher, debounce=DEFAULT_DEBOUNCE, stop_event=None):
+    """変更を待ち、debounce 秒間変更が続かなくなった時点でまとめて返す（停止した場合は None）"""
+    changes = set()
+    while stop_event is None or not stop_event.is_set():
+        changed = watcher.wait(debounce if changes else 0.5)
+        if changed:
+            changes |= changed
+        elif changes:
+            return changes
+    return None
+
+
+def _watch_roots(input_path, output_path, directory, options):
+    """入力・CSS・テンプレート・画像のディレクトリを監視対象として返す
+
+    画像などは除外されたディレクトリ（.gitignore で無視される生成物など）にあっても監視する。
+    """
+    input_path = Path(input_path).resolve()
+    if directory:
+        roots = {(input_path, True)}
+        md_files = walk_markdown(input_path, include=options.get('include'), exclude=options.get('exclude'),
+                                 skip_dirs=[output_path])
+    else:
+        roots = {(input_path.parent, False)}
+        md_files = [input_path]
+
+    bundle = asset_cache.get_bundle(options.get('css_files'), options.get('template_file'),
+                                    options.get('compact', False), options.get('font_size', 16),
+                                    options.get('highlight_classes', False))
+    paths = [Path(path) for path, _ in bundle.dependencies]
+    for md_file in md_files:
+        try:
+            paths.extend(find_local_images(md_file.read_text(encoding='utf-8', errors='replace'), md_file.parent))
+        except OSError:
+            continue
+
+    for path in paths:
+        parent = path.resolve().parent
+        if parent.is_dir() and (parent, True) not in roots:
+            roots.add((parent, False))
+    return sorted(roots)
+
+
+def watch(input_path, output_path, driver=None, directory=False, pool=None, debounce=DEFAULT_DEBOUNCE,
+          poll_interval=DEFAULT_POLL_INTERVAL, stop_event=None, on_build=None, **options):
+    """入力を監視し、変更があるたびに変換し直す（stop_event がセットされるまで戻らない）
+
+    driver・pool は起動したまま使い回す（pool を渡した場合は driver より優先し、変換のたびに
+    pool.renew() で作り直しを確認する）。ディレクトリの場合は差分ビルドで変更の影響を受ける
+    PDF（CSS・テンプレートの変更ならすべて）とマージ結果だけを作り直す。
+    options は process_directory（単一ファイルの場合は process_file と deadline・retries）のオプション。
+    on_build(changes, ok, elapsed) は変換のたびに呼ばれる（最初の変換では changes は None）。
+    """
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    stop_event = stop_event or threading.Event()
+    file_options = {key: value for key, value in options.items() if key in _FILE_OPTIONS}
+    last_fingerprint = None
+
+    def build(changes):
+        nonlocal last_fingerprint
+        started = time.perf_counter()
+        if directory:
+            ok = process_directory(input_path, output_path, driver, incremental=True, pool=pool, **options)
+        else:
+            try:
+                fingerprint = compute_fingerprint(input_path, **file_options)
+            except Exception as e:
+                logger.warning(f"ハッシュ計算エラー: {input_path} - {str(e)}")
+                fingerprint = None
+            if changes is not None and fingerprint is not None and fingerprint == last_fingerprint:
+                logger.debug("変更は出力に影響しないため変換を省略します: %s", sorted(map(str, changes)))
+                return
+            if pool is not None:
+                try:
+                    ok = bool(process_file_from_pool(input_path, output_path, pool, deadline=options.get('deadline'),
+                                                     retries=options.get('retries', 0), **file_options))
+                except Exception as e:
+                    logger.error(f"変換エラー: {input_path} - {str(e)}", exc_info=True)
+                    ok = False
+            else:
+                ok = bool(process_file(input_path, output_path, driver, **file_options))
+            last_fingerprint = fingerprint if ok else None
+        if on_build:
+            on_build(changes, ok, time.perf_counter() - started)
+
+    build(None)
+    # ディレクトリの場合は変換対象の探索と同じ規則で除外し、出力ディレクトリも監視しない
+    watcher = create_watcher(_watch_roots(input_path, output_path, directory, options), poll_interval,
+                             exclude=options.get('exclude'), skip_dirs=[output_path] if directory else None)
+    logger.info(f"Watching {input_path} with {type(watcher).__name__}")
+    try:
+        while not stop_event.is_set():
+            changes = wait_for_changes(watcher, debounce, stop_event)
+            if not changes:
+                continue
+            logger.info(f"Changes detected: {len(changes)} file(s)")
+            build(changes)
+            # 新しく参照された画像などのディレクトリを監視に追加
+            watcher.set_roots(_watch_roots(input_path, output_path, directory, options))
+    finally:
+        watcher.close()
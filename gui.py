@@ -4,7 +4,9 @@ Markdown to PDF converter GUI interface
 """
 
 import logging
+import queue
 import sys
+import threading
 from pathlib import Path
 
 from PySide6.QtCore import Qt, QThread, Signal
@@ -26,37 +28,37 @@ from PySide6.QtWidgets import (
     QWidget,
 )
 
-from core import create_driver, process_directory, process_file, get_preset_config
+from core import create_driver, process_directory, process_file, get_preset_config, quit_driver
+from core.logger import LOG_FORMAT, configure_logging, file_handler
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# ファイルハンドラの設定
-log_file = Path('pdf_converter.log')
-file_handler = logging.FileHandler(log_file, encoding='utf-8')
-file_handler.setLevel(logging.DEBUG)
+# ログファイルは core と同じハンドラで書き込む（ローテーション・バックグラウンドでの書き込みを共有する）
+configure_logging()
+logger.addHandler(file_handler())
 
 # コンソールハンドラの設定
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
-
-# フォーマッタの設定
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
+console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
 
 # ハンドラの追加
-logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
-class ConversionWorker(QThread):
-    """変換処理を別スレッドで実行するためのワーカークラス"""
-    progress = Signal(str)
-    finished = Signal(bool, str)  # 成功/失敗とエラーメッセージを送信
+# ジョブが中止された場合に finished で送るメッセージ
+CANCELED_MESSAGE = "中止されました"
+
+
+class GuiJob:
+    """キューに積む1件の変換ジョブ（core.api.ConversionJob とは別のGUI用のジョブ）"""
+    
+    _next_id = 1
     
     def __init__(self, input_path, output_path, css_files=None, template_file=None, compact=False, font_size=16, merge=False, merge_name=None, selected_files=None):
-        super().__init__()
+        self.id = GuiJob._next_id
+        GuiJob._next_id += 1
         self.input_path = input_path
         self.output_path = output_path
         self.css_files = css_files
@@ -66,88 +68,201 @@ class ConversionWorker(QThread):
         self.merge = merge
         self.merge_name = merge_name
         self.selected_files = selected_files
+        self.cancel_event = threading.Event()
+    
+    def __str__(self):
+        return f"#{self.id} {self.input_path}"
+
+
+class ConversionWorker(QThread):
+    """変換処理を別スレッドで実行するためのワーカークラス
+    
+    起動するとすぐにWebDriverを作成し（事前起動）、アプリケーションの終了まで使い回す。
+    ジョブは enqueue() で実行中にも追加でき、キューに積まれた順に1件ずつ処理する。
+    """
+    progress = Signal(str)
+    driver_ready = Signal(bool, str)  # WebDriverの起動の成功/失敗とエラーメッセージ
+    job_started = Signal(int, str)  # ジョブIDと入力パス
+    file_progress = Signal(int, int, int)  # ジョブID、変換済みのファイル数、全体のファイル数
+    finished = Signal(int, bool, str)  # ジョブID、成功/失敗とエラーメッセージを送信
+    
+    def __init__(self):
+        super().__init__()
         self.driver = None
+        self.current_job = None
+        self._jobs = queue.Queue()
+        self._pending = []
+        self._lock = threading.Lock()
+    
+    def enqueue(self, job):
+        """ジョブをキューに追加"""
+        with self._lock:
+            self._pending.append(job)
+        self._jobs.put(job)
+        logger.info(f"ジョブを追加: {job}")
+    
+    def pending_count(self):
+        """実行待ちのジョブ数"""
+        with self._lock:
+            return len(self._pending)
+    
+    def cancel_current(self):
+        """実行中のジョブを次のファイルに進む前に中止"""
+        with self._lock:
+            job = self.current_job
+            if job is not None:
+                job.cancel_event.set()
+    
+    def cancel_all(self):
+        """実行中のジョブと実行待ちのジョブをすべて中止"""
+        # 実行待ちから実行中に移る途中のジョブも取りこぼさないように、同じロックの中で中止する
+        with self._lock:
+            for job in self._pending:
+                job.cancel_event.set()
+            if self.current_job is not None:
+                self.current_job.cancel_event.set()
+    
+    def stop(self):
+        """すべてのジョブを中止してスレッドを終了（WebDriverも終了する）"""
+        self.cancel_all()
+        self._jobs.put(None)
+    
+    def _ensure_driver(self):
+        if self.driver is None:
+            logger.debug("WebDriver作成開始")
+            self.driver = create_driver(False)
+            logger.debug("WebDriver作成完了")
+        return self.driver
+    
+    def _quit_driver(self):
+        if self.driver is None:
+            return
+        driver, self.driver = self.driver, None
+        try:
+            logger.debug("WebDriver終了開始")
+            quit_driver(driver)
+            logger.debug("WebDriver終了完了")
+        except Exception as e:
+            logger.error(f"WebDriverの終了中にエラーが発生しました: {str(e)}", exc_info=True)
     
     def run(self):
-        error_occurred = False
+        # 最初のジョブを待たずにブラウザを起動しておく
+        try:
+            self._ensure_driver()
+            self.driver_ready.emit(True, "")
+        except Exception as e:
+            logger.error(f"WebDriverの事前起動に失敗しました: {str(e)}", exc_info=True)
+            self.driver_ready.emit(False, str(e))
+        
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+                # 実行待ちから外すのと実行中にするのを同じロックの中で行う
+                with self._lock:
+                    self._pending.remove(job)
+                    canceled = job.cancel_event.is_set()
+                    if not canceled:
+                        self.current_job = job
+                if canceled:
+                    logger.info(f"ジョブを中止しました: {job}")
+                    self.finished.emit(job.id, False, CANCELED_MESSAGE)
+                    continue
+                try:
+                    self.run_job(job)
+                finally:
+                    with self._lock:
+                        self.current_job = None
+        finally:
+            self._quit_driver()
+    
+    def run_job(self, job):
         error_message = ""
+        self.job_started.emit(job.id, str(job.input_path))
+        # ブラウザの段階で失敗した（異常終了・応答なしの可能性がある）ファイルがあったか
+        browser_failed = [False]
+        
+        def on_progress(done, total, result):
+            self.file_progress.emit(job.id, done, total)
+            if result is not None:
+                status = "✓" if result else "✗"
+                self.progress.emit(f"{status} [{done}/{total}] {result.input_path.name}")
+                if not result and result.retryable:
+                    browser_failed[0] = True
         
         try:
-            logger.info(f"変換処理を開始: 入力={self.input_path}, 出力={self.output_path}")
-            logger.debug(f"設定: css_files={self.css_files}, compact={self.compact}, font_size={self.font_size}")
+            logger.info(f"変換処理を開始: 入力={job.input_path}, 出力={job.output_path}")
+            logger.debug(f"設定: css_files={job.css_files}, compact={job.compact}, font_size={job.font_size}")
             
-            # WebDriver作成
-            logger.debug("WebDriver作成開始")
-            self.driver = create_driver(False)
-            logger.debug("WebDriver作成完了")
+            driver = self._ensure_driver()
             
             success = False
-            if self.selected_files:
-                logger.info(f"選択されたファイルを処理: {self.selected_files}")
+            if job.selected_files:
+                logger.info(f"選択されたファイルを処理: {job.selected_files}")
                 success = process_directory(
-                    Path(self.input_path), self.output_path, self.driver,
-                    css_files=self.css_files,
-                    template_file=self.template_file,
-                    compact=self.compact,
-                    font_size=self.font_size,
-                    merge=self.merge,
-                    merge_name=self.merge_name,
-                    selected_files=[Path(f) for f in self.selected_files]
+                    Path(job.input_path), job.output_path, driver,
+                    css_files=job.css_files,
+                    template_file=job.template_file,
+                    compact=job.compact,
+                    font_size=job.font_size,
+                    merge=job.merge,
+                    merge_name=job.merge_name,
+                    selected_files=[Path(f) for f in job.selected_files],
+                    progress=on_progress,
+                    cancel_event=job.cancel_event
                 )
-            elif self.input_path.is_dir():
-                logger.info(f"ディレクトリを処理: {self.input_path}")
+            elif job.input_path.is_dir():
+                logger.info(f"ディレクトリを処理: {job.input_path}")
                 success = process_directory(
-                    self.input_path, self.output_path, self.driver,
-                    css_files=self.css_files,
-                    template_file=self.template_file,
-                    compact=self.compact,
-                    font_size=self.font_size,
-                    merge=self.merge,
-                    merge_name=self.merge_name
+                    job.input_path, job.output_path, driver,
+                    css_files=job.css_files,
+                    template_file=job.template_file,
+                    compact=job.compact,
+                    font_size=job.font_size,
+                    merge=job.merge,
+                    merge_name=job.merge_name,
+                    progress=on_progress,
+                    cancel_event=job.cancel_event
                 )
             else:
-                logger.info(f"単一ファイルを処理: {self.input_path}")
-                success = process_file(
-                    self.input_path, self.output_path, self.driver,
-                    css_files=self.css_files,
-                    template_file=self.template_file,
-                    compact=self.compact,
-                    font_size=self.font_size
+                logger.info(f"単一ファイルを処理: {job.input_path}")
+                on_progress(0, 1, None)
+                result = process_file(
+                    job.input_path, job.output_path, driver,
+                    css_files=job.css_files,
+                    template_file=job.template_file,
+                    compact=job.compact,
+                    font_size=job.font_size
                 )
+                on_progress(1, 1, result)
+                success = bool(result)
             
             logger.debug(f"変換処理結果: success={success}")
             
-            if success:
+            # 失敗したWebDriverは使い回さず、次のジョブでは作り直す
+            if not success and browser_failed[0]:
+                logger.warning("ブラウザでの変換に失敗したため、WebDriverを作り直します")
+                self._quit_driver()
+            
+            if job.cancel_event.is_set():
+                logger.info(f"ジョブを中止しました: {job}")
+                self.finished.emit(job.id, False, CANCELED_MESSAGE)
+            elif success:
                 logger.info("変換処理が正常に完了しました")
-                self.finished.emit(True, "")
+                self.finished.emit(job.id, True, "")
             else:
                 error_message = "変換処理が失敗しました（詳細は上記のログを確認してください）"
                 logger.error(error_message)
-                error_occurred = True
+                self.finished.emit(job.id, False, error_message)
                 
         except Exception as e:
             import traceback
             error_message = f"変換処理中に予期せぬエラーが発生しました:\n\nエラー: {str(e)}\n\nスタックトレース:\n{traceback.format_exc()}"
             logger.error(error_message)
-            error_occurred = True
-            
-        finally:
-            # WebDriverのクリーンアップ
-            if self.driver:
-                try:
-                    logger.debug("WebDriver終了開始")
-                    self.driver.quit()
-                    logger.debug("WebDriver終了完了")
-                except Exception as e:
-                    cleanup_error = f"WebDriverの終了中にエラーが発生しました: {str(e)}"
-                    logger.error(cleanup_error, exc_info=True)
-                    if not error_occurred:
-                        error_message = cleanup_error
-                        error_occurred = True
-            
-            # 結果をシグナルで送信
-            if error_occurred:
-                self.finished.emit(False, error_message)
+            # ブラウザが異常終了した可能性があるため、次のジョブでは作り直す
+            self._quit_driver()
+            self.finished.emit(job.id, False, error_message)
 
 
 class MainWindow(QMainWindow):
@@ -236,10 +351,20 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(options_layout)
         
-        # 変換ボタン
+        # 変換ボタン（変換中に押すとキューに追加）とキャンセルボタン
+        button_layout = QHBoxLayout()
         self.convert_button = QPushButton("変換開始")
         self.convert_button.clicked.connect(self.start_conversion)
-        layout.addWidget(self.convert_button)
+        button_layout.addWidget(self.convert_button)
+        self.cancel_button = QPushButton("キャンセル")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_conversion)
+        button_layout.addWidget(self.cancel_button)
+        self.cancel_all_button = QPushButton("すべてキャンセル")
+        self.cancel_all_button.setEnabled(False)
+        self.cancel_all_button.clicked.connect(self.cancel_all_conversions)
+        button_layout.addWidget(self.cancel_all_button)
+        layout.addLayout(button_layout)
         
         # 進捗バー
         self.progress_bar = QProgressBar()
@@ -258,6 +383,16 @@ class MainWindow(QMainWindow):
         
         # 余白を追加
         layout.addStretch()
+        
+        # ブラウザを事前に起動し、ジョブを待つワーカースレッド
+        self.worker = ConversionWorker()
+        self.worker.progress.connect(self.update_progress)
+        self.worker.driver_ready.connect(self.driver_ready)
+        self.worker.job_started.connect(self.job_started)
+        self.worker.file_progress.connect(self.file_progress)
+        self.worker.finished.connect(self.conversion_finished)
+        self.worker.start()
+        self.status_label.setText("ブラウザを起動中...")
     
     def select_input(self):
         """入力ファイル/ディレクトリを選択"""
@@ -327,12 +462,6 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "エラー", "マージオプションが有効な場合、マージ後のファイル名を指定してください")
             return
         
-        # 変換処理を開始
-        self.convert_button.setEnabled(False)
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setRange(0, 0)  # 不確定プログレスバー
-        self.status_label.setText("変換中...")
-        
         # プリセット処理
         css_files = None
         template_file = None
@@ -346,8 +475,8 @@ class MainWindow(QMainWindow):
             # プリセットが選択されていない場合は、手動で選択したCSSを使用
             css_files = [self.css_path.text()]
         
-        # ワーカースレッドを作成して開始
-        self.worker = ConversionWorker(
+        # ジョブをキューに追加（実行中のジョブがあれば終了後に開始）
+        job = GuiJob(
             input_path,
             output_path,
             css_files=css_files,
@@ -358,9 +487,47 @@ class MainWindow(QMainWindow):
             merge_name=self.merge_name.text() if self.merge_check.isChecked() else None,
             selected_files=getattr(self, 'selected_files', None)
         )
-        self.worker.progress.connect(self.update_progress)
-        self.worker.finished.connect(self.conversion_finished)
-        self.worker.start()
+        self.worker.enqueue(job)
+        self.cancel_all_button.setEnabled(True)
+        if self.worker.current_job is not None:
+            self.log_area.append(f"キューに追加しました: {job}（待ち: {self.worker.pending_count()}件）")
+    
+    def cancel_conversion(self):
+        """実行中のジョブを次のファイルに進む前に中止"""
+        self.worker.cancel_current()
+        self.cancel_button.setEnabled(False)
+        self.status_label.setText("キャンセル中...")
+    
+    def cancel_all_conversions(self):
+        """実行中と実行待ちのジョブをすべて中止"""
+        self.worker.cancel_all()
+        self.cancel_button.setEnabled(False)
+        self.cancel_all_button.setEnabled(False)
+        self.status_label.setText("キャンセル中...")
+    
+    def driver_ready(self, success, error_message):
+        """ブラウザの事前起動が完了"""
+        if success:
+            self.status_label.setText("準備完了")
+        else:
+            # 起動に失敗した場合は最初のジョブで再度起動を試みる
+            self.status_label.setText("ブラウザの起動に失敗しました")
+            self.log_area.append(f"ブラウザの起動に失敗しました: {error_message}")
+    
+    def job_started(self, job_id, input_path):
+        """ジョブの開始"""
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, 0)  # ファイル数がわかるまでは不確定プログレスバー
+        self.cancel_button.setEnabled(True)
+        self.cancel_all_button.setEnabled(True)
+        pending = self.worker.pending_count()
+        self.status_label.setText(f"変換中: {input_path}" + (f"（待ち: {pending}件）" if pending else ""))
+        self.log_area.append(f"変換開始: #{job_id} {input_path}")
+    
+    def file_progress(self, job_id, done, total):
+        """ファイル単位の進捗を表示"""
+        self.progress_bar.setRange(0, max(total, 1))
+        self.progress_bar.setValue(done)
     
     def update_progress(self, message):
         """進捗状況を更新"""
@@ -368,21 +535,34 @@ class MainWindow(QMainWindow):
         self.log_area.append(message)
         logger.info(message)
     
-    def conversion_finished(self, success, error_message):
+    def conversion_finished(self, job_id, success, error_message):
         """変換処理が完了"""
-        self.convert_button.setEnabled(True)
-        self.progress_bar.setVisible(False)
+        queue_empty = self.worker.pending_count() == 0
+        if queue_empty:
+            self.progress_bar.setVisible(False)
+            self.cancel_button.setEnabled(False)
+            self.cancel_all_button.setEnabled(False)
         
         if success:
             self.status_label.setText("変換が完了しました")
-            self.log_area.append("変換が完了しました")
-            QMessageBox.information(self, "完了", "変換が正常に完了しました")
+            self.log_area.append(f"変換が完了しました: #{job_id}")
+            if queue_empty:
+                QMessageBox.information(self, "完了", "変換が正常に完了しました")
+        elif error_message == CANCELED_MESSAGE:
+            self.status_label.setText("変換を中止しました")
+            self.log_area.append(f"変換を中止しました: #{job_id}")
         else:
             error_text = f"変換に失敗しました\n\n{error_message}" if error_message else "変換に失敗しました"
             self.status_label.setText("変換に失敗しました")
             self.log_area.append(error_text)
             QMessageBox.critical(self, "エラー", error_text)
 
+    def closeEvent(self, event):
+        """ウィンドウを閉じるときにジョブを中止してブラウザを終了"""
+        self.worker.stop()
+        self.worker.wait()
+        super().closeEvent(event)
+
     def toggle_merge_name(self, state):
         """マージオプションの有効/無効に応じてファイル名入力フィールドを切り替え"""
         self.merge_name.setEnabled(state == Qt.CheckState.Checked.value)
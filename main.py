@@ -8,7 +8,9 @@ import logging
 import sys
 from pathlib import Path
 
-from core import create_driver, process_directory, process_file, get_preset_config
+from core import BatchMetrics, create_driver, process_directory, process_file, get_preset_config, quit_driver
+from core.client import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_SERVER_URL, convert_via_server
+from core.logger import configure_logging
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -25,9 +27,70 @@ console_handler.setFormatter(formatter)
 # ハンドラの追加
 logger.addHandler(console_handler)
 
+def write_metrics(metrics, args):
+    """指定された形式でメトリクスを書き込む"""
+    if metrics is None:
+        return
+    try:
+        if args.metrics_json:
+            metrics.write_json_lines(args.metrics_json)
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+    except Exception as e:
+        logger.error(f"メトリクスの書き込みに失敗しました: {str(e)}")
+    logger.info(metrics.format_summary())
+
+
+def run_watch(args, input_path, output_path, driver, css_files, template_file):
+    """入力の変更を監視して変換し直す（Ctrl+C で終了）"""
+    from core.pool import DriverPool
+    from core.watch import watch
+    
+    def on_build(changes, ok, elapsed):
+        what = "Initial build" if changes is None else f"Rebuild after {len(changes)} changed file(s)"
+        if ok:
+            logger.info(f"✓ {what} completed in {elapsed:.2f}s")
+        else:
+            logger.error(f"✗ {what} failed ({elapsed:.2f}s)")
+    
+    options = dict(
+        css_files=css_files,
+        template_file=template_file,
+        compact=args.compact,
+        font_size=args.font_size,
+        highlight_classes=args.highlight_classes,
+        image_dpi=args.image_dpi,
+        external_css=args.shared_css,
+        deadline=args.timeout,
+        retries=args.retries
+    )
+    if args.directory:
+        options.update(
+            merge=args.merge,
+            merge_name=args.name,
+            merge_mode=args.merge_mode,
+            optimize_pdf=args.optimize_pdf,
+            include=args.include,
+            exclude=args.exclude,
+            workers=args.workers,
+            headless=not args.no_headless,
+            render_processes=args.render_processes
+        )
+    
+    logger.info(f"Watching {input_path} for changes (Ctrl+C to stop)")
+    with DriverPool(args.workers, headless=not args.no_headless, drivers=[driver],
+                    recycle_after=args.recycle_after, max_memory_mb=args.max_browser_mb) as pool:
+        try:
+            # driver はプールに含まれるため、プールから借りて作り直し・期限を適用する
+            watch(input_path, output_path, directory=args.directory, pool=pool,
+                  debounce=args.debounce, on_build=on_build, **options)
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+
+
 def main():
     parser = argparse.ArgumentParser(description='Convert Markdown to PDF (Pure Python approach)')
-    parser.add_argument('input', help='Input Markdown file path or directory with -d option')
+    parser.add_argument('input', nargs='?', help='Input Markdown file path or directory with -d option')
     parser.add_argument('output', nargs='?', help='Output PDF file path or directory (optional)')
     parser.add_argument('--no-headless', action='store_true', help='Run in non-headless mode')
     parser.add_argument('--css', nargs='+', help='CSS files to apply (e.g., --css simple.css prism.css)')
@@ -35,17 +98,114 @@ def main():
                       help='Use predefined CSS and template combinations')
     parser.add_argument('--compact', action='store_true', help='Use compact layout for more content per page')
     parser.add_argument('--font-size', type=int, default=16, help='Base font size for PDF (default: 16px)')
+    parser.add_argument('--highlight-classes', action='store_true',
+                      help='Highlight code with CSS classes and one shared stylesheet instead of inline styles')
+    parser.add_argument('--image-dpi', type=int, metavar='DPI',
+                      help='Resize and recompress local images for printing at this DPI, 96 or higher; lower values are '
+                           'treated as 96 (cached on disk, requires Pillow)')
+    parser.add_argument('--shared-css', action='store_true',
+                      help='Link one shared stylesheet file instead of inlining the CSS into every document '
+                           '(pays off with -d, --watch and --chunk-lines, where many documents share it)')
+    parser.add_argument('--chunk-lines', type=int, metavar='LINES',
+                      help='Split a large single file at top-level headings and page breaks into parts of about '
+                           'this many lines, print them in parallel (--workers) and join them into one PDF')
     parser.add_argument('-d', '--directory', action='store_true', help='Process all Markdown files in the input directory')
     parser.add_argument('-m', '--merge', action='store_true', help='Merge all generated PDFs into a single file')
     parser.add_argument('-n', '--name', help='Name for the merged PDF file (required with -m option)')
+    parser.add_argument('--merge-mode', choices=['pdf', 'html'], default='pdf',
+                      help='How -m merges: "pdf" joins per-file PDFs and stamps page numbers, '
+                           '"html" prints all files as one document with browser footers (default: pdf)')
+    parser.add_argument('--optimize-pdf', action='store_true',
+                      help='With -m, remove duplicate fonts/images from the merged PDF and compress it '
+                           '(also linearized when pikepdf is installed)')
+    parser.add_argument('--include', nargs='+', metavar='PATTERN',
+                      help='With -d, convert files matching these .gitignore-style patterns (default: *.md)')
+    parser.add_argument('--exclude', nargs='+', metavar='PATTERN',
+                      help='With -d, skip files and directories matching these .gitignore-style patterns '
+                           '(.gitignore and .md2pdfignore files are honoured too)')
+    parser.add_argument('--incremental', action='store_true',
+                      help='With -d, skip files whose Markdown, styles, template, options and images are unchanged')
+    parser.add_argument('--workers', type=int, default=1, help='Number of parallel browser workers for -d or --chunk-lines (default: 1)')
+    parser.add_argument('--render-processes', type=int, default=0,
+                      help='With -d, render HTML in this many processes ahead of the browser workers (default: 0 = off)')
+    parser.add_argument('--recycle-after', type=int, metavar='N',
+                      help='With -d or --watch, restart each browser after converting N files')
+    parser.add_argument('--max-browser-mb', type=float, metavar='MB',
+                      help='With -d or --watch, restart a browser whose processes use more than MB of memory')
+    parser.add_argument('--timeout', type=float, metavar='SEC',
+                      help='With -d or --watch, kill the browser if printing one file takes longer than SEC seconds')
+    parser.add_argument('--retries', type=int, default=0,
+                      help='With -d or --watch, retry files that failed in the browser this many times on a fresh browser (default: 0)')
+    parser.add_argument('--watch', action='store_true',
+                      help='Keep the browser running and reconvert whenever the input, CSS, templates or images change')
+    parser.add_argument('--debounce', type=float, default=0.3,
+                      help='With --watch, seconds to wait after the last change before reconverting (default: 0.3)')
+    parser.add_argument('--serve', action='store_true', help='Run as a conversion server that keeps browsers warm')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'Host for --serve (default: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port for --serve (default: {DEFAULT_PORT})')
+    parser.add_argument('--queue-size', type=int, default=16, help='Maximum number of queued jobs for --serve (default: 16)')
+    parser.add_argument('--render-cache', nargs='?', const='', metavar='DIR',
+                      help='Reuse PDFs printed from identical HTML, assets and print options from this cache directory '
+                           '(default: RENDER_CACHE_CONFIG in config.py, ~/.cache/md2pdf/pdf)')
+    parser.add_argument('--render-cache-mb', type=float, metavar='MB',
+                      help='Size limit of the render cache; least recently used PDFs are removed (default: 1024)')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper,
+                      help='Level for pdf_converter.log (default: LOG_CONFIG in config.py, INFO)')
+    parser.add_argument('--metrics-json', metavar='PATH', help='Write per-file results and batch stats as JSON lines')
+    parser.add_argument('--metrics-prom', metavar='PATH', help='Write batch stats in Prometheus textfile format')
+    parser.add_argument('--server', metavar='URL', help=f'Convert through a running conversion server (e.g. {DEFAULT_SERVER_URL})')
     
     args = parser.parse_args()
     
+    if args.log_level:
+        configure_logging(args.log_level)
+    
     # マージオプションの検証
     if args.merge and not args.name:
         logger.error("Error: -n/--name option is required when using -m/--merge")
         sys.exit(1)
     
+    if args.workers < 1:
+        logger.error("Error: --workers must be 1 or greater")
+        sys.exit(1)
+    
+    if args.render_processes < 0:
+        logger.error("Error: --render-processes must be 0 or greater")
+        sys.exit(1)
+    
+    if args.retries < 0 or (args.recycle_after is not None and args.recycle_after < 1):
+        logger.error("Error: --retries must be 0 or greater and --recycle-after must be 1 or greater")
+        sys.exit(1)
+    
+    if args.render_cache is not None or args.render_cache_mb:
+        from core.render_cache import get_render_cache
+        render_cache = get_render_cache()
+        render_cache.configure(args.render_cache or None, args.render_cache_mb,
+                               enabled=args.render_cache is not None or render_cache.enabled)
+    
+    # 変換サーバーとして常駐
+    if args.serve:
+        from core.server import serve
+        logger.info(f"Starting conversion server on http://{args.host}:{args.port} (Ctrl+C to stop)")
+        serve(args.host, args.port, workers=args.workers,
+              headless=not args.no_headless, queue_size=args.queue_size)
+        return
+    
+    if not args.input:
+        parser.error('the following arguments are required: input')
+    
+    if args.server and args.directory:
+        logger.error("Error: --server cannot be combined with -d/--directory")
+        sys.exit(1)
+    
+    if args.chunk_lines and (args.directory or args.server):
+        logger.error("Error: --chunk-lines can only be used for a single file without --server")
+        sys.exit(1)
+    
+    if args.server and args.watch:
+        logger.error("Error: --server cannot be combined with --watch")
+        sys.exit(1)
+    
     # 入力パスの確認
     input_path = Path(args.input)
     if not input_path.exists():
@@ -72,18 +232,34 @@ def main():
             css_files = preset_config['css_files']
         template_file = preset_config['template_file']
     
+    if args.server:
+        # 起動済みの変換サーバーに処理を依頼
+        success = convert_via_server(
+            input_path, output_path, args.server,
+            css_files=css_files,
+            template_file=template_file,
+            compact=args.compact,
+            font_size=args.font_size,
+            highlight_classes=args.highlight_classes,
+            image_dpi=args.image_dpi
+        )
+        if success:
+            logger.info("✓ Conversion completed successfully!")
+        else:
+            logger.error("✗ Conversion failed!")
+            sys.exit(1)
+        return
+    
+    metrics = BatchMetrics() if args.metrics_json or args.metrics_prom else None
+    
     driver = None
     try:
         driver = create_driver(not args.no_headless)
         
-        if args.directory:
-            # ディレクトリ内のすべてのMarkdownファイルを処理
-            selected_files = list(input_path.glob('**/*.md'))
-            if not selected_files:
-                logger.error(f"No Markdown files found in {input_path}")
-                sys.exit(1)
-            
-            logger.info(f"Found {len(selected_files)} Markdown files to process")
+        if args.watch:
+            run_watch(args, input_path, output_path, driver, css_files, template_file)
+        elif args.directory:
+            # ディレクトリを探索しながら、見つかったMarkdownファイルから変換する
             success = process_directory(
                 input_path, output_path, driver,
                 css_files=css_files,
@@ -92,8 +268,24 @@ def main():
                 font_size=args.font_size,
                 merge=args.merge,
                 merge_name=args.name,
-                selected_files=selected_files
+                include=args.include,
+                exclude=args.exclude,
+                workers=args.workers,
+                headless=not args.no_headless,
+                highlight_classes=args.highlight_classes,
+                image_dpi=args.image_dpi,
+                external_css=args.shared_css,
+                incremental=args.incremental,
+                merge_mode=args.merge_mode,
+                optimize_pdf=args.optimize_pdf,
+                metrics=metrics,
+                render_processes=args.render_processes,
+                recycle_after=args.recycle_after,
+                max_memory_mb=args.max_browser_mb,
+                deadline=args.timeout,
+                retries=args.retries
             )
+            write_metrics(metrics, args)
             
             if not success:
                 logger.error("変換処理が失敗しました", exc_info=True)
@@ -112,8 +304,18 @@ def main():
                 css_files=css_files,
                 template_file=template_file,
                 compact=args.compact,
-                font_size=args.font_size
+                font_size=args.font_size,
+                highlight_classes=args.highlight_classes,
+                image_dpi=args.image_dpi,
+                chunk_lines=args.chunk_lines,
+                external_css=args.shared_css,
+                workers=args.workers,
+                headless=not args.no_headless
             )
+            if metrics is not None:
+                metrics.add(success)
+                metrics.finish()
+            write_metrics(metrics, args)
             
             if success:
                 logger.info("✓ Conversion completed successfully!")
@@ -126,8 +328,9 @@ def main():
         sys.exit(1)
     finally:
         if driver:
+            # プールで作り直す対象になった場合も終了していないため、ここで終了する
             try:
-                driver.quit()
+                quit_driver(driver)
             except Exception as e:
                 logger.error(f"WebDriverの終了中にエラーが発生しました: {str(e)}", exc_info=True)
 
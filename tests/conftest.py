@@ -0,0 +1,44 @@
+"""
+pytest の共通設定
+"""
+
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+# config.py がない環境（チェックアウト直後やCI）では config_sample.py の設定を使う
+try:
+    importlib.import_module('config.config')
+except ImportError:
+    sys.modules['config.config'] = importlib.import_module('config.config_sample')
+
+
+class CreatedDrivers(list):
+    """プールが作成したフェイクのWebDriverのリスト
+
+    upcoming に入れたWebDriverから順に使い、なくなった後は options を渡して FakeDriver を作成する。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.upcoming = []
+        self.options = {}
+
+    def create(self, headless=True):
+        from .fakes import FakeDriver
+        self.append(self.upcoming.pop(0) if self.upcoming else FakeDriver(**self.options))
+        return self[-1]
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """core.pool の create_driver をフェイクに差し替え、作成されたWebDriverのリストを返す"""
+    import core.pool
+    drivers = CreatedDrivers()
+    monkeypatch.setattr(core.pool, 'create_driver', drivers.create)
+    return drivers
@@ -0,0 +1,67 @@
+"""
+Test doubles for the Selenium WebDriver
+"""
+
+import base64
+import io
+import threading
+
+from PyPDF2 import PdfWriter
+
+
+def _blank_pdf():
+    writer = PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+# 印刷結果として返す1ページのPDF
+FAKE_PDF = _blank_pdf()
+
+
+class FakeDriver:
+    """Page.printToPDF などのCDPコマンドに応答するWebDriverの代わり
+
+    hang=True の場合、印刷は quit() されるまで戻らない（応答しなくなったブラウザの代わり）。
+    fail=True の場合は印刷が失敗する（異常終了したブラウザの代わり）。
+    ready=False の場合はページの読み込み待ちが期限切れになり、broken_images は読み込めなかった画像の数。
+    """
+
+    def __init__(self, hang=False, fail=False, ready=True, broken_images=0, browser_version='120.0'):
+        self.hang = hang
+        self.fail = fail
+        self.ready = ready
+        self.broken_images = broken_images
+        self.capabilities = {'browserVersion': browser_version}
+        self.prints = 0
+        self.quit_count = 0
+        self._quit = threading.Event()
+
+    def get(self, url):
+        pass
+
+    def implicitly_wait(self, seconds):
+        pass
+
+    def quit(self):
+        self.quit_count += 1
+        self._quit.set()
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == 'Page.printToPDF':
+            if self.hang:
+                self._quit.wait()
+                raise RuntimeError('browser was killed')
+            if self.fail:
+                raise RuntimeError('browser crashed')
+            self.prints += 1
+            return {'data': base64.b64encode(FAKE_PDF).decode('ascii')}
+        if cmd == 'Page.getFrameTree':
+            return {'frameTree': {'frame': {'id': 'frame'}}}
+        if cmd == 'Runtime.evaluate':
+            if params['expression'].lstrip().startswith('new Promise'):
+                return {'result': {'type': 'boolean', 'value': self.ready}}
+            return {'result': {'type': 'number', 'value': self.broken_images}}
+        return {}
@@ -0,0 +1,85 @@
+import pytest
+
+from core.discovery import IgnoreRule, is_ignored, walk_markdown
+
+
+def _rules(*lines):
+    return [rule for rule in (IgnoreRule.parse(line) for line in lines) if rule is not None]
+
+
+@pytest.mark.parametrize('pattern, path, is_dir, expected', [
+    ('*.md', 'a.md', False, True),
+    ('*.md', 'sub/a.md', False, True),
+    ('*.md', 'a.mdx', False, False),
+    ('draft?.md', 'draft1.md', False, True),
+    ('draft[0-9].md', 'drafta.md', False, False),
+    ('draft[!0-9].md', 'drafta.md', False, True),
+    # / を含むパターンは起点からのパス全体と比較する
+    ('/a.md', 'a.md', False, True),
+    ('/a.md', 'sub/a.md', False, False),
+    ('docs/*.md', 'docs/a.md', False, True),
+    ('docs/*.md', 'docs/sub/a.md', False, False),
+    ('docs/**/*.md', 'docs/sub/deep/a.md', False, True),
+    ('docs/**/*.md', 'docs/a.md', False, True),
+    ('**/build', 'x/y/build', True, True),
+    ('docs/**', 'docs/sub/a.md', False, True),
+    # 末尾の / はディレクトリだけに一致する
+    ('build/', 'build', True, True),
+    ('build/', 'build', False, False),
+])
+def test_rule_matches(pattern, path, is_dir, expected):
+    assert IgnoreRule(pattern).matches(path, is_dir) is expected
+
+
+def test_parse_skips_comments_and_handles_escapes():
+    assert IgnoreRule.parse('# comment') is None
+    assert IgnoreRule.parse('   \n') is None
+    assert IgnoreRule.parse('\\#notes.md').matches('#notes.md', False)
+    rule = IgnoreRule.parse('\\!important.md')
+    assert not rule.negate and rule.matches('!important.md', False)
+
+
+def test_last_matching_rule_wins():
+    rules = _rules('*.md', '!keep.md', 'keep.md')
+    assert is_ignored(rules, 'a.md', False)
+    assert is_ignored(rules, 'keep.md', False)
+    assert not is_ignored(_rules('*.md', '!keep.md'), 'keep.md', False)
+    assert not is_ignored(_rules('*.md', '!keep.md'), 'other.txt', False)
+
+
+def test_rules_from_subdirectory_apply_below_it():
+    rule = IgnoreRule.parse('/notes.md', base='docs')
+    assert rule.matches('docs/notes.md', False)
+    assert not rule.matches('notes.md', False)
+    assert not rule.matches('docs/sub/notes.md', False)
+
+
+def _write(root, *paths):
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text('# x\n', encoding='utf-8')
+
+
+def test_walk_markdown_honours_ignore_files_and_order(tmp_path):
+    _write(tmp_path, 'b.md', 'a.md', 'notes.txt', 'drafts/d.md', 'guide/z.md', 'guide/keep.md',
+           'guide/skip.md', 'node_modules/pkg/readme.md', 'out/result.md')
+    (tmp_path / '.gitignore').write_text('drafts/\n', encoding='utf-8')
+    (tmp_path / 'guide' / '.md2pdfignore').write_text('*.md\n!keep.md\n!z.md\n', encoding='utf-8')
+
+    found = [path.relative_to(tmp_path).as_posix()
+             for path in walk_markdown(tmp_path, skip_dirs=[tmp_path / 'out'])]
+
+    # 各ディレクトリで名前順（ファイル、サブディレクトリの順）
+    assert found == ['a.md', 'b.md', 'guide/keep.md', 'guide/z.md']
+
+
+def test_walk_markdown_include_exclude(tmp_path):
+    _write(tmp_path, 'a.md', 'b.markdown', 'drafts/c.md', 'docs/d.md')
+
+    found = [path.relative_to(tmp_path).as_posix()
+             for path in walk_markdown(tmp_path, include=['*.md', '*.markdown'], exclude=['drafts/'])]
+    assert found == ['a.md', 'b.markdown', 'docs/d.md']
+
+    found = [path.relative_to(tmp_path).as_posix()
+             for path in walk_markdown(tmp_path, use_ignore_files=False, exclude=['/docs'])]
+    assert found == ['a.md', 'drafts/c.md']
@@ -0,0 +1,10 @@
+from core.images import CSS_PIXELS_PER_INCH, ImageCache
+
+
+def test_target_width_never_drops_below_css_pixels(tmp_path):
+    image_cache = ImageCache(tmp_path, content_width=6.5)
+
+    assert image_cache.target_width(150) == 975
+    assert image_cache.target_width(CSS_PIXELS_PER_INCH) == 624
+    # 96 DPI 未満では最適化前（CSSピクセル）より小さくしない
+    assert image_cache.target_width(72) == 624
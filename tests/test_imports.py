@@ -0,0 +1,20 @@
+import subprocess
+import sys
+
+from .conftest import ROOT_DIR
+
+# 変換の処理を読み込んでも、共有キャッシュは最初に使うまで作成されない
+_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+import tests.conftest
+import core.processor, core.watch, core.api
+import core.images, core.render_cache
+print(core.images._image_cache is None and core.render_cache._render_cache is None)
+"""
+
+
+def test_shared_caches_are_created_on_first_use():
+    output = subprocess.run([sys.executable, '-c', _SCRIPT.format(root=str(ROOT_DIR))],
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'True'
@@ -0,0 +1,32 @@
+import logging
+
+import pytest
+
+from core.logger import configure_logging, file_handler, logger, shutdown_logging
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / 'md2pdf.log'
+    configure_logging('DEBUG', log_file=str(path), max_bytes=2000, backup_count=2)
+    yield path
+    configure_logging()
+
+
+def test_other_loggers_share_the_rotating_file(log_file):
+    gui_logger = logging.getLogger('tests.gui')
+    gui_logger.setLevel(logging.DEBUG)
+    gui_logger.addHandler(file_handler())
+    try:
+        for i in range(100):
+            logger.info("core message %d", i)
+            gui_logger.info("gui message %d", i)
+    finally:
+        gui_logger.removeHandler(file_handler())
+        shutdown_logging()
+
+    # どちらのロガーのログも、同じファイルに書き込まれてローテーションされる
+    files = sorted(log_file.parent.glob('md2pdf.log*'))
+    assert [path.name for path in files] == ['md2pdf.log', 'md2pdf.log.1', 'md2pdf.log.2']
+    text = log_file.read_text(encoding='utf-8')
+    assert 'core message 99' in text and 'gui message 99' in text
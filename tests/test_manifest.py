@@ -0,0 +1,82 @@
+import json
+
+from core.manifest import JOURNAL_NAME, MANIFEST_NAME, BuildManifest, compute_fingerprint
+from core.processor import process_directory
+
+from .fakes import FakeDriver
+
+
+def test_record_save_and_load(tmp_path):
+    pdf_path = tmp_path / 'sub' / 'a.pdf'
+    pdf_path.parent.mkdir()
+    pdf_path.write_bytes(b'%PDF')
+
+    manifest = BuildManifest(tmp_path)
+    manifest.record(pdf_path, 'abc')
+    manifest.save()
+
+    loaded = BuildManifest(tmp_path)
+    assert loaded.entries == {'sub/a.pdf': {'fingerprint': 'abc'}}
+    assert loaded.is_up_to_date(pdf_path, 'abc')
+    assert not loaded.is_up_to_date(pdf_path, 'def')
+    # 記録があってもPDFが削除されていれば変換し直す
+    pdf_path.unlink()
+    assert not loaded.is_up_to_date(pdf_path, 'abc')
+
+
+def test_broken_or_old_manifest_is_ignored(tmp_path):
+    (tmp_path / MANIFEST_NAME).write_text('{not json', encoding='utf-8')
+    assert BuildManifest(tmp_path).entries == {}
+
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps({'version': 0, 'files': {'a.pdf': {}}}), encoding='utf-8')
+    assert BuildManifest(tmp_path).entries == {}
+
+
+def test_fingerprint_tracks_images_and_options(tmp_path):
+    md_file = tmp_path / 'a.md'
+    md_file.write_text('# A\n\n![logo](logo.png)\n', encoding='utf-8')
+    (tmp_path / 'logo.png').write_bytes(b'red')
+    fingerprint = compute_fingerprint(md_file)
+
+    assert compute_fingerprint(md_file) == fingerprint
+    # 共有スタイルシートにしても出力のPDFは変わらない
+    assert compute_fingerprint(md_file, external_css=True) == fingerprint
+    assert compute_fingerprint(md_file, font_size=18) != fingerprint
+    (tmp_path / 'logo.png').write_bytes(b'blue')
+    assert compute_fingerprint(md_file) != fingerprint
+
+
+def test_incremental_build_converts_only_changed_files(tmp_path):
+    source = tmp_path / 'docs'
+    source.mkdir()
+    for name in ('a.md', 'b.md'):
+        (source / name).write_text(f'# {name}\n', encoding='utf-8')
+    output = tmp_path / 'out'
+
+    first = FakeDriver()
+    assert process_directory(source, output, first, incremental=True)
+    (source / 'b.md').write_text('# b changed\n', encoding='utf-8')
+    second = FakeDriver()
+    assert process_directory(source, output, second, incremental=True)
+
+    assert (first.prints, second.prints) == (2, 1)
+
+
+def test_interrupted_build_is_resumed_from_journal(tmp_path):
+    for name in ('a.pdf', 'b.pdf'):
+        (tmp_path / name).write_bytes(b'%PDF')
+    manifest = BuildManifest(tmp_path)
+    manifest.record(tmp_path / 'a.pdf', 'aaa')
+    manifest.record(tmp_path / 'b.pdf', 'bbb')
+    manifest.discard(tmp_path / 'b.pdf')
+    # save() する前に中断され、最後の行は書きかけで残った
+    manifest._journal.write('{"file": "c.pdf", "finger')
+    manifest._journal.close()
+
+    resumed = BuildManifest(tmp_path)
+    assert resumed.entries == {'a.pdf': {'fingerprint': 'aaa'}}
+    assert resumed.is_up_to_date(tmp_path / 'a.pdf', 'aaa')
+
+    resumed.save()
+    assert not (tmp_path / JOURNAL_NAME).exists()
+    assert BuildManifest(tmp_path).entries == {'a.pdf': {'fingerprint': 'aaa'}}
@@ -0,0 +1,68 @@
+import json
+
+from core.metrics import BatchMetrics, ConversionResult, percentile
+
+
+def _result(name, ok=True, **stages):
+    result = ConversionResult(f'{name}.md', f'{name}.pdf', ok=ok)
+    result.stages = stages
+    result.html_bytes = 100
+    result.pdf_bytes = 1000
+    # ページ数はPDFを読まずに固定する
+    result._page_count = 2 if ok else 0
+    return result
+
+
+def _metrics():
+    metrics = BatchMetrics()
+    metrics.add(_result('a', read=0.01, print=0.2))
+    metrics.add(_result('b', read=0.03, print=0.4))
+    metrics.add(_result('c', ok=False, read=0.02))
+    metrics.skip(2)
+    metrics.finish()
+    return metrics
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile([1, 2, 3, 4], 0.95) == 4
+
+
+def test_summary_counts_only_succeeded_results():
+    summary = _metrics().summary()
+
+    assert (summary['files'], summary['succeeded'], summary['failed'], summary['skipped']) == (3, 2, 1, 2)
+    assert summary['stages']['read']['count'] == 2
+    assert summary['stages']['read']['sum'] == 0.04
+    assert summary['stages']['cache']['count'] == 0
+    assert (summary['pdf_bytes'], summary['pages']) == (2000, 4)
+
+
+def test_write_json_lines(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    _metrics().write_json_lines(path)
+
+    records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [record['type'] for record in records] == ['conversion'] * 3 + ['summary']
+    assert records[0]['stages'] == {'read': 0.01, 'print': 0.2}
+    assert records[2]['ok'] is False and records[2]['pages'] == 0
+    assert records[-1]['succeeded'] == 2
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_write_prometheus(tmp_path):
+    path = tmp_path / 'md2pdf.prom'
+    _metrics().write_prometheus(path)
+
+    samples = {}
+    for line in path.read_text(encoding='utf-8').splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    assert samples['md2pdf_files{status="succeeded"}'] == 2
+    assert samples['md2pdf_files{status="failed"}'] == 1
+    assert samples['md2pdf_files{status="skipped"}'] == 2
+    assert samples['md2pdf_stage_seconds{stage="print",quantile="0.95"}'] == 0.4
+    assert samples['md2pdf_stage_seconds_count{stage="read"}'] == 2
+    assert samples['md2pdf_pages'] == 4
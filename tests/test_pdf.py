@@ -0,0 +1,171 @@
+import tracemalloc
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+from core.pdf import PdfBookWriter, add_footer_to_pdf, merge_pdfs
+
+
+def _make_pdf(path, name, pages=2, padding=0, link_to=None):
+    """ページごとに「name page N」と書かれ、先頭ページに出力先 /top を持つPDFを作成
+
+    padding はページごとのコンテンツストリームに加える（描画しない）バイト数。
+    link_to を指定すると、各ページにその名前の出力先へのリンクを付ける。
+    """
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    }))
+    for page_num in range(pages):
+        writer.add_blank_page(width=612, height=792)
+        page = writer.pages[page_num]
+        content = DecodedStreamObject()
+        content.set_data(b'%' + b'x' * padding + b'\nBT /F1 12 Tf 72 700 Td (%s page %d) Tj ET\n'
+                         % (name.encode('ascii'), page_num + 1))
+        page[NameObject('/Contents')] = writer._add_object(content)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font}),
+        })
+        if link_to:
+            page[NameObject('/Annots')] = ArrayObject([writer._add_object(DictionaryObject({
+                NameObject('/Type'): NameObject('/Annot'),
+                NameObject('/Subtype'): NameObject('/Link'),
+                NameObject('/Rect'): ArrayObject([NumberObject(72), NumberObject(690),
+                                                  NumberObject(200), NumberObject(710)]),
+                NameObject('/Dest'): NameObject(link_to),
+            }))])
+    writer._root_object[NameObject('/Dests')] = writer._add_object(DictionaryObject({
+        NameObject('/top'): ArrayObject([writer.pages[0].indirect_reference, NameObject('/Fit')]),
+    }))
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return path
+
+
+def _destinations(reader):
+    """出力先の名前と飛び先のページ番号（0始まり）"""
+    pages = {page.indirect_reference.idnum: page_num for page_num, page in enumerate(reader.pages)}
+    return {name: pages[dest[0].idnum] for name, dest in reader.trailer['/Root']['/Dests'].items()}
+
+
+def test_book_writer_joins_documents_in_index_order(tmp_path):
+    first = _make_pdf(tmp_path / 'first.pdf', 'first', link_to='/top')
+    second = _make_pdf(tmp_path / 'second.pdf', 'second', pages=1, link_to='/top')
+    output = tmp_path / 'book.pdf'
+
+    book = PdfBookWriter(output)
+    book.put(1, second)
+    book.put(0, first)
+    assert book.close() == 3
+
+    reader = PdfReader(str(output), strict=True)
+    texts = [page.extract_text() for page in reader.pages]
+    assert ['first page 1' in texts[0], 'first page 2' in texts[1], 'second page 1' in texts[2]] == [True] * 3
+    assert 'Page 3 of 3' in texts[2]
+    # 文書ごとの出力先は別名になり、リンクも付け替えられる
+    assert _destinations(reader) == {'/0-top': 0, '/1-top': 2}
+    assert [page['/Annots'][0].get_object()['/Dest'] for page in reader.pages] == ['/0-top', '/0-top', '/1-top']
+    assert not output.with_suffix('.part').exists()
+
+
+def test_redirected_destinations_point_at_the_target_page(tmp_path):
+    first = _make_pdf(tmp_path / 'first.pdf', 'first')
+    second = _make_pdf(tmp_path / 'second.pdf', 'second')
+    # 別の部分にある要素への出力先（prefix 付き）は、その要素の出力先と同じ位置に向ける
+    writer = PdfWriter()
+    writer.append(str(first))
+    writer._root_object[NameObject('/Dests')] = writer._add_object(DictionaryObject({
+        NameObject('/chunk-target'): ArrayObject([writer.pages[1].indirect_reference, NameObject('/Fit')]),
+    }))
+    with open(first, 'wb') as f:
+        writer.write(f)
+    second_writer = PdfWriter()
+    second_writer.append(str(second))
+    second_writer._root_object[NameObject('/Dests')] = second_writer._add_object(DictionaryObject({
+        NameObject('/target'): ArrayObject([second_writer.pages[1].indirect_reference, NameObject('/Fit')]),
+    }))
+    with open(second, 'wb') as f:
+        second_writer.write(f)
+    output = tmp_path / 'book.pdf'
+
+    book = PdfBookWriter(output, isolate_destinations=False)
+    book.append(first)
+    book.append(second)
+    assert book.redirect_destinations('chunk-') == 1
+    book.close()
+
+    assert _destinations(PdfReader(str(output))) == {'/chunk-target': 3, '/target': 3}
+
+
+def test_optimize_writes_identical_objects_once(tmp_path):
+    files = [_make_pdf(tmp_path / f'{index}.pdf', 'same', padding=4096) for index in range(3)]
+    plain = tmp_path / 'plain.pdf'
+    optimized = tmp_path / 'optimized.pdf'
+
+    assert merge_pdfs(files, plain)
+    assert merge_pdfs(files, optimized, optimize=True)
+
+    reader = PdfReader(str(optimized), strict=True)
+    fonts = {page['/Resources'].raw_get('/Font').raw_get('/F1').idnum for page in reader.pages}
+    assert len(fonts) == 1
+    assert optimized.stat().st_size < plain.stat().st_size / 3
+
+
+def test_memory_does_not_grow_with_merged_pages(tmp_path):
+    source = _make_pdf(tmp_path / 'source.pdf', 'large', pages=5, padding=100 * 1024)
+
+    def peak(documents):
+        tracemalloc.start()
+        try:
+            assert merge_pdfs([source] * documents, tmp_path / f'{documents}.pdf')
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    peak(1)
+    # 結合したページの内容（1文書あたり約500KB）は書き出した後に保持しない
+    assert peak(40) < peak(4) + 2 * 1024 * 1024
+    assert len(PdfReader(str(tmp_path / '40.pdf')).pages) == 200
+
+
+def test_discard_removes_the_partial_output(tmp_path):
+    output = tmp_path / 'book.pdf'
+    book = PdfBookWriter(output)
+    book.append(_make_pdf(tmp_path / 'first.pdf', 'first'))
+    assert output.with_suffix('.part').exists()
+
+    book.discard()
+
+    assert not output.with_suffix('.part').exists()
+    assert not output.exists()
+
+
+def test_footer_is_stamped_on_every_page(tmp_path):
+    output = tmp_path / 'stamped.pdf'
+
+    assert add_footer_to_pdf(_make_pdf(tmp_path / 'input.pdf', 'input', link_to='/top'), output, 'Credit')
+
+    reader = PdfReader(str(output), strict=True)
+    texts = [page.extract_text() for page in reader.pages]
+    assert 'input page 1' in texts[0] and 'Credit - Page 1 of 2' in texts[0]
+    assert 'input page 2' in texts[1] and 'Credit - Page 2 of 2' in texts[1]
+    # 出力先とリンクは名前を変えずに引き継ぐ
+    assert _destinations(reader) == {'/top': 0}
+    assert reader.pages[1]['/Annots'][0].get_object()['/Dest'] == '/top'
+
+
+def test_footer_stamping_memory_does_not_grow_with_page_content(tmp_path):
+    def peak(pages):
+        source = _make_pdf(tmp_path / f'{pages}.pdf', 'large', pages=pages, padding=20 * 1024)
+        tracemalloc.start()
+        try:
+            assert add_footer_to_pdf(source, tmp_path / f'{pages}-stamped.pdf')
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    peak(1)
+    # 書き出したページの内容（1ページあたり約20KB）は保持しない
+    assert peak(400) < peak(40) + 1024 * 1024
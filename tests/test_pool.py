@@ -0,0 +1,28 @@
+from core.driver import kill_driver, quit_driver
+from core.pool import DriverPool
+
+from .fakes import FakeDriver
+
+
+def test_renew_hands_back_external_driver_unquit(created):
+    external = FakeDriver()
+    with DriverPool(1, drivers=[external], recycle_after=1) as pool:
+        driver = pool.acquire()
+        assert driver is external
+        driver = pool.renew(driver)
+        assert driver is created[0]
+        assert external.quit_count == 0
+        # プールが作成したWebDriverは作り直すときに終了する
+        pool.release(pool.renew(driver, failed=True))
+    assert external.quit_count == 0
+    assert created[0].quit_count == 1
+    assert created[1].quit_count == 1
+    assert pool.recycled == 2
+
+
+def test_quit_driver_skips_killed_driver():
+    driver = FakeDriver()
+    kill_driver(driver)
+    quit_driver(driver)
+    # プロセスが見つからない場合の kill_driver の quit() だけが呼ばれる
+    assert driver.quit_count == 1
@@ -0,0 +1,80 @@
+import pytest
+
+from core.metrics import BatchMetrics
+from core.processor import process_directory
+
+from .fakes import FakeDriver
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / 'docs'
+    source.mkdir()
+    for name in ('a.md', 'b.md'):
+        (source / name).write_text(f'# {name}\n', encoding='utf-8')
+    return source
+
+
+def _attempts(metrics):
+    """ファイル名順の (成否, 試行回数)（結果は終わった順に記録される）"""
+    return [(bool(result), result.attempts) for result in sorted(metrics.results, key=lambda r: r.input_path.name)]
+
+
+def test_browser_failures_are_retried_on_fresh_browsers(tmp_path, source, created):
+    crashed = FakeDriver(fail=True)
+    metrics = BatchMetrics()
+
+    assert process_directory(source, tmp_path / 'out', crashed, retries=1, metrics=metrics)
+
+    assert _attempts(metrics) == [(True, 2), (True, 1)]
+    assert crashed.quit_count == 0
+    assert sum(driver.prints for driver in created) == 2
+
+
+def test_failures_are_reported_when_retries_run_out(tmp_path, source, created):
+    created.options = {'fail': True}
+    metrics = BatchMetrics()
+
+    assert not process_directory(source, tmp_path / 'out', FakeDriver(fail=True), retries=1, metrics=metrics)
+
+    assert _attempts(metrics) == [(False, 2), (False, 2)]
+
+
+def test_hung_print_is_killed_after_deadline(tmp_path, source, created):
+    hung = FakeDriver(hang=True)
+    metrics = BatchMetrics()
+
+    assert process_directory(source, tmp_path / 'out', hung, deadline=0.5, retries=1, metrics=metrics)
+
+    assert _attempts(metrics) == [(True, 2), (True, 1)]
+    assert hung.quit_count == 1
+
+
+def test_merge_is_not_written_when_a_result_is_missing(tmp_path, source, monkeypatch):
+    import core.processor
+    from core.pdf import PdfBookWriter
+
+    class LosingBookWriter(PdfBookWriter):
+        # 2番目のファイルの結果が届かなかった場合（ワーカーの異常終了など）
+        def put(self, index, pdf_path):
+            if index != 1:
+                super().put(index, pdf_path)
+
+    monkeypatch.setattr(core.processor, 'PdfBookWriter', LosingBookWriter)
+    output = tmp_path / 'out'
+
+    assert not process_directory(source, output, FakeDriver(), merge=True, merge_name='book', incremental=True)
+
+    assert not (output / 'book.pdf').exists()
+    assert 'book.pdf' not in (output / '.md2pdf-manifest.json').read_text(encoding='utf-8')
+
+
+def test_merge_joins_files_in_order(tmp_path, source):
+    from PyPDF2 import PdfReader
+
+    output = tmp_path / 'out'
+    assert process_directory(source, output, FakeDriver(), merge=True, merge_name='book', workers=2)
+
+    reader = PdfReader(str(output / 'book.pdf'))
+    assert len(reader.pages) == 2
+    assert 'Page 2 of 2' in reader.pages[1].extract_text()
@@ -0,0 +1,94 @@
+import io
+import os
+
+import pytest
+
+import core.render_cache
+from core.pdf import html_to_pdf
+from core.render_cache import RenderCache
+
+from .fakes import FAKE_PDF, FakeDriver
+
+HTML = '<html><body><img src="a.png"></body></html>'
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    render_cache = RenderCache(tmp_path / 'cache', max_size_mb=10, enabled=True)
+    monkeypatch.setattr(core.render_cache, '_render_cache', render_cache)
+    return render_cache
+
+
+def _entries(render_cache):
+    return sorted(os.path.basename(path) for path, _, _ in render_cache._scan())
+
+
+def test_key_covers_local_assets_and_print_options(tmp_path):
+    render_cache = RenderCache(tmp_path / 'cache')
+    (tmp_path / 'a.png').write_bytes(b'red')
+    key = render_cache.key(HTML, tmp_path, {'landscape': False})
+
+    assert render_cache.key(HTML, tmp_path, {'landscape': False, 'transferMode': 'ReturnAsStream'}) == key
+    assert render_cache.key(HTML, tmp_path, {'landscape': True}) != key
+    assert render_cache.key(HTML, tmp_path, {'landscape': False}, browser_version='121') != key
+    os.utime(tmp_path / 'a.png', ns=(0, 0))
+    (tmp_path / 'a.png').write_bytes(b'blue')
+    assert render_cache.key(HTML, tmp_path, {'landscape': False}) != key
+
+
+def test_key_ignores_relative_assets_without_source_dir(tmp_path, monkeypatch):
+    render_cache = RenderCache(tmp_path / 'cache')
+    monkeypatch.chdir(tmp_path)
+    key = render_cache.key(HTML)
+    # about:blank に読み込むため、カレントディレクトリのファイルは印刷結果に影響しない
+    (tmp_path / 'a.png').write_bytes(b'red')
+    assert render_cache.key(HTML) == key
+
+
+def test_fetch_restores_printed_pdf(tmp_path, cache):
+    (tmp_path / 'a.png').write_bytes(b'red')
+    first = FakeDriver()
+    assert html_to_pdf(first, HTML, str(tmp_path / 'first.pdf'), source_dir=str(tmp_path))
+
+    second = FakeDriver()
+    output = io.BytesIO()
+    timings = {}
+    assert html_to_pdf(second, HTML, output, source_dir=str(tmp_path), timings=timings)
+    assert (first.prints, second.prints) == (1, 0)
+    assert output.getvalue() == FAKE_PDF
+    assert list(timings) == ['cache']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize('driver_options', [{'ready': False}, {'broken_images': 1}])
+def test_degraded_print_is_not_cached(tmp_path, cache, driver_options):
+    assert html_to_pdf(FakeDriver(**driver_options), HTML, str(tmp_path / 'out.pdf'), source_dir=str(tmp_path))
+    assert (tmp_path / 'out.pdf').read_bytes() == FAKE_PDF
+    assert _entries(cache) == []
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    render_cache = RenderCache(tmp_path / 'cache', max_size_mb=1)
+    data = b'x' * (300 * 1024)
+    for age, key in enumerate(('c' * 64, 'a' * 64, 'b' * 64)):
+        with render_cache.writer(key) as f:
+            f.write(data)
+        os.utime(render_cache._entry_path(key), ns=(age * 10 ** 9, age * 10 ** 9))
+    # 使われたエントリは最後に使われた時刻が更新される
+    assert render_cache.fetch('c' * 64, io.BytesIO())
+
+    with render_cache.writer('d' * 64) as f:
+        f.write(data)
+
+    # 上限の 90% 以下になるまで、最後に使われた時刻が古いものから削除する
+    assert _entries(render_cache) == ['b' * 64 + '.pdf', 'c' * 64 + '.pdf', 'd' * 64 + '.pdf']
+    assert render_cache._total_bytes == 3 * len(data)
+
+
+def test_failed_write_leaves_no_entry(tmp_path):
+    render_cache = RenderCache(tmp_path / 'cache')
+    with pytest.raises(RuntimeError):
+        with render_cache.writer('e' * 64) as f:
+            f.write(b'partial')
+            raise RuntimeError('print failed')
+    assert list((tmp_path / 'cache').rglob('*')) == [tmp_path / 'cache' / 'ee']
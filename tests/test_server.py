@@ -0,0 +1,55 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from core.api import ConversionJob
+from core.server import ConversionServer
+
+from .fakes import FakeDriver
+
+
+@pytest.fixture
+def server(monkeypatch, created):
+    created.upcoming = [FakeDriver(fail=True)]
+    monkeypatch.setattr(ConversionServer, '_warm_presets', lambda self: None)
+    server = ConversionServer(port=0, workers=1)
+    server.created = created
+    yield server
+    server.server_close()
+
+
+def _post(server, payload):
+    request = urllib.request.Request(f'http://127.0.0.1:{server.server_address[1]}/convert',
+                                     data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_failed_browser_is_replaced(server):
+    server.start_workers()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert _post(server, {'markdown': '# one'}) == 500
+        assert _post(server, {'markdown': '# two'}) == 200
+    finally:
+        server.shutdown()
+    assert server.pool.recycled == 1
+    assert [driver.prints for driver in server.created] == [0, 1]
+
+
+def test_canceled_job_is_not_printed(server):
+    job = ConversionJob('# late')
+    server.submit(job)
+    job.cancel()
+    server.start_workers()
+
+    assert job.done.wait(5)
+    assert job.error and not job
+    assert sum(driver.prints for driver in server.created) == 0
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from core.pool import DriverPool
+from core.watch import InotifyWatcher, PollingWatcher, watch
+
+from .fakes import FakeDriver
+
+
+def _watch_once(input_path, output_path, **options):
+    stop_event = threading.Event()
+    stop_event.set()
+    builds = []
+    watch(input_path, output_path, stop_event=stop_event, poll_interval=0.05,
+          on_build=lambda changes, ok, elapsed: builds.append(ok), **options)
+    return builds
+
+
+def _wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def _make_tree(root):
+    """変換対象の a.md と、監視しないディレクトリにある Markdown を作成"""
+    (root / 'a.md').write_text('# A\n', encoding='utf-8')
+    (root / '.gitignore').write_text('build/\n', encoding='utf-8')
+    for skipped in ('.git', 'node_modules', 'build', 'drafts', 'out'):
+        (root / skipped).mkdir()
+        (root / skipped / 'skipped.md').write_text('# Skipped\n', encoding='utf-8')
+
+
+def test_polling_watcher_skips_excluded_directories(tmp_path):
+    _make_tree(tmp_path)
+
+    watcher = PollingWatcher([(tmp_path, True)], exclude=['drafts/'], skip_dirs=[tmp_path / 'out'])
+
+    assert sorted(watcher._snapshot) == [str(tmp_path / 'a.md')]
+
+
+def test_inotify_watcher_skips_excluded_directories(tmp_path):
+    if not InotifyWatcher.available():
+        return
+    _make_tree(tmp_path)
+    (tmp_path / 'docs').mkdir()
+
+    watcher = InotifyWatcher([(tmp_path, True)], exclude=['drafts/'], skip_dirs=[tmp_path / 'out'])
+    try:
+        assert sorted(directory for directory, _ in watcher._watched_dirs) == [tmp_path, tmp_path / 'docs']
+        # 後から作成された除外対象のディレクトリも監視しない
+        (tmp_path / 'docs' / 'node_modules').mkdir()
+        (tmp_path / 'docs' / 'new').mkdir()
+        new = (tmp_path / 'docs' / 'new', True)
+        _wait_until(lambda: watcher.wait(0.1) is not None and new in watcher._watched_dirs)
+        assert (tmp_path / 'docs' / 'node_modules', True) not in watcher._watched_dirs
+    finally:
+        watcher.close()
+
+
+def test_watch_rebuilds_after_a_file_changes(tmp_path, created, monkeypatch):
+    monkeypatch.setattr(InotifyWatcher, 'available', staticmethod(lambda: False))
+    source = tmp_path / 'docs'
+    source.mkdir()
+    _make_tree(source)
+    stop_event = threading.Event()
+    builds = []
+
+    def run():
+        with DriverPool(1) as pool:
+            watch(source, source / 'out', directory=True, pool=pool, exclude=['drafts/'],
+                  debounce=0.1, poll_interval=0.05, stop_event=stop_event,
+                  on_build=lambda changes, ok, elapsed: builds.append((changes, ok)))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    try:
+        _wait_until(lambda: builds)
+        # 監視しないディレクトリの変更では再変換しない
+        for skipped in ('.git', 'node_modules', 'build', 'drafts'):
+            (source / skipped / 'skipped.md').write_text('# Changed\n', encoding='utf-8')
+        (source / 'a.md').write_text('# A changed\n', encoding='utf-8')
+        _wait_until(lambda: len(builds) == 2)
+    finally:
+        stop_event.set()
+        thread.join(10)
+
+    assert builds[0] == (None, True)
+    assert builds[1] == ({source / 'a.md'}, True)
+    assert sum(driver.prints for driver in created) == 2
+    assert not (source / 'out' / 'drafts').exists()
+
+
+def test_directory_watch_renews_pool_drivers(tmp_path, created):
+    source = tmp_path / 'docs'
+    source.mkdir()
+    for name in ('a.md', 'b.md', 'c.md'):
+        (source / name).write_text(f'# {name}\n', encoding='utf-8')
+    external = FakeDriver()
+
+    with DriverPool(1, drivers=[external], recycle_after=1) as pool:
+        # driver を渡してもプールのWebDriverを使い、1件ごとに作り直す
+        builds = _watch_once(source, tmp_path / 'out', driver=external, directory=True, pool=pool, deadline=5)
+
+    assert builds == [True]
+    assert pool.recycled == 3
+    assert external.prints + sum(driver.prints for driver in created) == 3
+    assert all((tmp_path / 'out' / name).exists() for name in ('a.pdf', 'b.pdf', 'c.pdf'))
+
+
+def test_file_watch_applies_deadline_and_retries(tmp_path, created):
+    source = tmp_path / 'doc.md'
+    source.write_text('# Hello\n', encoding='utf-8')
+    hung = FakeDriver(hang=True)
+
+    with DriverPool(1, drivers=[hung]) as pool:
+        builds = _watch_once(source, tmp_path / 'doc.pdf', driver=hung, pool=pool, deadline=0.5, retries=1)
+
+    assert builds == [True]
+    assert pool.recycled == 1
+    assert len(created) == 1 and created[0].prints == 1
+    assert (tmp_path / 'doc.pdf').exists()